@@ -0,0 +1,207 @@
+# Copyright (C) 2021  Alexey Shkarin
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import argparse
+if __name__=="__main__":
+    os.chdir(os.path.abspath(os.path.dirname(sys.argv[0])))
+    sys.path.append(os.path.abspath("."))  # set current folder to the file location and add it to the search path
+    parser=argparse.ArgumentParser(description="Headless frame pipeline throughput benchmark")
+    parser.add_argument("--size",help="comma-separated list of frame sizes given as WIDTHxHEIGHT",default="1024x1024")
+    parser.add_argument("--fps",help="comma-separated list of camera frame rates",default="1000")
+    parser.add_argument("--dtype",help="comma-separated list of frame data types",default="<u2")
+    parser.add_argument("--binning",help="comma-separated list of spatial binning factors",default="1")
+    parser.add_argument("--save",help="comma-separated list of saving formats ('none', 'raw', 'cam', 'tiff', or 'bigtiff')",default="none")
+    parser.add_argument("--filter",help="comma-separated list of filter names ('none' for no filter)",default="none")
+    parser.add_argument("--duration",help="measurement duration for each configuration (in seconds)",type=float,default=10.)
+    parser.add_argument("--warmup",help="warmup time before the measurement (in seconds)",type=float,default=2.)
+    parser.add_argument("--output","-o",help="results file path (JSON lines; new results are appended)",metavar="FILE",default="benchmark.jsonl")
+    parser.add_argument("--config-file","-cf",help="configuration file path supplying generic settings (e.g., saving queue size)",metavar="FILE",default="settings.cfg")
+    parser.add_argument("--run",help=argparse.SUPPRESS)
+    args=parser.parse_args()
+    os.environ.setdefault("QT_QPA_PLATFORM","offscreen")
+
+from pylablib.core.thread import controller
+from pylablib.core.fileio import loadfile
+from pylablib.core.utils import dictionary
+from pylablib.core.gui import QtWidgets
+
+import time
+import json
+import shutil
+import platform
+import datetime
+import tempfile
+import itertools
+import subprocess
+import functools
+
+from utils import version
+from utils import services
+from utils.cameras.sim import BenchmarkSimulatedCameraDescriptor
+
+
+
+class BenchmarkThread(controller.QTaskThread):
+    """
+    Benchmark monitor thread.
+
+    Counts frames passing through the pipeline stages, tracks saving queue usage,
+    measures the pipeline threads CPU time, and stops the application after the measurement is done.
+
+    Setup args:
+        - ``names``: dictionary with the pipeline thread names
+        - ``warmup``: time before the start of the measurement
+        - ``duration``: measurement duration
+        - ``filter_thread``: name of the filter thread, if used
+
+    Variables:
+        - ``result``: measurement result dictionary (``None`` until the measurement is done)
+    """
+    _stages=[("camera","frames/new"),("preprocessor","frames/new"),("slowdown","frames/new"),("processor","frames/new/show")]
+    def setup_task(self, names, warmup=2., duration=10., filter_thread=None):
+        self.names=dict(names)
+        stages=list(self._stages)
+        if filter_thread is not None:
+            self.names["filter"]=filter_thread
+            stages.append(("filter","frames/new/show"))
+        self.ctls={k:controller.sync_controller(n) for k,n in self.names.items()}
+        self.frame_counts={}
+        for stage,tag in stages:
+            self.frame_counts[stage]=0
+            self.subscribe_direct(functools.partial(self._count_frames,stage),srcs=self.names[stage],tags=tag)
+        self.warmup=warmup
+        self.duration=duration
+        self.start_time=time.time()
+        self.start_snapshot=None
+        self.queue_ram_max=0
+        self.v["result"]=None
+        self.add_job("update",self.update,0.05)
+
+    def _count_frames(self, stage, src, tag, msg):  # pylint: disable=unused-argument
+        self.frame_counts[stage]+=msg.nframes()
+    def _get_snapshot(self):
+        saver=self.ctls["saver"]
+        return {"time":time.time(),"frames":dict(self.frame_counts),
+                "cam/acquired":self.ctls["camera"].v["frames/acquired"],"cam/read":self.ctls["camera"].v["frames/read"],
+                "save/saved":saver.v["saved"],"save/missed":saver.v["missed"],"save/received":saver.v["received"],
+                "cpu":{k:ctl.call_in_thread_sync(time.thread_time) for k,ctl in self.ctls.items()},"cpu/process":time.process_time()}
+    def _build_result(self, start, stop):
+        dt=stop["time"]-start["time"]
+        stage_fps={k:(stop["frames"][k]-start["frames"][k])/dt for k in stop["frames"]}
+        cpu={k:(stop["cpu"][k]-start["cpu"][k])/dt for k in stop["cpu"]}
+        acquired=int(stop["cam/acquired"]-start["cam/acquired"])
+        read=int(stop["cam/read"]-start["cam/read"])
+        return {"duration":dt,"acquired_fps":acquired/dt,"sustained_fps":read/dt,"camera_dropped":max(acquired-read,0),
+                "stage_fps":stage_fps,"saved_fps":(stop["save/saved"]-start["save/saved"])/dt,"save_missed":int(stop["save/missed"]-start["save/missed"]),
+                "queue_ram_max":int(self.queue_ram_max),"cpu":cpu,"cpu_process":(stop["cpu/process"]-start["cpu/process"])/dt}
+    def update(self):
+        if self.v["result"] is not None:  # measurement is done, and the other threads might be already stopping
+            return
+        if "filter" in self.ctls:
+            self.ctls["filter"].ca.get_new_data()
+        t=time.time()-self.start_time
+        if t<self.warmup:
+            return
+        if self.start_snapshot is None:
+            self.start_snapshot=self._get_snapshot()
+            return
+        self.queue_ram_max=max(self.queue_ram_max,self.ctls["saver"].v["queue_ram"])
+        if t>=self.warmup+self.duration:
+            self.v["result"]=self._build_result(self.start_snapshot,self._get_snapshot())
+            controller.stop_app()
+
+
+
+def parse_config_list(args):
+    """Turn the command line arguments into the list of benchmark configurations"""
+    sweep={"size":[tuple(int(v) for v in s.split("x")) for s in args.size.split(",")],
+        "fps":[float(v) for v in args.fps.split(",")],
+        "dtype":args.dtype.split(","),
+        "binning":[int(v) for v in args.binning.split(",")],
+        "save":args.save.split(","),
+        "filter":args.filter.split(",")}
+    return [dict(zip(sweep,vals)) for vals in itertools.product(*sweep.values())]
+
+def run_single(config, warmup, duration, config_file=None):
+    """Run a single benchmark configuration and return the result dictionary"""
+    settings=loadfile.load_dict(config_file) if config_file and os.path.exists(config_file) else dictionary.Dictionary()
+    cam_params={"size":tuple(config["size"]),"fps":config["fps"],"dtype":config["dtype"]}
+    cam_desc=BenchmarkSimulatedCameraDescriptor("benchmark",settings=dictionary.Dictionary({"params":cam_params}))
+    names=services.default_thread_names
+    save_path=tempfile.mkdtemp() if config["save"]!="none" else None
+    app=QtWidgets.QApplication([])
+    gui=controller.get_gui_controller()
+    result={}
+    @controller.exsafe
+    def start():
+        services.start_threads(settings,cam_desc)
+        cam_ctl=services.start_camera(cam_desc,version=version)
+        cam_ctl.sync_exec_point("run")
+        if config["binning"]>1:
+            preprocessor=controller.sync_controller(names["preprocessor"])
+            preprocessor.cs.setup_binning((config["binning"],)*2,"mean",1,"skip")
+            preprocessor.cs.enable_binning(True)
+        filter_thread=None
+        if config["filter"]!="none":
+            from plugins.filter import FilterThread, find_filter_class  # pylint: disable=import-outside-toplevel
+            filter_thread="benchmark_filter"
+            fctl=FilterThread(filter_thread,kwargs={"src":names["slowdown"]})
+            fctl.start()
+            fctl.sync_exec_point("run")
+            fctl.cs.set_filter(find_filter_class(config["filter"])())
+            fctl.cs.enable(True)
+        if save_path is not None:
+            saver=controller.sync_controller(names["saver"])
+            saver.cs.save_start(os.path.join(save_path,"frames.bin"),format=config["save"])
+        cam_ctl.ca.acq_start()
+        bench=BenchmarkThread("benchmark",kwargs={"names":names,"warmup":warmup,"duration":duration,"filter_thread":filter_thread})
+        bench.start()
+        result["ctl"]=bench
+    gui.started.connect(start)
+    app.exec_()
+    if save_path is not None:
+        shutil.rmtree(save_path,ignore_errors=True)
+    if "ctl" not in result or result["ctl"].v["result"] is None:
+        return None
+    return dictionary.as_dict(result["ctl"].v["result"],style="nested")
+
+def run_sweep(configs, warmup, duration, output, config_file=None):
+    """Run all benchmark configurations in separate processes and append the results to the `output` file"""
+    info={"version":version,"timestamp":datetime.datetime.now().isoformat(),"platform":platform.platform(),"python":platform.python_version()}
+    for config in configs:
+        cmd=[sys.executable,os.path.abspath(__file__),"--run",json.dumps(config),"--warmup",str(warmup),"--duration",str(duration),"--config-file",config_file]
+        proc=subprocess.run(cmd,stdout=subprocess.PIPE,universal_newlines=True,check=False)
+        lines=[l for l in proc.stdout.splitlines() if l.startswith("result: ")]
+        result=json.loads(lines[-1][len("result: "):]) if lines else None
+        entry=dict(info,config=config,result=result)
+        if result is None:
+            entry["error"]="benchmark process failed with code {}".format(proc.returncode)
+            print("{}: failed".format(config))
+        else:
+            print("{}: {:.0f} FPS sustained, {:d} dropped, {:.0f} FPS saved, {:.1f} MB max queue".format(
+                config,result["sustained_fps"],result["camera_dropped"],result["saved_fps"],result["queue_ram_max"]/2**20))
+        with open(output,"a") as f:
+            f.write(json.dumps(entry)+"\n")
+
+if __name__=="__main__":
+    if args.run:
+        run_result=run_single(json.loads(args.run),args.warmup,args.duration,config_file=args.config_file)
+        print("result: "+json.dumps(run_result))
+        if run_result is None:
+            sys.exit(1)
+    else:
+        run_sweep(parse_config_list(args),args.warmup,args.duration,args.output,config_file=args.config_file)
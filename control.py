@@ -51,12 +51,12 @@ except ImportError:
     win32com_present=False
     
 
-from utils.gui import camera_control, SaveBox_ctl, ProcessingIndicator_ctl, ActivityIndicator_ctl
+from utils.gui import camera_control, SaveBox_ctl, ProcessingIndicator_ctl, ActivityIndicator_ctl, Instrumentation_ctl
 from utils.gui import DisplaySettings_ctl, FramePreprocess_ctl, FrameProcess_ctl, PlotControl_ctl
 from utils.gui import tutorial, color_theme, settings_editor, about, error_message
 from utils import services
 from utils.services import dev as dev_services
-from utils.cameras import camera_descriptors
+from utils.cameras import find_camera_descriptor
 import plugins
 import splash
 
@@ -80,16 +80,17 @@ _defaults_filename="defaults.cfg"
 _locals_filename="locals.cfg"
 _dev_utils_enabled=False
 
-cam_thread="camera"
-process_thread="frame_process"
-preprocess_thread="frame_preprocess"
-slowdown_thread="frame_slowdown"
-channel_accumulator_thread="channel_accumulator"
-save_thread="frame_save"
-snap_save_thread="frame_save_snap"
-settings_manager_thread="settings_manager"
-resource_manager_thread="resource_manager"
-garbage_collector_thread="garbage_collector"
+cam_thread=services.default_thread_names["camera"]
+process_thread=services.default_thread_names["processor"]
+preprocess_thread=services.default_thread_names["preprocessor"]
+slowdown_thread=services.default_thread_names["slowdown"]
+channel_accumulator_thread=services.default_thread_names["channel_accumulator"]
+save_thread=services.default_thread_names["saver"]
+snap_save_thread=services.default_thread_names["snap_saver"]
+settings_manager_thread=services.default_thread_names["settings_manager"]
+resource_manager_thread=services.default_thread_names["resource_manager"]
+garbage_collector_thread=services.default_thread_names["garbage_collector"]
+jit_warmup_thread=services.default_thread_names["jit_warmup"]
 
 
 ### Main window ###
@@ -186,6 +187,9 @@ class StandaloneFrame(container.QWidgetContainer):
         proc_tab.add_padding()
         self.set_column_stretch(0,1)
         self.cam_ctl.set_all_values({"img/normalize":True})
+        self.instrumentation_panel=self.add_child("instrumentation_panel",Instrumentation_ctl.Instrumentation_GUI(self),gui_values_path=False)
+        self.instrumentation_panel.setup(resource_manager_thread=resource_manager_thread)
+        self.instrumentation_panel.setVisible(False)
         self.activity_indicator=self.add_child("activity_indicator",ActivityIndicator_ctl.ActivityIndicator_GUI(self),gui_values_path="activity_indicator")
         self.activity_indicator.setup(resource_manager_thread=resource_manager_thread)
         # add virtual GUI values
@@ -248,8 +252,8 @@ class StandaloneFrame(container.QWidgetContainer):
             self.params_loading_settings.add_combo_box("settings_load_scope",label="Loading scope:",options=["All","Camera","GUI"],index_values=["all","camera","gui"])
             self.params_loading_settings.add_spacer(1,30)
             self.params_loading_settings.add_dropdown_button("extras","Extra...",
-                options=["Tutorial","Create camera shortcut","Preferences","About"],
-                index_values=["tutorial","cam_shortcut","settings_editor","about"])
+                options=["Tutorial","Create camera shortcut","Preferences","Instrumentation","About"],
+                index_values=["tutorial","cam_shortcut","settings_editor","instrumentation","about"])
             pic=QtGui.QPixmap(os.path.join(self.settings["runtime/root_folder"],"resources/cog.png"))
             self.params_loading_settings.w["extras"].setIcon(QtGui.QIcon(pic))
         self.params_loading_settings.vs["load_settings"].connect(self.on_load_settings_button)
@@ -326,6 +330,9 @@ class StandaloneFrame(container.QWidgetContainer):
                 self.show_settings_editor()
             else:
                 self.settings_editor.showNormal()
+        if value=="instrumentation":
+            self.instrumentation_panel.setVisible(not self.instrumentation_panel.isVisible())
+            self.instrumentation_panel.update_stages()
         if value=="about":
             if self.about_window is None:
                 self.show_about_window()
@@ -334,7 +341,8 @@ class StandaloneFrame(container.QWidgetContainer):
 
 
     _ext_controller_names={"camera":cam_thread,"processor":process_thread,"preprocessor":preprocess_thread,"saver":save_thread,"snap_saver":snap_save_thread,
-        "slowdown":slowdown_thread,"channel_accumulator":channel_accumulator_thread,"settings_manager":settings_manager_thread,"resource_manager":resource_manager_thread}
+        "slowdown":slowdown_thread,"channel_accumulator":channel_accumulator_thread,"settings_manager":settings_manager_thread,"resource_manager":resource_manager_thread,
+        "garbage_collector":garbage_collector_thread,"jit_warmup":jit_warmup_thread}
     def _ordered_plugins(self):
         return sorted(self._running_plugins.items(),key=lambda v: v[1].start_order)
     def _sync_plugins(self, exec_point="plugin_setup"):
@@ -671,23 +679,7 @@ def load_config(path):
 
 def start_threads(settings, cam_desc):
     """Start and partially set up auxiliary threads"""
-    cam_class_settings=cam_desc.get_class_settings()
-    services.FrameBinningThread(preprocess_thread,kwargs={"src":cam_thread,"tag_in":"frames/new"}).start()
-    services.FrameSlowdownThread(slowdown_thread,kwargs={"src":preprocess_thread,"tag_in":"frames/new"}).start()
-    services.FrameProcessorThread(process_thread,kwargs={"src":slowdown_thread,"tag_in":"frames/new"}).start()
-    services.ChannelAccumulator(channel_accumulator_thread,kwargs={"settings":settings.get("interface/trace_plotter")}).start()
-    services.FrameSaveThread(save_thread,kwargs={"src":preprocess_thread,"tag":"frames/new",
-        "settings_mgr":settings_manager_thread,"frame_processor":process_thread,"garbage_collector":garbage_collector_thread}).start()
-    services.FrameSaveThread(snap_save_thread,kwargs={"src":"any","tag":"frames/new/snap","settings_mgr":settings_manager_thread}).start()
-    services.SettingsManager(settings_manager_thread).start()
-    services.ResourceManager(resource_manager_thread).start()
-    allow_garbage_collection=cam_class_settings.get("allow_garbage_collection",True)
-    services.GarbageCollector(garbage_collector_thread,kwargs={"disabled":not allow_garbage_collection}).start()
-    channel_accum=controller.sync_controller(channel_accumulator_thread)
-    channel_accum.cs.add_source("raw",src=preprocess_thread,tag="frames/new",sync=True,kind="raw")
-    channel_accum.cs.add_source("show",src=process_thread,tag="frames/new/show",sync=True,kind="show")
-    image_saver=controller.sync_controller(save_thread)
-    image_saver.ca.setup_queue_ram(settings.get("saving/max_queue_ram",4*2**30))
+    services.start_threads(settings,cam_desc)
 
 _displayed_forms=[]  # against garbage collection
 @controller.exsafe
@@ -729,22 +721,11 @@ def start_app(ask_on_no_cam=True):
             settings.update(settings["css",cam_name])
         app.setStyleSheet(color_theme.load_style(settings.get("interface/color_theme","dark")))
 
-        cam_desc_class=camera_descriptors[settings["cameras",cam_name,"kind"]]
+        cam_desc_class=find_camera_descriptor(settings["cameras",cam_name,"kind"])
         cam_desc=cam_desc_class(cam_name,settings=settings["cameras",cam_name])
         start_threads(settings,cam_desc)
-        cam_ctl=cam_desc.make_thread(cam_thread)
-        cam_ctl.start()
+        services.start_camera(cam_desc,version=version)
         main_form.setup(settings=settings,cam_name=cam_name,cam_desc=cam_desc)
-        settings_ctl=controller.sync_controller(settings_manager_thread)
-        settings_ctl.ca.update_settings("software/version",version)
-        settings_ctl.ca.add_source("cam",cam_ctl.cs.get_full_info)
-        settings_ctl.ca.add_source("cam/settings",cam_ctl.cs.get_settings)
-        def get_cam_counters():
-            counters=cam_ctl.v["frames"]
-            if "last_frame" in counters:
-                del counters["last_frame"]
-            return counters
-        settings_ctl.ca.add_source("cam/cnt",get_cam_counters)
         main_form.start()
         main_form.show()
         splash.update_splash_screen(False)
@@ -24,6 +24,8 @@ if __name__=="__main__":
     parser.add_argument("--yes","-y",help="automatically confirm settings file overwrite",action="store_true")
     parser.add_argument("--show-errors",help="show errors raised on camera detection",action="store_true")
     parser.add_argument("--wait",help="show waiting message for 3 seconds in the end",action="store_true")
+    parser.add_argument("--timeout",help="maximal detection time for each camera backend (in seconds)",type=float,default=60.)
+    parser.add_argument("--sequential",help="detect camera backends one after another instead of simultaneously",action="store_true")
     parser.add_argument("--config-file","-cf", help="configuration file path",metavar="FILE",default="settings.cfg")
     args=parser.parse_args()
     if not args.silent:
@@ -53,11 +55,84 @@ sys.stderr=StreamLogger("logerr.txt",sys.stderr)
 sys.stdout=StreamLogger("logout.txt",sys.stdout)
 
 
-def detect_all(verbose=False):
+class ThreadOutputBuffer:
+    """
+    Stream wrapper which stores the output written from the registered threads, and passes the rest to the wrapped stream.
+
+    Used to keep the output of the simultaneous detection threads from interleaving.
+    """
+    def __init__(self, stream):
+        self.stream=stream
+        self.buffers={}
+    def register(self):
+        """Start buffering the output of the current thread"""
+        self.buffers[threading.get_ident()]=[]
+    def pop(self, ident):
+        """Remove the thread with the given ident and return its buffered output"""
+        return "".join(self.buffers.pop(ident,[]))
+    def write(self, s):
+        buffer=self.buffers.get(threading.get_ident())
+        if buffer is None:
+            return self.stream.write(s)
+        buffer.append(s)
+        return len(s)
+    def flush(self):
+        self.stream.flush()
+    def __getattr__(self, name):
+        return getattr(self.stream,name)
+
+def _detect_backend(desc, verbose, result):
+    for s in [sys.stdout,sys.stderr]:
+        s.register()
+    result["ident"]=threading.get_ident()
+    t=time.time()
+    try:
+        result["cams"]=desc.detect(verbose=verbose,camera_descriptors=list(camera_descriptors.values())) or {}
+    except Exception:  # pylint: disable=broad-except
+        if verbose: print("Error detecting {} cameras\n".format(desc._cam_kind))
+        if verbose=="full": desc.print_error()
+    result["time"]=time.time()-t
+def detect_all(verbose=False, timeout=60., sequential=False):
+    """
+    Detect all connected cameras.
+
+    Each camera backend is detected in a separate daemon thread, so that a slow or hanging backend does not stall the rest.
+    If `timeout` is not ``None``, it specifies the maximal detection time for each backend (counted from the start of the detection);
+    the backends which did not finish by then are skipped.
+    If ``sequential==True``, detect the backends one after another (still with the timeout).
+    The results and the output are merged in the same order as for the sequential detection, and the detection time for each backend is reported if `verbose` is ``True``.
+    """
     cams=dictionary.Dictionary()
     root_descriptors=[d for d in camera_descriptors.values() if d._expands is None]
-    for c in root_descriptors:
-        cams.update(c.detect(verbose=verbose,camera_descriptors=list(camera_descriptors.values())) or {})
+    results=[{} for _ in root_descriptors]
+    threads=[threading.Thread(target=_detect_backend,args=(d,verbose,r),daemon=True) for d,r in zip(root_descriptors,results)]
+    stdout,stderr=sys.stdout,sys.stderr
+    sys.stdout,sys.stderr=ThreadOutputBuffer(stdout),ThreadOutputBuffer(stderr)
+    try:
+        start=time.time()
+        if not sequential:
+            for th in threads:
+                th.start()
+        for d,th,r in zip(root_descriptors,threads,results):
+            if sequential:
+                start=time.time()
+                th.start()
+            th.join(None if timeout is None else max(start+timeout-time.time(),0))
+            if "ident" in r:
+                stdout.write(sys.stdout.pop(r["ident"]))
+                stderr.write(sys.stderr.pop(r["ident"]))
+            if th.is_alive():
+                r["timed_out"]=True
+                if verbose: print("Timed out detecting {} cameras after {:.0f} s; skipping\n".format(d._cam_kind,timeout))
+            else:
+                cams.update(r.get("cams",{}))
+    finally:
+        sys.stdout,sys.stderr=stdout,stderr
+    if verbose:
+        print("Detection time:")
+        for d,r in zip(root_descriptors,results):
+            print("\t{}: {}".format(d._cam_kind,"timed out" if r.get("timed_out") else "{:.2f} s".format(r["time"])))
+        print("")
     if cams:
         for c in cams:
             if "display_name" not in cams[c]:
@@ -65,8 +140,8 @@ def detect_all(verbose=False):
     return dictionary.Dictionary({"cameras":cams})
 
 
-def update_settings_file(cfg_path="settings.cfg", verbose=False, confirm=False, wait=False):
-    settings=detect_all(verbose=verbose)
+def update_settings_file(cfg_path="settings.cfg", verbose=False, confirm=False, wait=False, timeout=60., sequential=False):
+    settings=detect_all(verbose=verbose,timeout=timeout,sequential=sequential)
     if not settings:
         if verbose: print("Couldn't detect any supported cameras")
     else:
@@ -101,4 +176,5 @@ if __name__=="__main__":
         verbose=False
     else:
         verbose="full" if args.show_errors else True
-    update_settings_file(cfg_path=args.config_file,verbose=verbose,confirm=not (args.silent or args.yes),wait=args.wait)
\ No newline at end of file
+    update_settings_file(cfg_path=args.config_file,verbose=verbose,confirm=not (args.silent or args.yes),wait=args.wait,
+        timeout=args.timeout,sequential=args.sequential)
\ No newline at end of file
@@ -0,0 +1,579 @@
+# Copyright (C) 2021  Alexey Shkarin
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import argparse
+if __name__=="__main__":
+    startdir=os.path.abspath(os.getcwd())
+    os.chdir(os.path.abspath(os.path.dirname(sys.argv[0])))
+    sys.path.append(os.path.abspath("."))  # set current folder to the file location and add it to the search path
+    parser=argparse.ArgumentParser(description="Pylablib cam-control headless acquisition (no GUI; controlled through the settings file and the server plugin)")
+    parser.add_argument("--camera","-c", help="controlled camera name (several comma-separated names run synchronized cameras in the same process)",metavar="CAM_NAME")
+    parser.add_argument("--config-file","-cf", help="configuration file path",metavar="FILE",default="settings.cfg")
+    parser.add_argument("--no-acquire", help="do not start the acquisition after connecting to the camera",action="store_true")
+    argvp=parser.parse_args()
+    os.environ.setdefault("QT_QPA_PLATFORM","offscreen")
+
+from pylablib.core.thread import controller
+from pylablib.core.fileio import loadfile
+from pylablib.core.utils import dictionary, files as file_utils
+from pylablib.thread.stream.stream_message import FramesMessage
+from pylablib.core.gui import QtCore, QtGui
+import pylablib
+
+import signal
+import collections
+import time
+
+from utils import version
+from utils import services
+from utils.services import saving
+from utils.cameras import find_camera_descriptor
+import plugins
+
+
+
+_defaults_filename="defaults.cfg"
+
+class HeadlessFrame:
+    """
+    Headless counterpart of the main window.
+
+    Runs the acquisition pipeline without any widgets: applies the camera and binning parameters from the settings file,
+    provides the saving control methods (e.g., ``toggle_saving``) to the plugins, and runs the plugins which support the headless mode.
+    Stands in for the main window as the plugins ``main_frame``, so the values available through :meth:`get_value` and :meth:`set_value`
+    (e.g., via the server ``gui/get/value`` and ``gui/set/value`` requests) use the same names as the corresponding GUI values:
+    the saving controls are under ``cam/save`` and the binning controls are under ``preproc``.
+    Their initial values are taken from the defaults file saved by the GUI, and are then updated from ``headless/values`` in the settings file.
+
+    If several cameras run in the same process, each has its own frame with its own thread `names` and settings manager `scope`,
+    and the saving and acquisition control is passed to the common :class:`HeadlessGroup`.
+    """
+    headless=True
+    _default_values={"cam/save":saving.default_saving_values,
+        "preproc":{"spat_bin_mode":"mean","spat_bin_x":1,"spat_bin_y":1,"time_bin_mode":"mean","time_bin":1,"convert_to_float":False,"bin_enabled":False}}
+    def setup(self, settings, cam_name, cam_desc, names=None, acquire=True, scope=None, group=None, port_offset=0):
+        self.settings=settings
+        self.cam_name=cam_name
+        self.cam_desc=cam_desc
+        self.names=names or services.default_thread_names
+        self.acquire=acquire
+        self.scope=scope
+        self.group=group
+        self.port_offset=port_offset
+        self.ctl=controller.get_gui_controller()
+        self.dev=controller.sync_controller(self.names["camera"])
+        self.saver=controller.sync_controller(self.names["saver"],"run")
+        self.snap_saver=controller.sync_controller(self.names["snap_saver"],"start")
+        self.preprocessor=controller.sync_controller(self.names["preprocessor"])
+        self.values=dictionary.Dictionary()
+        for k,v in self._default_values.items():
+            self.values[k]=dict(v)
+        if settings.get("headless/load_defaults",True):
+            self.load_settings()
+        self.values.update(settings.get("headless/values",{}))
+        self._running=False
+        self._running_plugins={}
+        self._plugin_classes={p.get_class_name():p for p in plugins.find_plugins("plugins",root=settings["runtime/root_folder"])}
+        self._plugin_parameters=dictionary.Dictionary()
+        # Setup settings manager
+        settings_ctl=controller.sync_controller(self.names["settings_manager"])
+        settings_ctl.ca.add_source("gui",controller.call_in_gui_thread(lambda: self.get_all_values(full_status=True)),scope=scope)
+        settings_ctl.ca.update_settings("cfg",settings.copy(),scope=scope)
+        # Setup thread methods and signals
+        self.ctl.finished.connect(self.stop)
+        if group is None:
+            self.ctl.add_thread_method("get_all_values",self.get_all_values)
+            self.ctl.add_thread_method("set_all_values",self.set_all_values)
+            self.ctl.add_thread_method("toggle_saving",self.toggle_saving)
+            self.ctl.add_thread_method("get_saving_parameters",self.collect_saving_parameters)
+            self.ctl.add_thread_method("saving_in_progress",self.saving_in_progress)
+            self.ctl.add_thread_method("acq_start",self.dev.ca.acq_start)
+            self.ctl.add_thread_method("acq_stop",self.dev.ca.acq_stop)
+            self.ctl.add_thread_method("clear_pretrigger",self.saver.ca.clear_pretrigger)
+        self.ctl.subscribe_sync(lambda src,tag,value: self.recv_status_update(value),self.names["camera"],tags="status/connection")
+        self.connected=False
+        self.load_config_plugins()
+
+    def load_settings(self, path=None):
+        """Load saving and binning values from the defaults file saved by the GUI"""
+        if path is None:
+            path=_defaults_filename
+        if os.path.exists(path):
+            defaults=loadfile.load_dict(path)
+            if self.cam_name in defaults:
+                for k in self._default_values:
+                    if (self.cam_name,k) in defaults:
+                        self.values[k].update(defaults[self.cam_name,k])
+    def get_value(self, name):
+        """Get value with the given name (raise :exc:`KeyError` if it is missing)"""
+        return self.values[name]
+    def set_value(self, name, value):
+        """Set value with the given name (raise :exc:`KeyError` if it is missing) and apply the changes"""
+        if name not in self.values:
+            raise KeyError("value {} does not exist".format(name))
+        self.values[name]=value
+        if dictionary.normalize_path(name)[0]=="preproc":
+            self.setup_binning()
+        else:
+            self.setup_pretrigger()
+            self.setup_stream_mode()
+        return self.values[name]
+    def get_indicator(self, name):
+        """Get indicator with the given name (raise :exc:`KeyError` if it is missing)"""
+        return self.get_all_indicators()[name]
+    def set_indicator(self, name, value):  # pylint: disable=unused-argument
+        """Set indicator with the given name; not supported, since there are no widgets to show it"""
+        raise KeyError("indicator {} can not be set in the headless mode".format(name))
+    def get_all_values(self, full_status=False):
+        """
+        Get all values.
+
+        If ``full_status==True``, also include the indicator values.
+        """
+        values=self.values.copy()
+        self._update_plugin_parameters()
+        values.add_entry("plugins",self._plugin_parameters,force=True)
+        if full_status:
+            values["indicators"]=self.get_all_indicators()
+        return values
+    def set_all_values(self, values):
+        """Set all values and apply the changes"""
+        values=dictionary.Dictionary(values)
+        if "plugins" in values:
+            self._plugin_parameters=values.detach("plugins")
+            self._apply_plugin_parameters()
+        for k in self._default_values:
+            if k in values:
+                self.values[k].update(values[k])
+        self.setup_binning()
+        self.setup_pretrigger()
+        self.setup_stream_mode()
+    def get_all_indicators(self):
+        """Get the camera and saving status indicators"""
+        indicators=dictionary.Dictionary()
+        for s in ["status/connection","status/acquisition","frames/read","frames/acquired","frames/buffer_filled","frames/fps"]:
+            indicators["cam/camstat",s]=self.dev.v[s]
+        indicators["cam/savestat/status/saving"]=self.saver.get_variable("status/saving","stopped")
+        for n in ["saved","missed","received","scheduled","queue_ram","max_queue_ram"]:
+            indicators["cam/savestat/frames",n]=self.saver.get_variable(n,0)
+        return indicators
+
+    def recv_status_update(self, status):
+        """Receive camera connection status update; apply camera parameters and start the acquisition on connection"""
+        connected=status=="opened"
+        just_connected=connected and not self.connected
+        self.connected=connected
+        if just_connected and self._running:
+            self.send_parameters()
+            if self.group is not None:
+                self.group.recv_connected(self)
+            elif self.acquire:
+                self.dev.ca.acq_start()
+    def send_parameters(self):
+        """Send camera parameters from ``headless/camera`` settings entry to the camera"""
+        params=dictionary.Dictionary(self.settings.get("headless/camera",{})).copy()
+        params["tag/initialized"]=True
+        self.dev.ca.apply_parameters(params)
+    def setup_binning(self):
+        """Setup binning according to the ``preproc`` values"""
+        v=self.values["preproc"]
+        self.preprocessor.ca.setup_binning((v["spat_bin_x"],v["spat_bin_y"]),v["spat_bin_mode"],v["time_bin"],v["time_bin_mode"],dtype="float" if v["convert_to_float"] else None)
+        self.preprocessor.ca.enable_binning(v["bin_enabled"])
+    def collect_saving_parameters(self, mode="full", resolve_path=True):
+        """Get saving parameters dictionary from the ``cam/save`` values"""
+        params=saving.build_saving_parameters(self.values["cam/save"],mode=mode,resolve_path=resolve_path,settings=self.settings)
+        if resolve_path and not file_utils.is_path_valid(params["path"]):
+            print("Invalid saving path: {}".format(params["path"]),file=sys.stderr)
+            params["path"]=None
+        return params
+    def setup_pretrigger(self):
+        """Setup pretrigger according to the saving values"""
+        params=self.collect_saving_parameters(resolve_path=False)
+        self.saver.ca.setup_pretrigger(params["pretrigger_size"],params["pretrigger_enabled"])
+    def setup_stream_mode(self):
+        """Setup streaming mode according to the saving values"""
+        params=self.collect_saving_parameters(resolve_path=False)
+        self.saver.ca.setup_streaming(single_shot=params["stream_mode"]=="single_shot")
+    def toggle_saving(self, mode, start=True, source=None, change_params=None, no_popup=False, trigger_frame_index=None, extra_settings=None, sync_info=False):  # pylint: disable=unused-argument
+        """
+        Turn saving on/off.
+
+        Same as the main window camera controller method:
+        `mode` is the saving mode: either ``"full"`` (full stream saving), or ``"snap"`` (snapshot saving).
+        If `change_params` is defined, it is a dictionary which overrides some of the saving parameters.
+        If `trigger_frame_index` is defined, it is the index of the frame which triggered the full saving.
+        `extra_settings` and `sync_info` are passed to the saver ``save_start`` command (only for the full saving).
+        """
+        if start:
+            params=dict(self.settings.get("saving/defaults",{}))
+            params.update(self.collect_saving_parameters(mode=mode))
+            if params["path"] is None:
+                return
+            params.update(change_params or {})
+        if mode=="full":
+            if start:
+                self.saver.csi.save_start(params["path"],path_kind=params["path_kind"],batch_size=params["batch_size"],
+                    append=params["append"],format=params["format"],filesplit=params["filesplit"],
+                    save_settings=params["save_settings"],perform_status_check=self.settings.get("headless/perform_status_check",False),
+                    extra_settings=extra_settings,trigger_frame_index=trigger_frame_index,sync_info=sync_info)
+            else:
+                self.saver.ca.save_stop()
+        else:
+            if start:
+                self.snap_saver.csi.save_start(params["path"],path_kind=params["path_kind"],batch_size=1,append=False,
+                    format=params["format"],save_settings=params["save_settings"])
+                self.send_snap_frame(source=source or params["snap_display_source"])
+            else:
+                self.snap_saver.ca.save_stop()
+    def send_snap_frame(self, source=None):
+        """Send a multicast with the source frame to the snap saver"""
+        resource_manager=controller.sync_controller(self.names["resource_manager"])
+        frame=resource_manager.cs.get_resource("frame/display",source,default={}).get("frame",None) if source is not None else None
+        if frame is None:
+            frame=self.dev.v["frames/last_frame"]
+        if frame is not None:
+            self.ctl.send_multicast(self.names["snap_saver"],tag="frames/new/snap",value=FramesMessage([frame],chandim=frame.ndim-2))
+    def saving_in_progress(self):
+        """Check if saving is in progress"""
+        status=self.saver.v["status/saving"]
+        if status in {"in_progress","stopping"}:
+            return status
+        return False
+
+    def _ordered_plugins(self):
+        return sorted(self._running_plugins.items(),key=lambda v: v[1].start_order)
+    def _sync_plugins(self, exec_point="plugin_setup"):
+        for plugin in list(self._running_plugins.values()):
+            plugin.ctl.sync_exec_point(exec_point)
+    def load_config_plugins(self):
+        """Load all plugins described in the configuration file which support the headless mode (the rest are skipped)"""
+        plugins_list=[]
+        if "plugins" in self.settings:
+            for p in sorted(self.settings["plugins"]):
+                if "class" in self.settings["plugins",p]:
+                    class_name=self.settings["plugins",p,"class"]
+                    name=self.settings.get(("plugins",p,"name"),p)
+                    parameters=self.settings.get(("plugins",p,"parameters"),None)
+                    plugin_class=self._plugin_classes[class_name]
+                    if not plugin_class._headless_support:
+                        print("Skipping plugin {}.{}, since it does not support the headless mode".format(class_name,name),file=sys.stderr)
+                        continue
+                    start_order=self.settings.get(("plugins",p,"start_order"),plugin_class._default_start_order)
+                    parameters=self._offset_plugin_port(p,plugin_class,parameters)
+                    plugins_list.append((plugin_class,name,parameters,start_order))
+        plugins_list.sort(key=lambda v: v[-1])
+        last_order=None
+        for plugin_class,name,parameters,start_order in plugins_list:
+            if last_order is not None and start_order!=last_order:
+                self._sync_plugins()
+            self.load_plugin(plugin_class,name=name,parameters=parameters,start_order=start_order)
+            last_order=start_order
+    def _offset_plugin_port(self, plugin, plugin_class, parameters):
+        """
+        Add the camera port offset to the port of the plugin which listens on a network port.
+
+        Applies only to the plugins configured in the common ``plugins`` branch; the port set in the camera-specific ``css`` branch is used as is.
+        """
+        if not self.port_offset or plugin_class._default_port is None or ("css",self.cam_name,"plugins",plugin,"parameters","port") in self.settings:
+            return parameters
+        parameters=dictionary.Dictionary(parameters or {})
+        port=parameters.get("port",plugin_class._default_port)
+        if port:
+            parameters["port"]=port+self.port_offset
+        return parameters
+    PluginInfo=collections.namedtuple("PluginInfo",("ctl","start_order"))
+    @controller.call_in_gui_thread
+    def load_plugin(self, plugin_class, name="__default__", parameters=None, start_order=0):
+        """
+        Start plugin thread.
+
+        Args:
+            plugin_class: class of the plugin (subclass of :cls:`.IPlugin`)
+            name: plugin name (for the cases of several plugins of the same class)
+            parameters: additional plugin parameters
+        """
+        full_name=plugin_class.get_class_name(),name
+        if full_name in self._running_plugins:
+            raise RuntimeError("plugin {}.{} is already running".format(*full_name))
+        thread_name="plugin.{}.{}".format(*full_name) if self.scope is None else "{}.plugin.{}.{}".format(self.scope,*full_name)
+        plugin_ctl=plugins.PluginThreadController(thread_name,kwargs={"name":name,"main_frame":self,
+            "plugin_cls":plugin_class,"ext_controller_names":dict(self.names),"parameters":parameters})
+        self._running_plugins[full_name]=self.PluginInfo(plugin_ctl,start_order)
+        plugin_ctl.start()
+    @controller.call_in_gui_thread
+    def initialize_plugin(self, plugin):
+        """
+        Initialize plugin.
+
+        Called automatically by the plugin thread after plugin has been set up.
+        """
+        full_name=plugin.get_class_name(),plugin.get_instance_name()
+        if full_name in self._plugin_parameters:
+            plugin.set_all_values(self._plugin_parameters[full_name])
+        plugin.start_gui()
+    @controller.call_in_gui_thread
+    def finalize_plugin(self, plugin):
+        """
+        Finalize plugin.
+
+        Called automatically by the plugin thread after plugin has been stopped and cleaned up.
+        """
+        full_name=plugin.get_class_name(),plugin.get_instance_name()
+        values=plugin.get_all_values()
+        if full_name in self._plugin_parameters:
+            del self._plugin_parameters[full_name]
+        self._plugin_parameters[full_name]=values
+        del self._running_plugins[full_name]
+    def _update_plugin_parameters(self):
+        for name,plugin in self._ordered_plugins():
+            if plugin.ctl.is_plugin_running():
+                self._plugin_parameters.add_entry(name,plugin.ctl.get_all_values(),force=True)
+    def _apply_plugin_parameters(self):
+        for name,plugin in self._ordered_plugins():
+            if plugin.ctl.is_plugin_running() and name in self._plugin_parameters:
+                plugin.ctl.set_all_values(self._plugin_parameters[name])
+
+    def start(self):
+        """Apply the initial parameters and start the acquisition (if the camera is already connected)"""
+        self._sync_plugins()
+        self.setup_binning()
+        self.setup_pretrigger()
+        self.setup_stream_mode()
+        self._running=True
+        self.connected=False
+        self.recv_status_update(self.dev.v["status/connection"])
+    def stop(self):
+        """Stop saving and acquisition, and close all the plugins"""
+        if self._running:
+            self._running=False
+            self.saver.ca.save_stop()
+            self.dev.ca.acq_stop()
+        for plugin in list(self._running_plugins.values()):
+            plugin.ctl.stop(sync=True)
+
+
+
+class HeadlessGroup:
+    """
+    Synchronized control of several headless camera frames running in the same process.
+
+    Starts the acquisition of all cameras together once all of them are connected, and starts and stops the saving of all cameras at the same time.
+    The frame info saved for each camera then includes the camera frame index and the frame timestamp (see :meth:`.FrameSaveThread.save_start`),
+    which are used to correlate the frames between the cameras, and the saved settings contain the group info in the ``group`` branch.
+    Stands in for the single frame in the GUI controller thread methods, so that, e.g., the server ``save/start`` request controls all cameras at once.
+    """
+    def setup(self, settings, frames, acquire=True):
+        self.settings=settings
+        self.frames=collections.OrderedDict((f.cam_name,f) for f in frames)
+        self.acquire=acquire
+        self.ctl=controller.get_gui_controller()
+        self.settings_ctl=controller.sync_controller(frames[0].names["settings_manager"])
+        self.group_info=dictionary.Dictionary({"cameras":list(self.frames),"acq_start_timestamp":None,"save_start_timestamp":None})
+        self.settings_ctl.ca.update_settings("group",self.group_info.copy())
+        self.ctl.add_thread_method("get_all_values",self.get_all_values)
+        self.ctl.add_thread_method("set_all_values",self.set_all_values)
+        self.ctl.add_thread_method("toggle_saving",self.toggle_saving)
+        self.ctl.add_thread_method("get_saving_parameters",self.collect_saving_parameters)
+        self.ctl.add_thread_method("saving_in_progress",self.saving_in_progress)
+        self.ctl.add_thread_method("acq_start",self.acq_start)
+        self.ctl.add_thread_method("acq_stop",self.acq_stop)
+        self.ctl.add_thread_method("clear_pretrigger",self.clear_pretrigger)
+
+    def _update_group_info(self, name, value):
+        self.group_info[name]=value
+        self.settings_ctl.ca.update_settings("group",self.group_info.copy())
+    def recv_connected(self, frame):  # pylint: disable=unused-argument
+        """Receive notification about the frame camera connection; start the acquisition if all cameras are connected"""
+        if self.acquire and all(f.connected for f in self.frames.values()):
+            self.acq_start()
+    def acq_start(self):
+        """Start the acquisition of all cameras"""
+        self._update_group_info("acq_start_timestamp",time.time())
+        for f in self.frames.values():
+            f.dev.ca.acq_start()
+    def acq_stop(self):
+        """Stop the acquisition of all cameras"""
+        for f in self.frames.values():
+            f.dev.ca.acq_stop()
+    def clear_pretrigger(self):
+        """Clear the pretrigger buffers of all cameras"""
+        for f in self.frames.values():
+            f.saver.ca.clear_pretrigger()
+    def get_all_values(self, full_status=False):
+        """Get all values of all frames as a dictionary ``{cam_name: values}``"""
+        return dictionary.Dictionary({n:f.get_all_values(full_status=full_status) for n,f in self.frames.items()})
+    def set_all_values(self, values):
+        """Set all values of the frames from a dictionary ``{cam_name: values}``"""
+        for n,v in dictionary.Dictionary(values).items():
+            self.frames[n].set_all_values(v)
+    def collect_saving_parameters(self, mode="full", resolve_path=True):
+        """
+        Get saving parameters of all frames as a dictionary ``{cam_name: params}``.
+
+        If several cameras have the same saving path, the camera name is added to it.
+        """
+        params={n:f.collect_saving_parameters(mode=mode,resolve_path=resolve_path) for n,f in self.frames.items()}
+        if resolve_path:
+            paths=[p["path"] for p in params.values()]
+            for n,p in params.items():
+                if p["path"] is not None and paths.count(p["path"])>1:
+                    p["path"]=self._get_camera_path(p["path"],n)
+        return params
+    def _get_camera_path(self, path, cam_name):
+        """Add the camera name to the saving path"""
+        path,ext=os.path.splitext(path)
+        return "{}_{}{}".format(path,cam_name,ext)
+    def toggle_saving(self, mode, start=True, source=None, change_params=None, no_popup=False, trigger_frame_index=None):
+        """
+        Turn saving on/off for all cameras.
+
+        The arguments are the same as for :meth:`HeadlessFrame.toggle_saving`.
+        `trigger_frame_index` refers to the camera which triggered the saving, so it is only stored in the group info (``group/trigger_frame_index``).
+        """
+        if start:
+            params=self.collect_saving_parameters(mode=mode)
+            if any(p["path"] is None for p in params.values()):
+                return
+            if mode=="full":
+                self.group_info["trigger_frame_index"]=trigger_frame_index
+                self._update_group_info("save_start_timestamp",time.time())
+            for n,f in self.frames.items():
+                frame_params=dict(change_params or {})
+                if frame_params.get("path") is None:
+                    frame_params["path"]=params[n]["path"]
+                else:  # explicitly specified path is the same for all cameras
+                    frame_params["path"]=self._get_camera_path(frame_params["path"],n)
+                f.toggle_saving(mode,start=True,source=source,change_params=frame_params,no_popup=no_popup,sync_info=(mode=="full"))
+        else:
+            for f in self.frames.values():
+                f.toggle_saving(mode,start=False)
+    def saving_in_progress(self):
+        """Check if saving is in progress for any of the cameras"""
+        status=[f.saving_in_progress() for f in self.frames.values()]
+        for s in ["in_progress","stopping"]:
+            if s in status:
+                return s
+        return False
+
+
+def load_config(path):
+    """Load settings config file and add real-time data"""
+    if os.path.exists(path):
+        settings=loadfile.load_dict(path)
+        if "dlls" in settings:
+            for k,v in settings["dlls"].items():
+                pylablib.par["devices/dlls",k]=v
+    else:
+        settings=dictionary.Dictionary()
+    settings["runtime/root_folder"]=os.path.abspath(".")
+    settings["runtime/settings_src"]=os.path.abspath(path)
+    return settings
+
+def select_camera(settings, camera=None):
+    """Select the camera name from the command line argument, the settings file, or the only defined camera"""
+    cams=settings.get("cameras",{})
+    select_cameras=[camera,settings.get("select_camera",None)]
+    if len(cams)==1:
+        select_cameras.append(list(cams)[0])
+    for c in select_cameras:
+        if c is not None and c in cams:
+            return c
+    if not cams:
+        raise ValueError("no cameras are defined in the settings file")
+    raise ValueError("camera is not selected; available cameras: {}".format(", ".join(cams)))
+
+def select_cameras(settings, cameras=None):
+    """
+    Select the list of camera names.
+
+    The names are taken from the command line argument (comma-separated names) or the ``headless/cameras`` settings entry;
+    if only one or no camera is specified this way, it is selected using :func:`select_camera`.
+    """
+    if cameras is None:
+        cameras=settings.get("headless/cameras",None)
+    if isinstance(cameras,str):
+        cameras=[c.strip() for c in cameras.split(",") if c.strip()]
+    cameras=list(cameras or [])
+    if len(cameras)<=1:
+        return [select_camera(settings,cameras[0] if cameras else None)]
+    cams=settings.get("cameras",{})
+    missing=[c for c in cameras if c not in cams]
+    if missing:
+        raise ValueError("cameras {} are not defined in the settings file; available cameras: {}".format(", ".join(missing),", ".join(cams)))
+    if len(set(cameras))<len(cameras):
+        raise ValueError("repeating cameras: {}".format(", ".join(cameras)))
+    return cameras
+
+def get_camera_settings(settings, cam_name):
+    """Get the settings of the given camera (with the camera-specific ``css`` entries applied)"""
+    settings=settings.copy()
+    settings["select_camera"]=cam_name
+    if ("css",cam_name) in settings:
+        settings.update(settings["css",cam_name])
+    return settings
+
+_main_frame=[]  # against garbage collection
+@controller.exsafe
+def start_app(config_file="settings.cfg", camera=None, acquire=True):
+    """
+    Start the headless application: determine the cameras, start the threads, and set up the headless frames.
+
+    If several cameras are selected, each camera gets its own pipeline with the threads names prefixed by the camera name
+    (while the settings manager, resource manager, garbage collector and JIT warmup threads are shared),
+    and the cameras are controlled together through a :class:`HeadlessGroup`.
+    """
+    settings=load_config(config_file)
+    cam_names=select_cameras(settings,camera)
+    multicam=len(cam_names)>1
+    cam_settings=[get_camera_settings(settings,c) for c in cam_names]
+    cam_descs=[find_camera_descriptor(s["cameras",c,"kind"])(c,settings=s["cameras",c]) for c,s in zip(cam_names,cam_settings)]
+    scopes=cam_names if multicam else [None]
+    names=[services.get_thread_names(s) for s in scopes]
+    services.start_shared_threads(settings if multicam else cam_settings[0],cam_descs,names)
+    for s,d,n,sc in zip(cam_settings,cam_descs,names,scopes):
+        services.start_camera_threads(s,n,scope=sc)
+        services.start_camera(d,n,version=version,scope=sc)
+    group=HeadlessGroup() if multicam else None
+    frames=[]
+    for i,(c,s,d,n,sc) in enumerate(zip(cam_names,cam_settings,cam_descs,names,scopes)):
+        frame=HeadlessFrame()
+        frame.setup(settings=s,cam_name=c,cam_desc=d,names=n,acquire=acquire,scope=sc,group=group,port_offset=i)
+        frames.append(frame)
+    if group is not None:
+        group.setup(settings,frames,acquire=acquire)
+        _main_frame.append(group)
+    for frame in frames:
+        frame.start()
+        _main_frame.append(frame)
+    print("Started headless acquisition for camera{} {}".format("s" if multicam else "",", ".join(cam_names)))
+
+@controller.toploopSlot()
+def stop_app():
+    controller.stop_app()
+def execute(config_file="settings.cfg", camera=None, acquire=True):
+    app=QtGui.QGuiApplication([])
+    gui=controller.get_gui_controller()
+    gui.started.connect(lambda: start_app(config_file=config_file,camera=camera,acquire=acquire))
+    for s in [signal.SIGINT,signal.SIGTERM]:
+        signal.signal(s,lambda *args: QtCore.QTimer.singleShot(0,stop_app))
+    signal_timer=QtCore.QTimer()  # let Python signal handlers run while in the Qt event loop
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(200)
+    app.exec_()
+if __name__=="__main__":
+    execute(config_file=argvp.config_file,camera=argvp.camera,acquire=not argvp.no_acquire)
+    os.chdir(startdir)
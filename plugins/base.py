@@ -19,7 +19,7 @@ class PluginThreadController(controller.QTaskThread):
     Setup args:
         - ``name``: plugin name
         - ``plugin_cls``: plugin controller class (subclass of :cls:`IPlugin`)
-        - ``main_frame``: main GUI :cls:`.QFrame` object
+        - ``main_frame``: main GUI :cls:`.QFrame` object, or a headless host object (in which case the plugin has no GUI manager)
         - ``parameters``: additional parameters passed to the plugin on creation
         - ``ext_controller_names``: dictionary with aliases and real names of additional controllers (camera, saver, etc)
     """
@@ -27,7 +27,7 @@ class PluginThreadController(controller.QTaskThread):
         self.plugin=None
         self.main_frame=main_frame
         ext_controllers={a:controller.sync_controller(n) for a,n in ext_controller_names.items()} if ext_controller_names else None
-        gui_ctl=self._make_manager(main_frame,"{}.{}".format(plugin_cls.get_class_name(),name))
+        gui_ctl=None if getattr(main_frame,"headless",False) else self._make_manager(main_frame,"{}.{}".format(plugin_cls.get_class_name(),name))
         self.plugin=plugin_cls(name,self,gui_ctl,parameters=parameters,ext_controllers=ext_controllers)
         self.plugin._open()
         self.notify_exec_point("plugin_setup")
@@ -222,7 +222,8 @@ class IPlugin:
         guictl: main (GUI) thread controller;
             used mainly for calling predefined thread methods (which access widgets, and therefore automatically execute in GUI thread)
         gui: GUI controller (instance of :cls:`PluginGUIManager`);
-            used to set up GUI controls, e.g., add plotting or control tabs, or control boxes for small plugins
+            used to set up GUI controls, e.g., add plotting or control tabs, or control boxes for small plugins;
+            ``None`` if the plugin runs in the headless mode (only possible for plugins with ``_headless_support=True``)
         extctls: dictionary of controller for additional thread;
             used to further access different parts of the system;
             threads include ``"camera"`` (camera thread), ``"saver"`` (main saver thread), ``"snap_saver"`` (snapshot saver thread),
@@ -252,6 +253,8 @@ class IPlugin:
     _class_name=None  # default class name (by default, the class name)
     _class_caption=None  # default class caption (by default, same as name)
     _default_start_order=0  # default starting order for plugins of this class
+    _headless_support=False  # whether the plugin can run without GUI (in which case its `gui` attribute is ``None``)
+    _default_port=None  # default network port of the plugin (if it listens on one); offset by the camera index for several cameras in the headless mode
     @classmethod
     def get_class_name(cls, kind="name"):
         """
@@ -295,7 +298,8 @@ class IPlugin:
     def _close(self):
         self._running=False
         self.cleanup()
-        controller.call_in_gui_thread(self.gui.clear)()
+        if self.gui is not None:
+            controller.call_in_gui_thread(self.gui.clear)()
     def is_running(self):
         """Check if the plugin is still running"""
         return self._running
@@ -307,8 +311,9 @@ class IPlugin:
 
     @controller.call_in_gui_thread
     def setup_gui_sync(self):
-        """Setup GUI (simply calls :meth:`setup_gui` in the GUI thread)"""
-        self.setup_gui()
+        """Setup GUI (simply calls :meth:`setup_gui` in the GUI thread; does nothing in the headless mode)"""
+        if self.gui is not None:
+            self.setup_gui()
     def setup_gui(self):
         """
         Setup GUI.
@@ -324,7 +329,7 @@ class IPlugin:
         Can be overloaded.
         Executed in the GUI thread.
         """
-        return self.gui.get_all_values()
+        return self.gui.get_all_values() if self.gui is not None else {}
     def set_all_values(self, values):
         """
         Set all GUI values.
@@ -332,7 +337,8 @@ class IPlugin:
         Can be overloaded.
         Executed in the GUI thread.
         """
-        self.gui.set_all_values(values)
+        if self.gui is not None:
+            self.gui.set_all_values(values)
     def get_all_indicators(self):
         """
         Get all GUI indicators as a dictionary.
@@ -340,7 +346,7 @@ class IPlugin:
         Can be overloaded.
         Executed in the GUI thread.
         """
-        return self.gui.get_all_indicators()
+        return self.gui.get_all_indicators() if self.gui is not None else {}
     def start_gui(self):
         """
         Start GUI operation.
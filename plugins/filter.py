@@ -9,10 +9,14 @@ import numpy as np
 import os
 import importlib
 import sys
+import ast
+import json
+import threading
 
 
 from .filters.base import IFrameFilter
 from utils.gui import DisplaySettings_ctl, ProcessingIndicator_ctl
+from utils.services import InstrumentedStageMixin, add_stage_resource
 
 
 
@@ -48,6 +52,8 @@ class FilterPanel(widgets.QFrameContainer):
         self.params.vs["unload_filter"].connect(unload_filter)
         self.params.add_text_label("loaded_filter",location=("next",0,1,"end"))
         self.params.add_text_label("filter_tab_label",location=("next",0,1,"end"))
+        self.params.add_text_label("jit_status",location=("next",0,1,"end"))
+        self.params.set_visible("jit_status",False)
         self.params.add_toggle_button("enabled","Enable",value=True,location=("next",0,1,"end"))
         self.params.add_text_label("description",location=("next",0,1,"end"))
         self.params.w["description"].setWordWrap(True)
@@ -131,6 +137,16 @@ class FilterPanel(widgets.QFrameContainer):
             self.params.v["loaded_filter"]=""
             self.current_filter=None
             self.load_default_values(exclude=["__plotter__"])
+    _jit_status_text={"pending":"Optimized code compilation is pending; using slower version",
+        "compiling":"Compiling optimized code ({}/{}); using slower version",
+        "failed":"Optimized code compilation failed"}
+    def set_jit_status(self, status, progress=None):
+        """Show the status of the background compilation of the filter kernels (``None`` hides the status)"""
+        text=self._jit_status_text.get(status)
+        if text is not None and progress is not None:
+            text=text.format(*progress)
+        self.params.set_visible("jit_status",text is not None)
+        self.params.v["jit_status"]=text or ""
     def update_indicators(self, values, data=None):
         """Update filter indicators and status values"""
         if not self.is_running():
@@ -267,7 +283,7 @@ class FilterPanel(widgets.QFrameContainer):
 
 
 
-class FilterThread(controller.QTaskThread):
+class FilterThread(InstrumentedStageMixin, controller.QTaskThread):
     """
     Filter thread controller.
 
@@ -281,6 +297,7 @@ class FilterThread(controller.QTaskThread):
     Variables:
         - ``"filter_desc"``: description of the currently loaded filter
         - ``"filter_parameters"``: current status and parameter values of the filter
+        - ``"instrumentation"``: frames processing statistics (see :class:`.InstrumentedStageMixin`)
     
     Commands:
         - ``set_filter``: set the filter class
@@ -289,6 +306,7 @@ class FilterThread(controller.QTaskThread):
         - ``enable``: enable or disable filter processing
         - ``set_parameter``: set filter parameters
     """
+    _instrumented_callbacks=["receive_message"]
     def setup_task(self, src, tag="frames/new", tag_out=None, settings=None):
         super().setup_task()
         self.frames_src=StreamSource(FramesMessage,sn=self.name)
@@ -319,10 +337,7 @@ class FilterThread(controller.QTaskThread):
         """Set a new filter class"""
         self.remove_filter()
         self.fctl=fctl
-        self.fctl.setup()
-        for p in fctl.description.get("gui/parameters",[]):
-            if ("name" in p) and ("default" in p) and (not p.get("indicator",True)) and p["default"] is not None:
-                self.fctl.set_parameter(p["name"],p["default"])
+        setup_filter(self.fctl)
         self.v["filter_props/parameters"]={p["name"]:p for p in fctl.description.get("gui/parameters",[]) if "name" in p}
         self.v["filter_desc"]=fctl.description
         self.single_frame=not fctl.description.get("receive_all_frames",False)
@@ -387,6 +402,7 @@ class FilterThread(controller.QTaskThread):
         """The the filter parameter"""
         if self.fctl is not None and name in self.get_variable("filter_props/parameters",default=[]):
             self.fctl.set_parameter(name,value)
+            self.single_frame=not self.fctl.description.get("receive_all_frames",False)  # can depend on the parameters
 
 
 
@@ -403,6 +419,7 @@ class FilterPlugin(base.IPlugin):
         self.filter_thread=FilterThread(self.ctl.name+".filter_thread",kwargs={"src":self.extctls["slowdown"].name,"settings":self.parameters})
         self.filter_thread.start()
         self.filter_thread.sync_exec_point("run")
+        self._warmup_filters()
         self.ctl.add_command("load_filter",self.load_filter)
         self.ctl.add_command("unload_filter",self.unload_filter)
         self.ctl.add_command("enable",self.enable)
@@ -414,6 +431,7 @@ class FilterPlugin(base.IPlugin):
             caption=self.caption,src=self.filter_thread.name,tag=self.filter_thread.tag_out,frame=None)
         self.extctls["resource_manager"].cs.add_resource("process_activity","processing/"+self.full_name,ctl=self.ctl,
             caption=self.caption,order=10)
+        add_stage_resource(self.extctls["resource_manager"],self.filter_thread.name,caption=self.caption,order=10,ctl=self.ctl)
         self.ctl.add_job("update_plots",self.update_plots,0.1)
         self.ctl.add_job("update_indicators",self.update_indicators,0.1,priority=-15)
     def setup_gui(self):
@@ -462,8 +480,17 @@ class FilterPlugin(base.IPlugin):
         if current_filter is not None and self.filter_panel.v["enabled"]:
             return current_filter[1]["caption"]
         return None
+    @controller.call_in_gui_thread
+    def _update_jit_status(self):
+        name=self.filter_panel.current_filter[0] if self.filter_panel.current_filter is not None else self.filter_panel.v["filter_id"]
+        jit_warmup=self.extctls.get("jit_warmup")
+        if jit_warmup is None or name not in jit_warmup.v["status"]:
+            self.filter_panel.set_jit_status(None)
+        else:
+            self.filter_panel.set_jit_status(jit_warmup.v["status",name],jit_warmup.v["progress"].get(name))
     def update_indicators(self):
         self._update_image(values=self.filter_thread.get_variable("filter_parameters",None))
+        self._update_jit_status()
     def update_plots(self, force=False):
         """Update plots"""
         if force:
@@ -472,15 +499,28 @@ class FilterPlugin(base.IPlugin):
         if self._update_image(values=values,data=data):
             self.extctls["resource_manager"].csi.update_resource("frame/display",self.full_name,frame=data["frame"])
 
+    _filters_folder=os.path.join("plugins","filters")
     def _collect_filters(self):
-        fcls=find_filters(os.path.join("plugins","filters"),root=self.gui.settings["runtime/root_folder"])
-        self.filter_classes={cls.get_class_name():cls for cls in fcls}
-        self.filter_captions={cls.get_class_name():cls.get_class_name(kind="caption") for cls in fcls}
+        self.filter_index=index_filters(self._filters_folder,root=self.gui.settings["runtime/root_folder"])
+        self.filter_classes={}
+        self.filter_captions={name:entry[2] for name,entry in self.filter_index.items()}
+    def _warmup_filters(self):
+        if "jit_warmup" not in self.extctls:
+            return
+        for name,entry in self.filter_index.items():
+            if entry[3]:
+                get_kernels=lambda entry=entry: load_filter_class(self._filters_folder,entry,root=self.gui.settings["runtime/root_folder"])._jit_kernels
+                self.extctls["jit_warmup"].ca.add_kernels(name,get_kernels)
+    def get_filter_class(self, name):
+        """Get filter class with the given name, importing its module if necessary"""
+        if name not in self.filter_classes:
+            self.filter_classes[name]=load_filter_class(self._filters_folder,self.filter_index[name],root=self.gui.settings["runtime/root_folder"])
+        return self.filter_classes[name]
 
     def load_filter(self, name):
         """Load filter with the given name"""
         self.unload_filter(update=False)
-        self.filter=self.filter_classes[name]()
+        self.filter=self.get_filter_class(name)()
         self.filter_thread.cs.set_filter(self.filter)
         self.filter_panel.setup_filter(name,self.filter_thread.v["filter_desc"])
         self.update_filter_state()
@@ -512,25 +552,131 @@ class FilterPlugin(base.IPlugin):
         return self.filter_thread.get_variable("filter_parameters",dictionary.Dictionary()).asdict("flat")
 
 
+_load_lock=threading.RLock()  # filter modules can be loaded both from the GUI thread and from the JIT warmup thread
+def _load_filter_module(folder, f, root=""):
+    f=os.path.join(folder,f)
+    module_name=os.path.splitext(f)[0].replace("\\",".").replace("/",".")
+    with _load_lock:
+        if module_name not in sys.modules:
+            spec=importlib.util.spec_from_file_location(module_name,os.path.join(root,f))
+            mod=importlib.util.module_from_spec(spec)
+            sys.modules[module_name]=mod  # register before execution, same as the standard import machinery
+            try:
+                spec.loader.exec_module(mod)
+            except Exception:
+                del sys.modules[module_name]
+                raise
+        return sys.modules[module_name]
+def _list_filter_files(folder, root=""):
+    return file_utils.list_dir_recursive(os.path.join(root,folder),file_filter=r".*\.py$",visit_folder_filter=string_utils.get_string_filter(exclude="__pycache__")).files
 def find_filters(folder, root=""):
     """
     Find all filter classes in all files contained in the given folder.
 
     Filter class is any subclass of :cls:`IFrameFilter` which has ``_class_name`` attribute which is not ``None``.
+    Note that this imports all the filter modules; to only list the filters without importing them, use :func:`index_filters`.
     """
-    files=file_utils.list_dir_recursive(os.path.join(root,folder),file_filter=r".*\.py$",visit_folder_filter=string_utils.get_string_filter(exclude="__pycache__")).files
     filters=[]
-    for f in files:
-        f=os.path.join(folder,f)
-        module_name=os.path.splitext(f)[0].replace("\\",".").replace("/",".")
-        if module_name not in sys.modules:
-            spec=importlib.util.spec_from_file_location(module_name,os.path.join(root,f))
-            mod=importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(mod)
-            sys.modules[module_name]=mod
-        mod=sys.modules[module_name]
+    for f in _list_filter_files(folder,root=root):
+        mod=_load_filter_module(folder,f,root=root)
         for v in mod.__dict__.values():
             if isinstance(v,type):
                 if issubclass(v,IFrameFilter) and getattr(v,"_class_name") is not None:
                     filters.append(v)
-    return filters
\ No newline at end of file
+    return filters
+
+
+def _scan_filter_file(path):
+    """
+    Find classes defining ``_class_name`` as a string literal in the given file.
+
+    Return list of ``[class_name, name, caption, has_jit]``, where ``has_jit`` indicates that the class defines ``_jit_kernels`` attribute.
+    """
+    with open(path,"rb") as f:
+        tree=ast.parse(f.read(),filename=path)
+    filters=[]
+    for node in tree.body:
+        if isinstance(node,ast.ClassDef):
+            attrs={}
+            for st in node.body:
+                if isinstance(st,ast.Assign):
+                    for t in st.targets:
+                        if isinstance(t,ast.Name) and t.id=="_jit_kernels":
+                            attrs[t.id]=True
+                        elif isinstance(t,ast.Name) and t.id in ["_class_name","_class_caption"] and isinstance(st.value,ast.Constant) and isinstance(st.value.value,str):
+                            attrs[t.id]=st.value.value
+            if "_class_name" in attrs:
+                filters.append([node.name,attrs["_class_name"],attrs.get("_class_caption",attrs["_class_name"]),attrs.get("_jit_kernels",False)])
+    return filters
+_filter_index_version=2
+def index_filters(folder, root=""):
+    """
+    Find all filters in all files contained in the given folder without importing them.
+
+    The files are scanned for classes which define ``_class_name`` attribute as a string literal (caption is taken from ``_class_caption`` attribute, if it is defined the same way).
+    The result is cached in ``__pycache__/filter_index.json`` inside the folder, and a file is only scanned again if its modification time or size changes.
+    Return dictionary ``{name: (file, class_name, caption, has_jit)}``, where `file` is the path relative to the folder,
+    and `has_jit` indicates that the class declares numba kernels in ``_jit_kernels`` attribute.
+    Use :func:`load_filter_class` to get the filter class.
+    """
+    path=os.path.join(root,folder)
+    cache_path=os.path.join(path,"__pycache__","filter_index.json")
+    try:
+        with open(cache_path) as f:
+            cache=json.load(f)
+        if cache.get("version")!=_filter_index_version:
+            cache=None
+    except (OSError,ValueError):
+        cache=None
+    cached_files=cache["files"] if cache else {}
+    files={}
+    for f in _list_filter_files(folder,root=root):
+        st=os.stat(os.path.join(path,f))
+        entry=cached_files.get(f)
+        if entry is None or entry["mtime"]!=st.st_mtime or entry["size"]!=st.st_size:
+            entry={"mtime":st.st_mtime,"size":st.st_size,"filters":_scan_filter_file(os.path.join(path,f))}
+        files[f]=entry
+    if files!=cached_files:
+        try:
+            os.makedirs(os.path.split(cache_path)[0],exist_ok=True)
+            with open(cache_path,"w") as f:
+                json.dump({"version":_filter_index_version,"files":files},f)
+        except OSError:
+            pass
+    index={}
+    for f,entry in files.items():
+        for class_name,name,caption,has_jit in entry["filters"]:
+            index.setdefault(name,(f,class_name,caption,has_jit))
+    return index
+def load_filter_class(folder, index_entry, root=""):
+    """
+    Load filter class given its entry in the result of :func:`index_filters`.
+
+    Only imports the module containing the filter.
+    """
+    f,class_name=index_entry[:2]
+    mod=_load_filter_module(folder,f,root=root)
+    cls=getattr(mod,class_name,None)
+    if not (isinstance(cls,type) and issubclass(cls,IFrameFilter)):
+        raise ValueError("could not find filter class {} in {}".format(class_name,os.path.join(folder,f)))
+    return cls
+def find_filter_class(name, folder=None, root=""):
+    """Find filter class with the given name in the given folder (by default, the standard filters folder), only importing the module containing it"""
+    folder=folder or FilterPlugin._filters_folder
+    index=index_filters(folder,root=root)
+    if name not in index:
+        raise ValueError("could not find filter {}".format(name))
+    return load_filter_class(folder,index[name],root=root)
+def setup_filter(fctl, parameters=None):
+    """
+    Set up the filter object and apply the default values of its parameters.
+
+    If `parameters` is not ``None``, it is a dictionary with the parameter values applied after the default ones.
+    Used both for the live and for the offline processing, so that the filter starts in the same state.
+    """
+    fctl.setup()
+    for p in fctl.description.get("gui/parameters",[]):
+        if ("name" in p) and ("default" in p) and (not p.get("indicator",True)) and p["default"] is not None:
+            fctl.set_parameter(p["name"],p["default"])
+    for name,value in (parameters or {}).items():
+        fctl.set_parameter(name,value)
@@ -21,6 +21,7 @@ class IFrameFilter:
     """
     _class_name=None  # class name (needs to be defined to appear in the list)
     _class_caption=None  # default class caption (by default, same as ``_class_name``)
+    _jit_kernels=[]  # numba kernels compiled in the background on startup, as a list of tuples ``(kernel, make_signature)`` (see :class:`utils.services.jit.JITWarmupThread`)
     _class_description=None  # longer class description
     def __init__(self):
         self.description={"receive_all_frames":False,"gui/parameters":[]}
@@ -102,6 +103,16 @@ class IFrameFilter:
     def select_plotter(self, selector):
         """Select a specific plotter settings set"""
         self._plotter_selector=selector
+    def get_required_history(self):
+        """
+        Get the number of the preceding frames which affect the filter output.
+
+        Used in the offline reprocessing to split the frames between several processes, with each part preceded by the required number of overlapping frames.
+        Return tuple ``(length, period)``, where ``length`` is the number of frames, and ``period`` is the period of the filter state
+        with respect to the frame index (e.g., the buffer step), so that the overlapping part has to start at a multiple of it.
+        Return ``None`` if the output can depend on all the preceding frames, in which case the frames are always processed in a single sequence.
+        """
+        return None
 
     ## Setup functions ##
     def setup(self):
@@ -202,6 +213,8 @@ class ISingleFrameFilter(IFrameFilter):
         self._multichannel=multichannel
     def receive_frames(self, frames):
         self._latest_frame=frames[-1].copy()
+    def get_required_history(self):
+        return (0,1)
     def generate_frame(self):
         if self._latest_frame is None:
             return None
@@ -267,6 +280,8 @@ class IMultiFrameFilter(IFrameFilter):
             self.buffer_step=buffer_step
             self._buffer_step_part=0
             self.buffer=[]
+    def get_required_history(self):
+        return (self.buffer_size*self.buffer_step,self.buffer_step)
     def receive_frames(self, frames):
         if self.buffer and self.buffer[0].shape!=frames.shape[1:]:
             self.buffer=[]
@@ -344,6 +359,8 @@ class IRingMultiFrameFilter(IFrameFilter):
             self._buffer_step_part=0
         self.end_pos=0
         self.filled=False
+    def get_required_history(self):
+        return (self.buffer_size*self.buffer_step,self.buffer_step)
     def receive_frames(self, frames):
         if self.buffer is None or self.buffer.shape[1:]!=frames.shape[1:]:
             self.reshape_buffer(frame_shape=frames.shape[1:],frame_dtype=frames.dtype)
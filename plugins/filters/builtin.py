@@ -7,6 +7,7 @@ import scipy.ndimage
 import numba as nb
 
 from . import base
+from utils.services import jit
 
 
 
@@ -90,7 +91,7 @@ class FFTBandpassFilter(base.ISingleFrameFilter):
 
 
 _movavg_per=4 # "manual" loop unrolling (parallel mode is unstable, shouldn't be used)
-@nb.njit(fastmath=True,parallel=False,nogil=True) # buffer is guranteed to stay constant during execution, so can lift GIL; parallel mode is unstable, shouldn't be used
+@nb.njit(fastmath=True,parallel=False,nogil=True,cache=True) # buffer is guranteed to stay constant during execution, so can lift GIL; parallel mode is unstable, shouldn't be used
 def _movavg(buffer):
     n,r,c=buffer.shape
     l=n//_movavg_per
@@ -114,6 +115,7 @@ class FastMovingAverageFilter(base.IRingMultiFrameFilter):
     _class_name="moving_avg"
     _class_caption="Moving average"
     _class_description="Averages a given number of consecutive frames into a single frame. Frames are averaged within a sliding window."
+    _jit_kernels=[(_movavg,lambda buffer: (buffer,))]
     def setup(self):
         super().setup(process_incomplete=True)
         self.add_parameter("length",label="Number of frames",kind="int",limit=(1,None),default=20)
@@ -128,7 +130,10 @@ class FastMovingAverageFilter(base.IRingMultiFrameFilter):
             return None
         if buffer.ndim>3:
             return np.concatenate([self.process_buffer(buffer[...,ch],start,filled)[...,None] for ch in range(buffer.shape[-1])],axis=-1)
-        return _movavg(buffer[:filled])
+        buffer=buffer[:filled]
+        if not jit.is_ready(_movavg,buffer):
+            return np.mean(buffer,axis=0)
+        return _movavg(buffer)
 
 
 
@@ -166,7 +171,7 @@ class MovingAccumulatorFilter(base.IMultiFrameFilter):
             return np.std(buffer,axis=0)
 
 
-@nb.njit(fastmath=True,parallel=False,nogil=True) # buffer is guranteed to stay constant during execution, so can lift GIL; parallel mode is unstable, shouldn't be used
+@nb.njit(fastmath=True,parallel=False,nogil=True,cache=True) # buffer is guranteed to stay constant during execution, so can lift GIL; parallel mode is unstable, shouldn't be used
 def _movavgsub(buffer, start=0):
     n,r,c=buffer.shape
     l=n//2
@@ -191,6 +196,7 @@ class FastMovingAverageSubtractionFilter(base.IRingMultiFrameFilter):
     _class_caption="Moving average subtract"
     _class_description=("Averages two consecutive frame blocks into two individual frames and takes their difference. "
         "Similar to running background subtraction, but with some additional time averaging.")
+    _jit_kernels=[(_movavgsub,lambda buffer: (buffer,nb.int64))]
     def setup(self):
         super().setup()
         self.add_parameter("length",label="Number of frames",kind="int",limit=(1,None),default=20)
@@ -205,6 +211,10 @@ class FastMovingAverageSubtractionFilter(base.IRingMultiFrameFilter):
             return None
         if buffer.ndim>3:
             return np.concatenate([self.process_buffer(buffer[...,ch],start,filled)[...,None] for ch in range(buffer.shape[-1])],axis=-1)
+        if not jit.is_ready(_movavgsub,buffer,start):
+            n=len(buffer)
+            idx=(np.arange(n//2)+start)%n
+            return (np.sum(buffer[idx],axis=0,dtype="float")-np.sum(buffer[(idx+n//2)%n],axis=0,dtype="float"))/(n//2)
         return _movavgsub(buffer,start)
 
 
@@ -7,40 +7,170 @@ from . import base
 from pylablib.core.dataproc import fitting
 
 import numpy as np
+import time
+
+
+
+def get_beam_moments(frames, roi_factor=3., niter=3, subtract_background=True):
+    """
+    Calculate beam centroids and second-moment widths for a stack of frames.
+
+    The widths are calculated within an integration area centered on the centroid, whose size is `roi_factor` times the D4σ width
+    (ISO 11146 uses ``roi_factor=3``); the area is refined iteratively `niter` times starting from the region above 1/e^2 of the frame maximum
+    (if ``niter==0``, the moments are calculated over the whole frame).
+    If ``subtract_background==True``, subtract the mean of the frame border from each frame (negative values are kept to avoid biasing the widths by noise).
+    `frames` is a 3D array, where the first axis is the frame index.
+    Return tuple ``(cx, cy, sx, sy)`` of 1D arrays with sub-pixel centroid coordinates and second-moment widths (standard deviations) along the two axes;
+    frames with no signal have ``NaN`` values.
+    """
+    frames=np.array(frames,dtype="float")
+    n,nr,nc=frames.shape
+    if subtract_background:
+        border=np.concatenate([frames[:,0,:],frames[:,-1,:],frames[:,:,0],frames[:,:,-1]],axis=1)
+        frames-=border.mean(axis=1)[:,None,None]
+    ys,xs=np.arange(nr),np.arange(nc)
+    if niter>0:  # start from the bounding box of the area above 1/e^2 of the maximum, since full-frame moments are dominated by noise
+        above=frames>frames.reshape((n,-1)).max(axis=1)[:,None,None]*np.exp(-2)
+        mr,mc=above.any(axis=2).astype("float"),above.any(axis=1).astype("float")
+    else:
+        mr,mc=np.ones((n,nr)),np.ones((n,nc))
+    for i in range(niter+1):
+        py=np.matmul(frames,mc[:,:,None])[:,:,0]*mr  # row profiles restricted to the integration area
+        px=np.matmul(mr[:,None,:],frames)[:,0,:]*mc  # column profiles restricted to the integration area
+        tot=px.sum(axis=1)
+        valid=tot>0
+        tot[~valid]=1
+        cx=px.dot(xs)/tot
+        cy=py.dot(ys)/tot
+        sx=np.sqrt(np.maximum((px*(xs[None,:]-cx[:,None])**2).sum(axis=1)/tot,0))
+        sy=np.sqrt(np.maximum((py*(ys[None,:]-cy[:,None])**2).sum(axis=1)/tot,0))
+        if i<niter:  # integration area half-size is roi_factor*D4σ/2=roi_factor*2σ
+            mc=(abs(xs[None,:]-cx[:,None])<=np.maximum(roi_factor*2*sx,1)[:,None]).astype("float")
+            mr=(abs(ys[None,:]-cy[:,None])<=np.maximum(roi_factor*2*sy,1)[:,None]).astype("float")
+    for v in [cx,cy,sx,sy]:
+        v[~valid]=np.nan
+    return cx,cy,sx,sy
 
 
 
 class BeamProfileFilter(base.ISingleFrameFilter):
     """
     Beam profiler filter.
+
+    Can either fit profile cuts with Gaussians (``"fit"`` method), or calculate second-moment widths and centroids (``"moments"`` method).
+    In the latter case, all received frames are analyzed, and the results are accumulated in the history (see :meth:`get_history`),
+    while the Gaussian fit is only performed on request or with a given period.
     """
     _class_name="beam_profile"
     _class_caption="Beam profile"
-    _class_description="Beam profiler filter: averages image in strips of the given widths in vertical and horizontal directions, fits the resulting profiles to Gaussians and shows the widths"
+    _class_description=("Beam profiler filter: averages image in strips of the given widths in vertical and horizontal directions, fits the resulting profiles to Gaussians and shows the widths. "
+        "Alternatively, calculates second-moment (D4σ) widths and centroids of all camera frames, and runs the fit only on request.")
+    _history_channels=["time","frame","x_centroid","y_centroid","x_width","y_width"]
     def setup(self):
         """Initial filter setup"""
         super().setup(multichannel="average")
         # Setup control parameters
+        self.add_parameter("method",label="Method",kind="select",options={"fit":"Gaussian fit","moments":"Second moments"})
         self.add_parameter("x_position",label="X position",kind="int",limit=(0,None))
         self.add_parameter("y_position",label="Y position",kind="int",limit=(0,None))
         self.add_parameter("track_lines",label="Use plot lines",kind="check")
         self.add_parameter("track_max",label="Locate maximum",kind="check")
         self.add_parameter("width",label="Averaging width",kind="int",limit=(1,None),default=10)
+        self.add_parameter("roi_factor",label="Moments area factor",limit=(1,None),default=3)
+        self.add_parameter("moments_iterations",label="Moments iterations",kind="int",limit=(0,None),default=3)
+        self.add_parameter("subtract_background",label="Subtract background",kind="check",default=True)
+        self.add_parameter("fit_period",label="Fit period (s)",limit=(0,None),default=0)
+        self.add_parameter("fit_now",label="Fit now",kind="button")
+        self.add_parameter("history_length",label="History length",kind="int",limit=(1,None),default=10000)
+        self.add_parameter("reset_history",label="Reset history",kind="button")
         self.add_parameter("show_map_info",label="Showing",kind="select",options={"frame":"Frame","data":"Data profile","fit":"Fit profile"})
         # Add width indicators
         self.add_parameter("x_fit_width",label="X width",kind="float",indicator=True)
         self.add_parameter("y_fit_width",label="Y width",kind="float",indicator=True)
+        self.add_parameter("x_centroid",label="X centroid",kind="float",indicator=True)
+        self.add_parameter("y_centroid",label="Y centroid",kind="float",indicator=True)
+        self.add_parameter("x_jitter",label="X centroid RMS",kind="float",indicator=True)
+        self.add_parameter("y_jitter",label="Y centroid RMS",kind="float",indicator=True)
+        self.add_parameter("history_filled",label="History frames",kind="int",indicator=True)
         # Add auxiliary parameters
         self.add_linepos_parameter(default=None)  # indicate that the filter needs to get a cross position as "linepos" parameter
         self.add_rectangle("x_selection",(0,0),(0,0))  # add a rectangle indicating x-cut area
         self.add_rectangle("y_selection",(0,0),(0,0))  # add a rectangle indicating y-cut area
+        self.add_rectangle("moments_area",(0,0),(0,0))  # add a rectangle indicating moments D4σ area
         self.select_plotter("frame")
+        self.p["x_centroid"]=self.p["y_centroid"]=np.nan
+        self._history=None
+        self._history_pos=0
+        self._history_filled=0
+        self._frames_received=0
+        self._fit_requested=False
+        self._last_fit_time=None
+        self._last_fit=None
+        self.reset_history()
     def set_parameter(self, name, value):  # called automatically any time a GUI parameter or an image cross position are changed
         """Set filter parameter with the given name"""
         super().set_parameter(name,value)  # default parameter set (store the value in ``self.p`` dictionary)
         if name in ["linepos","track_lines","show_map_info"] and self.p["show_map_info"]=="frame" and self.p["track_lines"] and self.p["linepos"]:
             self.set_parameter("x_position",int(self.p["linepos"][1]))
             self.set_parameter("y_position",int(self.p["linepos"][0]))
+        if name=="method":
+            self.setup_general(receive_all_frames=value=="moments")  # all frames are only needed for the moments tracking
+        if name=="fit_now":
+            self._fit_requested=True
+        if name in ["history_length","reset_history"]:
+            self.reset_history()
+
+    def reset_history(self):
+        """Clear the accumulated moments history"""
+        self._history=np.full((self.p["history_length"],len(self._history_channels)),np.nan)
+        self._history_pos=0
+        self._history_filled=0
+        self.p["history_filled"]=0
+    def _add_history(self, rows):
+        size=len(self._history)
+        rows=rows[-size:]
+        nrows=len(rows)
+        end=min(self._history_pos+nrows,size)
+        self._history[self._history_pos:end]=rows[:end-self._history_pos]
+        self._history[:nrows-(end-self._history_pos)]=rows[end-self._history_pos:]
+        self._history_pos=(self._history_pos+nrows)%size
+        self._history_filled=min(self._history_filled+nrows,size)
+        self.p["history_filled"]=self._history_filled
+    def get_required_history(self):
+        return None  # the moments history accumulates over all frames
+    def get_history(self):
+        """
+        Get the accumulated moments history.
+
+        Return a dictionary ``{name: column}`` with 1D arrays for channels ``"time"`` (receiving timestamp), ``"frame"`` (received frame counter),
+        ``"x_centroid"``, ``"y_centroid"``, ``"x_width"`` and ``"y_width"`` (second-moment widths, i.e., D4σ/4).
+        """
+        if self._history_filled<len(self._history):
+            table=self._history[:self._history_filled]
+        else:
+            table=np.roll(self._history,-self._history_pos,axis=0)
+        return {n:table[:,i].copy() for i,n in enumerate(self._history_channels)}
+    def _update_history_status(self):
+        table=self._history[:self._history_filled]
+        if len(table)>1:
+            self.p["x_jitter"]=np.nanstd(table[:,2])
+            self.p["y_jitter"]=np.nanstd(table[:,3])
+
+    def receive_frames(self, frames):
+        super().receive_frames(frames)
+        if self.p["method"]=="moments":
+            while frames.ndim>3:
+                frames=frames.mean(axis=-1)
+            cx,cy,sx,sy=get_beam_moments(frames,roi_factor=self.p["roi_factor"],niter=self.p["moments_iterations"],subtract_background=self.p["subtract_background"])
+            n=len(frames)
+            frame_idx=np.arange(self._frames_received,self._frames_received+n)
+            self._frames_received+=n
+            self._add_history(np.column_stack([np.full(n,time.time()),frame_idx,cx,cy,sx,sy]))
+            self._update_history_status()
+            if not np.isnan(cx[-1]):
+                self.p["x_centroid"],self.p["y_centroid"]=cx[-1],cy[-1]
+                self.p["x_fit_width"],self.p["y_fit_width"]=sx[-1],sy[-1]
+
     def _get_region(self, shape):
         """Get the spans ``(start, stop)`` of the two averaging regions"""
         xp,yp,w=self.p["x_position"],self.p["y_position"],self.p["width"]
@@ -69,10 +199,26 @@ class BeamProfileFilter(base.ISingleFrameFilter):
         fit_parameters={"center":cut.argmax(),"width":len(cut)/10,"background":background,"height":cut.max()-background}
         fp,ff=fitter.fit(xs,cut,fit_parameters=fit_parameters)
         return fp,ff(xs)
+    def _moments_profile(self, cut, center, width):
+        """Get a Gaussian profile with the given moments, normalized to the given cut"""
+        xs=np.arange(len(cut))
+        background=np.median(cut)
+        return self.profile(xs,center,width,cut.max()-background,background)
+    def _need_fit(self):
+        """Check if the nonlinear fit needs to be performed in the moments mode"""
+        if self._fit_requested:
+            return True
+        if self.p["fit_period"]>0:
+            return self._last_fit_time is None or time.time()>self._last_fit_time+self.p["fit_period"]
+        return False
     def process_frame(self, frame):  # called automatically whenver a new frame is received from the camera
         """Process a new camera frame"""
-        if self.p["track_max"]:  # move center to the image maximum, if enabled
-            imax,jmax=np.unravel_index(frame.argmax(),frame.shape)
+        moments=self.p["method"]=="moments"
+        if self.p["track_max"]:  # move center to the image maximum (or beam centroid in the moments mode), if enabled
+            if moments and not np.isnan(self.p["x_centroid"]):
+                imax,jmax=int(round(self.p["y_centroid"])),int(round(self.p["x_centroid"]))
+            else:
+                imax,jmax=np.unravel_index(frame.argmax(),frame.shape)
             self.set_parameter("x_position",jmax)
             self.set_parameter("y_position",imax)
         # Extract profiles
@@ -82,18 +228,32 @@ class BeamProfileFilter(base.ISingleFrameFilter):
         ycut=np.mean(frame[:,cs[0]:cs[1]],axis=1)
         ycut/=ycut.max()
         # Fit profiles
-        xfp,xfcut=self.fit_profile(xcut)
-        self.p["x_fit_width"]=xfp["width"]
-        yfp,yfcut=self.fit_profile(ycut)
-        self.p["y_fit_width"]=yfp["width"]
+        if not moments or self._need_fit():
+            xfp,xfcut=self.fit_profile(xcut)
+            yfp,yfcut=self.fit_profile(ycut)
+            self._last_fit=xfcut,yfcut
+            self._last_fit_time=time.time()
+            self._fit_requested=False
+            if not moments:
+                self.p["x_fit_width"]=xfp["width"]
+                self.p["y_fit_width"]=yfp["width"]
+        elif self._last_fit is not None and self._last_fit[0].shape==xcut.shape and self._last_fit[1].shape==ycut.shape:
+            xfcut,yfcut=self._last_fit
+        else:
+            xfcut=self._moments_profile(xcut,self.p["x_centroid"],self.p["x_fit_width"])
+            yfcut=self._moments_profile(ycut,self.p["y_centroid"],self.p["y_fit_width"])
         if self.p["show_map_info"]=="frame":  # showing the original frames
             rs,cs=self._get_region(frame.shape)
             nr,nc=frame.shape
             # Set parameters of the rectangles indicating the profile extraction areas
             self.change_rectangle("x_selection",center=((rs[1]+rs[0])/2,nc/2),size=(rs[1]-rs[0],nc),visible=True)
             self.change_rectangle("y_selection",center=(nr/2,(cs[1]+cs[0])/2),size=(nr,cs[1]-cs[0]),visible=True)
+            if moments and not np.isnan(self.p["x_centroid"]):
+                self.change_rectangle("moments_area",center=(self.p["y_centroid"],self.p["x_centroid"]),size=(4*self.p["y_fit_width"],4*self.p["x_fit_width"]),visible=True)
+            else:
+                self.change_rectangle("moments_area",visible=False)
             self.select_plotter("frame")
             return frame
         if self.p["show_map_info"]=="data":  # showing the extracted profiles
             return xcut[None,:]*ycut[:,None]
-        return xfcut[None,:]*yfcut[:,None]  # showing the fit profiles
\ No newline at end of file
+        return xfcut[None,:]*yfcut[:,None]  # showing the fit profiles
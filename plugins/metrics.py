@@ -0,0 +1,180 @@
+from . import base
+
+from pylablib.core.thread import controller
+
+from utils.services import frame_pool
+
+import os
+import sys
+import time
+import threading
+import http.server
+try:
+    import psutil
+except ImportError:
+    psutil=None
+
+
+
+def get_process_rss():
+    """Get the resident memory size of the current process in bytes (``None`` if it can not be determined)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError,ValueError,IndexError,AttributeError):
+        return None
+
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Scrape endpoint request handler which returns the latest metrics text"""
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split("?")[0] not in ["/","/metrics"]:
+            self.send_error(404)
+            return
+        data=self.server.metrics_text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type","text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length",str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+
+class MetricsExporterPlugin(base.IPlugin):
+    """
+    Plugin for exporting the acquisition health metrics for external monitoring.
+
+    The metrics are periodically sampled from the existing thread variables and instrumentation resources (no additional hooks in the frame processing threads),
+    and are either served in the Prometheus text format on a local HTTP port, or appended to a file in the InfluxDB line protocol (or both).
+
+    Parameters:
+        - ``port``: scrape endpoint port (``None`` or 0 disables the endpoint); by default, 9108
+        - ``ip``: scrape endpoint address; by default, ``"127.0.0.1"`` (only local connections)
+        - ``file``: path to the line protocol file; by default, ``None`` (no file is written)
+        - ``period``: metrics sampling period (in seconds); by default, 5 seconds
+        - ``camera``: camera name added as a tag to all metrics; by default, use the name from the settings file
+        - ``measurement``: name of the measurement in the line protocol and prefix of the metrics in the text format; by default, ``"camcontrol"``
+    """
+    _class_name="metrics"
+    _default_start_order=100
+    _headless_support=True
+    _default_port=9108
+    def setup(self):
+        self.setup_gui_sync()
+        self.port=self.parameters.get("port",self._default_port)
+        self.ip=self.parameters.get("ip","127.0.0.1")
+        self.path=self.parameters.get("file",None)
+        self.measurement=self.parameters.get("measurement","camcontrol")
+        self.cam_name=self.parameters.get("camera",self.ctl.main_frame.cam_name)
+        self._last_saved=None
+        self._last_pause_count=None
+        self.httpd=None
+        if self.port:
+            try:
+                self.httpd=http.server.ThreadingHTTPServer((self.ip,self.port),MetricsRequestHandler)
+                self.httpd.daemon_threads=True
+                self.httpd.metrics_text=""
+                threading.Thread(target=self.httpd.serve_forever,daemon=True).start()
+            except OSError as err:
+                print("Could not start the metrics endpoint on {}:{}: {}".format(self.ip,self.port,err),file=sys.stderr)
+                self.httpd=None
+        self.update_gui()
+        self.ctl.add_job("update_metrics",self.update_metrics,self.parameters.get("period",5.))
+    def cleanup(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+    def setup_gui(self):
+        self.table=self.gui.add_plugin_box("metrics","Metrics exporter",index=110)
+        self.table.add_text_label("endpoint",label="Endpoint")
+        self.table.add_text_label("file",label="File")
+
+    @controller.call_in_gui_thread
+    def update_gui(self):
+        if self.gui is None:
+            return
+        self.table.v["endpoint"]="http://{}:{}/metrics".format(self.ip,self.port) if self.httpd is not None else "off"
+        self.table.v["file"]=os.path.split(self.path)[1] if self.path else "off"
+    def _get_pause_max(self, pause):
+        """Get the longest garbage collection pause since the last update (the collector maximum is shared with other readers, so it is not reset)"""
+        count=sum(pause["count"])
+        last_count,self._last_pause_count=self._last_pause_count,count
+        if last_count is None:
+            return pause["max"]
+        recent=pause.get("recent",[])[-(count-last_count):] if count>last_count else []
+        return max(recent,default=0.)
+    def _get_saving_rate(self, saved):
+        t=time.time()
+        last,self._last_saved=self._last_saved,(t,saved)
+        if last is None or saved<last[1] or t<=last[0]:
+            return 0.
+        return (saved-last[1])/(t-last[0])
+    def collect_metrics(self):
+        """
+        Collect the current metrics values.
+
+        Return a list of tuples ``(name, tags, value)``, where ``tags`` is a dictionary with additional metric tags (e.g., stage name).
+        """
+        cam=self.extctls["camera"]
+        saver=self.extctls["saver"]
+        metrics=[]
+        cam_frames=cam.v["frames"]
+        metrics+=[("camera_fps",{},cam_frames.get("fps",0)),("camera_frames_acquired",{},cam_frames.get("acquired",0)),
+            ("camera_frames_read",{},cam_frames.get("read",0)),("camera_buffer_filled",{},cam_frames.get("buffer_filled",0))]
+        saved=saver.v["saved"] or 0
+        max_queue_ram=saver.v["max_queue_ram"] or 0
+        queue_ram=saver.v["queue_ram"] or 0
+        metrics+=[("saving_active",{},int(saver.v["status/saving"]=="in_progress")),
+            ("saving_received",{},saver.v["received"] or 0),("saving_saved",{},saved),("saving_missed",{},saver.v["missed"] or 0),
+            ("saving_fps",{},self._get_saving_rate(saved)),
+            ("saving_queue_ram",{},queue_ram),("saving_queue_fill",{},queue_ram/max_queue_ram if max_queue_ram else 0)]
+        pretrigger=saver.v["pretrigger_status"]
+        if pretrigger is not None:
+            metrics+=[("pretrigger_frames",{},pretrigger.frames),("pretrigger_skipped",{},pretrigger.skipped),
+                ("pretrigger_fill",{},pretrigger.nbytes/pretrigger.size if pretrigger.size else 0)]
+        stages=self.extctls["resource_manager"].cs.list_resources("instrumentation")
+        for name,stage in stages.items():
+            tags={"stage":name,"caption":stage.get("caption",name)}
+            for k in ["frame_rate","bytes_rate","load","dropped","queue_depth","queue_limit"]:
+                if k in stage:
+                    metrics.append(("stage_"+k,tags,stage[k]))
+        pool=frame_pool.get_stats()
+        metrics+=[("frame_pool_hits",{},pool["hits"]),("frame_pool_misses",{},pool["misses"]),("frame_pool_size_bytes",{},pool["size"])]
+        if "garbage_collector" in self.extctls:
+            pause=self.extctls["garbage_collector"].v["pause"]
+            if pause is not None:
+                metrics+=[("gc_pause_last_seconds",{},pause["last"]),("gc_pause_max_seconds",{},self._get_pause_max(pause)),("gc_pause_total_seconds",{},pause["time"])]
+                metrics+=[("gc_collections",{"generation":g},n) for g,n in enumerate(pause["count"])]
+        rss=get_process_rss()
+        if rss is not None:
+            metrics.append(("process_rss_bytes",{},rss))
+        return [m for m in metrics if m[2] is not None]
+
+    def _format_tags(self, tags, fmt):
+        tags=dict(tags,camera=self.cam_name)
+        if fmt=="text":
+            return "{"+",".join('{}="{}"'.format(k,str(v).replace('"','\\"')) for k,v in tags.items())+"}"
+        return "".join(",{}={}".format(k,str(v).replace(" ","\\ ").replace(",","\\,").replace("=","\\=")) for k,v in tags.items())
+    def format_text(self, metrics):
+        """Format the metrics in Prometheus text format"""
+        return "".join("{}_{}{} {}\n".format(self.measurement,name,self._format_tags(tags,"text"),float(value)) for name,tags,value in metrics)
+    def format_lines(self, metrics, timestamp=None):
+        """Format the metrics in InfluxDB line protocol (one line per tag set)"""
+        timestamp=int((time.time() if timestamp is None else timestamp)*1E9)
+        groups={}
+        for name,tags,value in metrics:
+            groups.setdefault(self._format_tags(tags,"line"),[]).append("{}={}".format(name,float(value)))
+        return "".join("{}{} {} {}\n".format(self.measurement,tags,",".join(fields),timestamp) for tags,fields in groups.items())
+    def update_metrics(self):
+        """Collect the metrics and update the endpoint and the file"""
+        metrics=self.collect_metrics()
+        if self.httpd is not None:
+            self.httpd.metrics_text=self.format_text(metrics)
+        if self.path:
+            with open(self.path,"a") as f:
+                f.write(self.format_lines(metrics))
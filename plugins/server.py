@@ -1,12 +1,27 @@
 from . import base
 
 from pylablib.core.thread import controller
-from pylablib.core.utils import net, dictionary, general, py3
-from pylablib.thread.stream.stream_message import FramesAccumulator
+from pylablib.core.utils import net, dictionary, py3
+from pylablib.core.dataproc import filters
 from pylablib.thread.stream.stream_manager import StreamIDCounter
+from utils.services import frame_pool
 
 import numpy as np
 import json
+import socket
+import asyncio
+import zlib
+import threading
+import bisect
+import time
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory=None
+try:
+    import msgpack
+except ImportError:
+    msgpack=None
 
 
 
@@ -20,31 +35,274 @@ class IncomingMessageError(IOError):
         super().__init__(msg)
 
 
-class ServerCommThread(controller.QTaskThread):
+def reduce_frames(frames, roi=None, binning=1, binning_mode="mean", dtype=None):
     """
-    Server communication thread controller.
+    Reduce 3D frames array.
 
-    Setup args:
-        - ``socket``: communication socket
-        - ``plugin``: :class:`ServerPlugin` instance used to fulfil requests
+    Args:
+        frames: 3D array with the frames (the first axis is the frame index)
+        roi: if not ``None``, a tuple ``(xmin,xmax,ymin,ymax)`` specifying the crop region
+            (`x` corresponds to the frame column and `y` to the frame row)
+        binning: spatial binning factor
+        binning_mode: binning mode; can be ``"mean"``, ``"sum"``, ``"min"``, ``"max"``, or ``"skip"``
+        dtype: if not ``None``, specifies the resulting dtype; by default, keep the frames dtype
+            (for ``"sum"`` binning of integer frames, use at least 4-byte integer to avoid overflow)
     """
-    def setup_task(self, socket, plugin):
-        super().setup_task()
-        self.socket=socket
-        self.socket.set_timeout(1.)
+    if roi is not None:
+        xmin,xmax,ymin,ymax=roi
+        frames=frames[:,ymin:ymax,xmin:xmax]
+    if binning>1:
+        src_dtype=frames.dtype
+        if binning_mode=="sum" and src_dtype.kind in "ui":
+            sum_dtype=np.dtype("{}{}".format(src_dtype.kind,max(src_dtype.itemsize,4)))
+            frames=filters.decimate(frames,binning,dec=lambda a, axis: np.sum(a,axis=axis,dtype=sum_dtype),axis=(1,2))
+        else:
+            frames=filters.decimate(frames,binning,dec=binning_mode,axis=(1,2))
+        if dtype is None and binning_mode=="mean" and frames.dtype!=src_dtype:
+            frames=(np.round(frames) if src_dtype.kind in "ui" else frames).astype(src_dtype)
+    if dtype is not None and frames.dtype!=dtype:
+        frames=frames.astype(dtype)
+    return frames
+
+
+class CompressedPayload:
+    """
+    Compressed message payload.
+
+    Args:
+        frames: list of 3D frame chunks with the same frame shape and dtype
+        compression: compression method; currently only ``"zlib"`` is supported
+        level: compression level
+    """
+    def __init__(self, frames, compression="zlib", level=1):
+        self.dtype=frames[0].dtype
+        self.shape=(sum(len(f) for f in frames),)+frames[0].shape[1:]
+        self.compression=compression
+        compressor=zlib.compressobj(level)
+        data=[compressor.compress(np.ascontiguousarray(f if f.dtype==self.dtype else f.astype(self.dtype))) for f in frames]
+        data.append(compressor.flush())
+        self.data=b"".join(data)
+        self.raw_nbytes=int(np.prod(self.shape))*self.dtype.itemsize
+    def decompress(self):
+        """Decompress the data into a 3D frames array (same as done by the receiving side)"""
+        return np.frombuffer(zlib.decompress(self.data),dtype=self.dtype).reshape(self.shape)
+
+
+class FrameRing:
+    """
+    Shared frame ring buffer with per-reader cursors.
+
+    Frames are stored by reference (without copying) and addressed by a sequence number, which increases by 1 for every received frame.
+    Each reader has its own cursor (sequence number of the next unread frame) and buffer size,
+    and the ring keeps enough frames to satisfy the largest reader buffer.
+    If a reader falls behind by more than its buffer size, the oldest unread frames are skipped and counted as overruns.
+    All methods are thread-safe.
+    """
+    def __init__(self):
+        self._lock=threading.Lock()
+        self._chunks=[]
+        self._starts=[]
+        self._head=0
+        self._size=0
+        self._readers={}
+        self._stream_cnt=StreamIDCounter()
+    def _update_size(self):
+        self._size=max([r["size"] for r in self._readers.values()],default=0)
+        self._trim()
+    def _trim(self):
+        """Remove chunks which are not required by any reader"""
+        tail=self._head-self._size
+        ntrim=0
+        while ntrim<len(self._chunks) and self._starts[ntrim]+len(self._chunks[ntrim][0])<=tail:
+            ntrim+=1
+        if ntrim:
+            del self._chunks[:ntrim]
+            del self._starts[:ntrim]
+    def _get_tail(self):
+        return self._starts[0] if self._starts else self._head
+    def add_message(self, msg):
+        """Add frames from a frames message to the ring"""
+        with self._lock:
+            if self._stream_cnt.receive_message(msg):
+                self._chunks=[]
+                self._starts=[]
+                for r in self._readers.values():
+                    r["cursor"]=self._head
+            chandim=msg.mi.chandim
+            t=time.time()
+            for frames,indices in zip(msg.frames,msg.indices):
+                if frames.ndim==2+chandim:
+                    frames=frames[None]
+                    indices=[indices]
+                if self._size>0:
+                    self._chunks.append((frames,np.asarray(indices),t))
+                    self._starts.append(self._head)
+                self._head+=len(frames)
+            self._trim()
+
+    def add_reader(self, name, size=0):
+        """Add a new reader with the given buffer size, or reset the existing one; the reader cursor is set to the newest frame"""
+        with self._lock:
+            self._readers[name]={"cursor":self._head,"size":max(size,0),"overruns":0}
+            self._update_size()
+    def remove_reader(self, name):
+        """Remove the reader"""
+        with self._lock:
+            if self._readers.pop(name,None) is not None:
+                self._update_size()
+    def setup_reader(self, name, size=None, clear=True):
+        """Change the reader buffer `size` (if not ``None``) and clear the unread frames (if ``clear==True``)"""
+        with self._lock:
+            r=self._readers[name]
+            if size is not None:
+                r["size"]=max(size,0)
+                self._update_size()
+            if clear:
+                r["cursor"]=self._head
+    def _get_range(self, name):
+        """Get the range of sequence numbers available to the reader, updating its cursor and overruns counter"""
+        r=self._readers[name]
+        start=max(r["cursor"],self._head-r["size"],self._get_tail())
+        if start>r["cursor"]:
+            r["overruns"]+=start-r["cursor"]
+            r["cursor"]=start
+        return start,self._head
+    def _get_slice(self, start, stop):
+        frames,indices=[],[]
+        i=max(bisect.bisect_right(self._starts,start)-1,0)
+        while i<len(self._chunks) and self._starts[i]<stop:
+            cframes,cindices,_=self._chunks[i]
+            a,b=max(start-self._starts[i],0),min(stop-self._starts[i],len(cframes))
+            if b>a:
+                frames.append(cframes[a:b] if (a,b)!=(0,len(cframes)) else cframes)
+                indices.append(cindices[a:b])
+            i+=1
+        return frames,indices
+    def get_status(self, name):
+        """
+        Get the reader status.
+
+        Return dictionary with the number of unread frames (``"filled"``), reader buffer size (``"size"``),
+        indices of the oldest and the newest unread frames (``"first_index"`` and ``"last_index"``),
+        total number of skipped frames (``"overruns"``), and time since the arrival of the oldest unread frame (``"lag_time"``).
+        """
+        with self._lock:
+            start,stop=self._get_range(name)
+            r=self._readers[name]
+            status={"filled":stop-start,"size":r["size"],"first_index":0,"last_index":0,"overruns":r["overruns"],"lag_time":0.}
+            if stop>start:
+                (_,(fidx,)),(_,(lidx,))=self._get_slice(start,start+1),self._get_slice(stop-1,stop)
+                status["first_index"],status["last_index"]=int(fidx[0]),int(lidx[0])
+                status["lag_time"]=time.time()-self._chunks[max(bisect.bisect_right(self._starts,start)-1,0)][2]
+            return status
+    def read(self, name, n=None, peek=False):
+        """
+        Read unread frames for the given reader.
+
+        If `n` is ``None``, read all frames; if ``n>=0``, read `n` oldest frames; otherwise, read `-n` newest frames and skip the rest.
+        If ``peek==True``, do not advance the reader cursor.
+        Return tuple ``(frames, indices)`` with the lists of 3D frame chunks and the corresponding 1D index arrays.
+        """
+        with self._lock:
+            start,stop=self._get_range(name)
+            if n is None:
+                rstart,rstop,cursor=start,stop,stop
+            elif n>=0:
+                rstart=start
+                rstop=cursor=min(start+n,stop)
+            else:
+                rstart,rstop,cursor=max(stop+n,start),stop,stop
+            if not peek:
+                self._readers[name]["cursor"]=cursor
+            return self._get_slice(rstart,rstop)
+
+
+class SharedFrameBuffer:
+    """
+    Shared memory buffer used to transfer frames to the clients on the same host.
+
+    The buffer consists of a header followed by the data area, which is filled with frame chunks in a ring-like fashion.
+    The header contains two little-endian 64-bit unsigned integers: the total number of bytes written so far (absolute write position),
+    and the data area size.
+    Each written chunk is described by a slot descriptor, which contains its offset from the buffer start, its absolute position, size, shape, and dtype.
+    The absolute write position is updated before the data is written, so the reader can check that the chunk data has not been overwritten
+    by comparing the absolute write position after reading it: the data is valid if the difference with the chunk position does not exceed the data area size.
+
+    Args:
+        size: data area size in bytes
+    """
+    header_size=64
+    alignment=64
+    def __init__(self, size):
+        self.size=size
+        self.shm=shared_memory.SharedMemory(create=True,size=self.header_size+size)
+        self._header=np.ndarray((2,),dtype="<u8",buffer=self.shm.buf)
+        self._header[:]=0,size
+        self._pos=0
+    def close(self):
+        """Close and remove the shared memory buffer"""
+        self._header=None
+        self.shm.close()
+        self.shm.unlink()
+    def get_description(self):
+        """Get the buffer description passed to the client"""
+        return {"name":self.shm.name,"size":self.size,"header_size":self.header_size}
+    def fits(self, chunks):
+        """Check if the given list of arrays fits into the buffer at the same time"""
+        return sum(c.nbytes+self.alignment for c in chunks)<=self.size
+    def write(self, chunks):
+        """Write the list of arrays into the buffer and return the list of their slot descriptors"""
+        slots=[]
+        for c in chunks:
+            c=np.ascontiguousarray(c)
+            offset=self._pos%self.size
+            if offset+c.nbytes>self.size:
+                self._pos+=self.size-offset
+                offset=0
+            pos=self._pos
+            self._pos+=-(-c.nbytes//self.alignment)*self.alignment
+            self._header[0]=self._pos
+            if c.nbytes:
+                np.ndarray(c.shape,dtype=c.dtype,buffer=self.shm.buf,offset=self.header_size+offset)[...]=c
+            slots.append({"offset":self.header_size+offset,"position":pos,"nbytes":c.nbytes,"shape":c.shape,"dtype":c.dtype.str})
+        return slots
+
+
+class ServerConnection:
+    """
+    Server connection handler.
+
+    Keeps the connection state (frame buffer readers, push streaming, shared memory transport), decodes incoming messages and processes requests.
+    Request processing is synchronous and can block (e.g., waiting for GUI or camera threads), so it is executed in one of the server worker threads.
+
+    Args:
+        plugin: :class:`ServerPlugin` instance used to fulfil requests
+        name: connection name (used to identify the connection frame readers)
+        peer_name: peer address
+    """
+    def __init__(self, plugin, name, peer_name):
         self.plugin=plugin
-        self.peer_name=socket.get_peer_name()
-        self.add_job("check_message",self.check_message,0,initial_call=False)
-        self.subscribe_commsync(self.receive_frames,**plugin.get_frame_stream_parameters())
-        self.frames_cnt=StreamIDCounter()
-        self.frames_accum=FramesAccumulator()
-        self.frames_accum_size=0
-    def finalize_task(self):
-        self.socket.close()
-        self.plugin.disconnect()
-        return super().finalize_task()
-
-    _key_types={"int":int, "str":py3.textstring, "float":(int,float)}
+        self.name=name
+        self.peer_name=peer_name
+        self.frame_ring=plugin.frame_ring
+        self.buffer_reader=self.name
+        self.push_reader=self.name+"/push"
+        self.frame_ring.add_reader(self.buffer_reader)
+        self.buffer_size=0
+        self.shm_buffer=None
+        self.encoding="json"
+        self.push_params=None
+        self._reset_push_counters()
+    def close(self):
+        """Close the connection and release its resources"""
+        self.push_params=None
+        self.frame_ring.remove_reader(self.buffer_reader)
+        self.frame_ring.remove_reader(self.push_reader)
+        if self.shm_buffer is not None:
+            self.shm_buffer.close()
+            self.shm_buffer=None
+
+    _key_types={"int":int, "str":py3.textstring, "float":(int,float), "dict":dict}
     def _check_value_type(self, value, dtype):
         if isinstance(dtype,tuple):
             if isinstance(value,(tuple,list)) and len(value)==len(dtype):
@@ -62,7 +320,7 @@ class ServerCommThread(controller.QTaskThread):
         Get a certain value in the message dictionary.
 
         If `branch` and `desc` are specified, they are used to generate error messages.
-        `dtype` can specify the expected value type: ``"int"``, ``"float"``, ``"str"``, a tuple, or a list of datatypes.
+        `dtype` can specify the expected value type: ``"int"``, ``"float"``, ``"str"``, ``"dict"``, a tuple, or a list of datatypes.
         """
         full_key="{}/{}".format(branch,key) if branch else key
         branch=" '{}'".format(branch) if branch else ""
@@ -79,89 +337,257 @@ class ServerCommThread(controller.QTaskThread):
         if error.desc:
             reply["parameters/description"]=error.desc
         return reply
-    def receive_frames(self, src, tag, msg):
-        """Receive camera frames and store them in the accumulator"""
-        if self.frames_cnt.receive_message(msg):
-            self.frames_accum.clear()
-        if self.frames_accum_size>0:
-            self.frames_accum.add_message(msg)
-            self.frames_accum.cut_to_size(self.frames_accum_size,from_end=True)
-        else:
-            self.frames_accum.clear()
+    def encode_message(self, msg, encoding=None):
+        """
+        Encode the message to be sent to the peer as a list of buffers: message header followed by the payload arrays.
 
-    def send_message(self, msg):
-        """Send a new message to the peer"""
+        The message payload can be either a numpy array, or a list of array chunks, which are sent sequentially along the first axis
+        (all chunks should have the same shape except for the first axis, and the same dtype).
+        The payload arrays are sent directly without making intermediate copies.
+        The payload can also be a :class:`CompressedPayload` instance.
+        `encoding` specifies the header encoding (``"json"`` or ``"msgpack"``); by default, use the currently negotiated connection encoding.
+        """
         msg=dictionary.as_dict(msg,style="nested")
-        payload=None
+        chunks=[]
         if "payload" in msg:
             payload=msg["payload"]
-            msg["payload"]={"shape":payload.shape,"dtype":payload.dtype.str,"nbytes":payload.nbytes}
-        self.socket.send_fixedlen(json.dumps(msg))
-        if payload is not None:
-            self.socket.send_fixedlen(payload.tobytes())
-    def recv_message(self):
-        """Receive a message from the peer"""
-        msg=json.loads(net.recv_JSON(self.socket))
+            if isinstance(payload,CompressedPayload):
+                chunks=[payload.data]
+                msg["payload"]={"shape":payload.shape,"dtype":payload.dtype.str,"nbytes":len(payload.data),"compression":payload.compression,"raw_nbytes":payload.raw_nbytes}
+            elif isinstance(payload,(list,tuple)):
+                chunks=[np.ascontiguousarray(c) for c in payload]
+                dtype=chunks[0].dtype
+                chunks=[c if c.dtype==dtype else c.astype(dtype) for c in chunks]
+                shape=(sum(len(c) for c in chunks),)+chunks[0].shape[1:]
+                msg["payload"]={"shape":shape,"dtype":dtype.str,"nbytes":sum(c.nbytes for c in chunks)}
+            else:
+                chunks=[np.ascontiguousarray(payload)]
+                msg["payload"]={"shape":payload.shape,"dtype":payload.dtype.str,"nbytes":chunks[0].nbytes}
+        if (encoding or self.encoding)=="msgpack":
+            header=msgpack.packb(msg,use_bin_type=True)
+            header=len(header).to_bytes(4,"little")+header
+        else:
+            header=json.dumps(msg).encode()
+        return [header]+chunks
+    def decode_header(self, data):
+        """Decode the received message header (for the ``"msgpack"`` encoding it should not include the length prefix)"""
+        if self.encoding=="msgpack":
+            try:
+                return msgpack.unpackb(data,raw=False)
+            except Exception:  # pylint: disable=broad-except
+                raise IncomingMessageError("wrong_format","Could not decode the incoming message")
+        return json.loads(data)
+    def decode_message(self, msg):
+        """
+        Decode the incoming message JSON header.
+
+        Return tuple ``(msg, payload)``, where `payload` is an empty array to be filled with the incoming payload data, or ``None`` if there is no payload.
+        """
         if not isinstance(msg,dict):
             raise IncomingMessageError("wrong_format","Wrong incoming message format",{"value":msg})
-        if list(msg)==["protocol"]:
-            return msg
+        if self.is_handshake(msg):
+            return msg,None
         msg=dictionary.Dictionary(msg)
+        payload=None
         if "payload" in msg:
             shape=self.get_message_key(msg["payload"],"shape","branch",dtype=["int"])
             dtype=self.get_message_key(msg["payload"],"dtype","branch",dtype="str")
-            nbytes=msg.get("payload/nbytes",np.prod(shape)*np.dtype(dtype).itemsize)
             try:
-                payload=self.socket.recv_fixedlen(nbytes)
-                payload=np.frombuffer(payload,dtype=dtype).reshape(shape)
+                payload=np.empty(shape,dtype=dtype)
+                nbytes=msg.get("payload/nbytes",payload.nbytes)
+                if nbytes!=payload.nbytes:
+                    raise ValueError("payload size {} does not agree with its shape and dtype".format(nbytes))
             except (TypeError,ValueError):
                 raise IncomingMessageError("wrong_type","Wrong payload specification",{"value":msg["payload"]})
-            except net.SocketTimeout:
-                raise IncomingMessageError("wrong_argument","Payload size is smaller than specified",{"value":nbytes})
             msg.add_entry("payload",payload,force=True)
-        return msg
-    def check_message(self):
-        """Check for incoming messages and reply if necessary"""
+        return msg,payload
+    def handle_message(self, msg, encoding=None):
+        """
+        Process the incoming message and generate the reply.
+
+        `msg` can also be an :exc:`IncomingMessageError` instance raised while receiving the message, in which case the error reply is generated.
+        `encoding` is the reply encoding; by default, use the current connection encoding.
+        It should be the encoding in effect when the message was received, since the handshake changes the connection encoding as soon as it is received, but its reply is still sent using the old one.
+        Return list of encoded reply buffers, or ``None`` if there is no reply.
+        """
+        mid=None
+        encoding=encoding or self.encoding
         try:
+            if isinstance(msg,IncomingMessageError):
+                raise msg
+            mid=msg.get("id",None)
+            reply=self.process_message(msg)
+            return None if reply is None else self.encode_message(reply,encoding=encoding)
+        except IncomingMessageError as error:
+            reply=self._build_error_message(error)
+        except Exception as error:  # pylint: disable=broad-except
+            reply=self.build_internal_error_message(error)
+        if mid is not None:
+            reply["id"]=mid
+        return self.encode_message(reply,encoding=encoding)
+    def build_internal_error_message(self, error):
+        """Build the error reply for an unexpected exception raised while processing the request"""
+        return self._build_error_message(IncomingMessageError("internal_error","{}: {}".format(type(error).__name__,error),{"value":type(error).__name__}))
+
+    def _reset_push_counters(self):
+        self.push_cnt={"sent":0,"batches":0,"unacked":0}
+        self._push_overruns_last=0
+    def get_push_messages(self):
+        """
+        Get encoded messages with the new frames from the ring, taking into account decimation, reduction, and flow control limits.
+
+        Return list of encoded messages, each of which is a list of buffers.
+        """
+        params=self.push_params
+        msgs=[]
+        while params is not None and (params["max_unacked"]<=0 or self.push_cnt["unacked"]<params["max_unacked"]):
+            chunks,chunk_indices=self.frame_ring.read(self.push_reader,n=params["batch_size"]*params["decimation"])
+            if not chunks:
+                break
+            batches=[]
+            for frames,indices in zip(*self._reduce_chunks(chunks,chunk_indices,params)):
+                if batches and batches[-1][0][0].shape[1:]==frames.shape[1:]:
+                    batches[-1][0].append(frames)
+                    batches[-1][1].append(indices)
+                else:
+                    batches.append(([frames],[indices]))
+            for frames,indices in batches:
+                indices=np.concatenate(indices)
+                nbatch=len(indices)
+                self.push_cnt["sent"]+=nbatch
+                self.push_cnt["batches"]+=1
+                self.push_cnt["unacked"]+=1
+                overruns=self.frame_ring.get_status(self.push_reader)["overruns"]
+                dropped=overruns-self._push_overruns_last
+                self._push_overruns_last=overruns
+                args={"first_index":int(indices[0]),"last_index":int(indices[-1]),"indices":indices.tolist(),"dropped":dropped,"total_dropped":overruns}
+                msg={"purpose":"stream","parameters":{"name":"stream/push/frames","args":args}}
+                self._pack_frames(msg["parameters"]["args"],frames,compression=params["compression"],compression_level=params["compression_level"])
+                if "payload" in msg["parameters"]["args"]:
+                    msg["payload"]=msg["parameters"]["args"].pop("payload")
+                msgs.append(self.encode_message(msg))
+        return msgs
+    def get_push_status(self):
+        """Get status of the push streaming"""
+        status={"enabled":self.push_params is not None,"queued":0,"dropped":0,"lag_time":0.}
+        if self.push_params is not None:
+            ring_status=self.frame_ring.get_status(self.push_reader)
+            status.update({"queued":ring_status["filled"],"dropped":ring_status["overruns"],"lag_time":ring_status["lag_time"]})
+        status.update(self.push_cnt)
+        return status
+
+    def is_handshake(self, msg):
+        return "protocol" in msg and "purpose" not in msg and "parameters" not in msg
+    def _is_local_peer(self):
+        ip=self.peer_name[0] if isinstance(self.peer_name,tuple) else self.peer_name
+        return ip in {"127.0.0.1","::1","localhost",self.plugin.ip}
+    def negotiate_encoding(self, msg):
+        """
+        Get the encoding requested by the handshake message, or ``None`` if it is not recognized.
+
+        Called in the receiving thread as soon as the handshake is received, since it defines the encoding of the following messages.
+        """
+        encoding=msg.get("encoding","json")
+        if encoding not in {"json","msgpack"}:
+            return None
+        return encoding if msgpack is not None else "json"
+    def process_handshake(self, msg):
+        """
+        Process the protocol handshake message.
+
+        If the message requests ``"shm"`` transport and the client is on the same host, set up the shared memory buffer for frames transfer.
+        If the message requests ``"msgpack"`` encoding and it is available, use it for all the following messages in both directions
+        (the connection encoding itself is switched on reception, see :meth:`negotiate_encoding`).
+        """
+        encoding=self.negotiate_encoding(msg)
+        if encoding is None:
+            encoding=msg.get("encoding")
+            raise IncomingMessageError("wrong_argument","Unrecognized encoding '{}'".format(encoding),{"key":"encoding","value":encoding})
+        reply={"protocol":"1.0","transport":"tcp","encoding":encoding}
+        if msg.get("transport","tcp")=="shm" and shared_memory is not None and self._is_local_peer():
+            size=msg.get("shm_size",self.plugin.shm_size)
+            if not isinstance(size,int) or size<=0:
+                raise IncomingMessageError("wrong_argument","Shared memory size should be a positive integer",{"key":"shm_size","value":size})
+            if self.shm_buffer is not None:
+                self.shm_buffer.close()
+                self.shm_buffer=None
+            self.shm_buffer=SharedFrameBuffer(size)
+            reply.update({"transport":"shm","shm":self.shm_buffer.get_description()})
+        return reply
+    def _pack_frames(self, result, frames, compression=None, compression_level=1):
+        """
+        Add frames to the result either as slot descriptors (for the shared memory transport, if they fit), or as a payload.
+
+        If `compression` is not ``None``, the payload is compressed (not applied to the shared memory transport).
+        """
+        if self.shm_buffer is not None and self.shm_buffer.fits(frames):
+            result["slots"]=self.shm_buffer.write(frames)
+        elif compression is not None:
+            result["payload"]=CompressedPayload(frames,compression=compression,level=compression_level)
+        else:
+            result["payload"]=frames
+        return result
+
+    def process_request(self, parameters):
+        """Process the request given its parameters (dictionary with ``"name"`` and ``"args"`` entries) and return the reply parameters"""
+        name=self.get_message_key(parameters,"name",branch="parameters",dtype="str")
+        args=parameters.get("args",{})
+        if not dictionary.is_dictionary(args,generic=True):
+            raise IncomingMessageError("wrong_type","Arguments must be a dictionary",{"value":args})
+        kind,rname=name.split("/",maxsplit=1) if name.find("/")>=0 else ("",name)
+        if kind=="gui":
+            result=self.process_gui_request(rname,args)
+        elif kind=="save":
+            result=self.process_save_request(rname,args)
+        elif kind=="cam":
+            result=self.process_cam_request(rname,args)
+        elif kind=="stream":
+            result=self.process_stream_request(rname,args)
+        elif kind=="status":
+            result=self.process_status_request(rname,args)
+        else:
+            raise IncomingMessageError("wrong_request","Unrecognized request '{}'".format(name),{"value":name})
+        if not dictionary.is_dictionary(result,generic=True):
+            result={"result":result}
+        result={"name":name,"args":result}
+        if "payload" in result["args"]:
+            result["payload"]=result["args"].pop("payload")
+        return result
+    def process_batch(self, parameters):
+        """
+        Process the batch of requests and return the reply parameters.
+
+        The requests are executed in order, and their replies (or errors, including unexpected internal errors) are collected in the ``"replies"`` list.
+        If ``"stop_on_error"`` is ``True`` (default), the remaining requests are skipped after the first error.
+        """
+        requests=self.get_message_key(parameters,"requests",branch="parameters",dtype=["dict"])
+        stop_on_error=bool(parameters.get("stop_on_error",True))
+        replies=[]
+        for r in requests:
             try:
-                msg=self.recv_message()
-                reply=self.process_message(msg)  # pylint: disable=assignment-from-none
+                result=self.process_request(dictionary.Dictionary(r))
+                if "payload" in result:
+                    raise IncomingMessageError("wrong_request","Requests with binary payload replies are not supported in a batch",{"value":result["name"]})
+                replies.append({"purpose":"reply","parameters":result})
             except IncomingMessageError as error:
-                reply=self._build_error_message(error)
-            if reply is not None:
-                self.send_message(reply)
-        except net.SocketTimeout:
-            pass
-        except net.SocketError:
-            self.stop()
-    
+                replies.append(self._build_error_message(error).as_dict(style="nested"))
+                if stop_on_error:
+                    break
+            except Exception as error:  # pylint: disable=broad-except
+                replies.append(self.build_internal_error_message(error).as_dict(style="nested"))
+                if stop_on_error:
+                    break
+        return {"name":"batch","args":{"replies":replies}}
     def process_message(self, msg):
         """Process the incoming message and generate the reply"""
-        if list(msg)==["protocol"]:
-            return {"protocol":"1.0"}
+        if self.is_handshake(msg):
+            return self.process_handshake(msg)
         purpose=msg.get("purpose","request")
         mid=msg.get("id",None)
         if purpose=="request":
-            name=self.get_message_key(msg,"parameters/name",dtype="str")
-            args=msg.get("parameters/args",{})
-            if not dictionary.is_dictionary(args,generic=True):
-                raise IncomingMessageError("wrong_type","Arguments must be a dictionary",{"value":args})
-            kind,rname=name.split("/",maxsplit=1) if name.find("/")>=0 else ("",name)
-            if kind=="gui":
-                result=self.process_gui_request(rname,args)
-            elif kind=="save":
-                result=self.process_save_request(rname,args)
-            elif kind=="cam":
-                result=self.process_cam_request(rname,args)
-            elif kind=="stream":
-                result=self.process_stream_request(rname,args)
-            else:
-                raise IncomingMessageError("wrong_request","Unrecognized request '{}'".format(name),{"value":name})
-            if not dictionary.is_dictionary(result,generic=True):
-                result={"result":result}
-            result={"name":name,"args":result}
-            if "payload" in result["args"]:
-                result["payload"]=result["args"].pop("payload")
+            result=self.process_request(self.get_message_key(msg,"parameters"))
+        elif purpose=="batch":
+            result=self.process_batch(self.get_message_key(msg,"parameters"))
         else:
             raise IncomingMessageError("wrong_purpose","Unrecognized purpose '{}'".format(purpose),{"value":purpose})
         if result is not None:
@@ -229,76 +655,372 @@ class ServerCommThread(controller.QTaskThread):
             self.plugin.cam_control(name,value=args)
             return "success"
         raise IncomingMessageError("wrong_request","Unrecognized camera request '{}'".format(name),{"value":name})
+    def process_status_request(self, name, args):
+        """Process software status-related request"""
+        if name=="instrumentation":
+            stages=self.plugin.get_instrumentation()
+            if "stage" in args:
+                stage=self.get_message_key(args,"stage",branch="parameters/args",dtype="str")
+                if stage not in stages:
+                    raise IncomingMessageError("wrong_argument","Could not find instrumented stage '{}'".format(stage),{"value":stage})
+                stages={stage:stages[stage]}
+            return {"stages":stages}
+        if name=="frame_pool":
+            return self.plugin.get_frame_pool_stats()
+        raise IncomingMessageError("wrong_request","Unrecognized status request '{}'".format(name),{"value":name})
     def process_stream_request(self, name, args):
         """Process data streaming/acquisition-related request"""
         if name=="buffer/setup":
             if "size" in args:
-                self.frames_accum_size=self.get_message_key(args,"size",branch="parameters/args",dtype="int")
-            elif self.frames_accum_size==0:
-                self.frames_accum_size=1
-            if self.frames_accum_size>0:
-                self.frames_accum.cut_to_size(self.frames_accum_size,from_end=True)
-            else:
-                self.frames_accum.clear()
+                self.buffer_size=self.get_message_key(args,"size",branch="parameters/args",dtype="int")
+            elif self.buffer_size==0:
+                self.buffer_size=1
+            self.frame_ring.setup_reader(self.buffer_reader,size=self.buffer_size,clear=False)
             return self.process_stream_request("buffer/status",{})
         elif name=="buffer/clear":
-            self.frames_accum.clear()
+            self.frame_ring.setup_reader(self.buffer_reader,clear=True)
             return self.process_stream_request("buffer/status",{})
         elif name=="buffer/status":
-            n=self.frames_accum.nframes()
-            if n:
-                _,fidx,_=self.frames_accum.get_slice(0,1,flatten=True)
-                _,lidx,_=self.frames_accum.get_slice(-1,flatten=True)
-                return {"filled":n,"size":self.frames_accum_size,"first_index":int(fidx[0]),"last_index":int(lidx[0])}
-            else:
-                return {"filled":0,"size":self.frames_accum_size,"first_index":0,"last_index":0}
+            return self.frame_ring.get_status(self.buffer_reader)
         elif name=="buffer/read":
             if "n" in args:
                 nread=self.get_message_key(args,"n",branch="parameters/args",dtype="int")
             else:
                 nread=None
-            n=self.frames_accum.nframes()
             peek=bool(args.get("peek",False))
-            if nread is None:
-                frames,indices,_=self.frames_accum.get_slice(0)
-                if not peek:
-                    self.frames_accum.clear()
-            elif nread>=0:
-                frames,indices,_=self.frames_accum.get_slice(0,nread)
-                if not peek:
-                    self.frames_accum.cut_to_size(max(0,n-nread),from_end=True)
-            else:
-                frames,indices,_=self.frames_accum.get_slice(nread,None)
-                if not peek:
-                    self.frames_accum.clear()
+            params=self._parse_frame_parameters(args,self._reduction_defaults)
+            frames,indices=self.frame_ring.read(self.buffer_reader,n=nread,peek=peek)
+            frames,indices=self._reduce_chunks(frames,indices,params)
             if frames:
-                if frames[0].ndim==3:
-                    payload=np.concatenate(frames)
-                    fidx=indices[0][0]
-                    lidx=indices[-1][-1]
-                else:
-                    payload=np.array(frames)
-                    fidx=indices[0]
-                    lidx=indices[-1]
+                fidx=indices[0][0]
+                lidx=indices[-1][-1]
             else:
-                payload=np.zeros((0,0,0),dtype="<u2")
+                frames=[np.zeros((0,0,0),dtype="<u2")]
                 fidx=lidx=0
-            return {"payload":payload,"first_index":int(fidx),"last_index":int(lidx)}
+            return self._pack_frames({"first_index":int(fidx),"last_index":int(lidx)},frames,compression=params["compression"],compression_level=params["compression_level"])
+        elif name=="push/start":
+            return self.process_push_start_request(args)
+        elif name=="push/stop":
+            status=self.get_push_status()
+            self.push_params=None
+            self.frame_ring.remove_reader(self.push_reader)
+            self._reset_push_counters()
+            status["enabled"]=False
+            return status
+        elif name=="push/ack":
+            n=self.get_message_key(args,"n",branch="parameters/args",dtype="int") if "n" in args else self.push_cnt["unacked"]
+            self.push_cnt["unacked"]=max(self.push_cnt["unacked"]-n,0)
+            return self.get_push_status()
+        elif name=="push/status":
+            return self.get_push_status()
+        raise IncomingMessageError("wrong_request","Unrecognized stream request '{}'".format(name),{"value":name})
+    _reduction_defaults={"decimation":1,"roi":None,"binning":1,"binning_mode":"mean","dtype":None,"compression":None,"compression_level":1}
+    _push_defaults=dict(_reduction_defaults,batch_size=100,queue_size=1000,max_unacked=0)
+    _param_types={"decimation":"int","roi":("int","int","int","int"),"binning":"int","binning_mode":"str","dtype":"str","compression":"str","compression_level":"int",
+        "batch_size":"int","queue_size":"int","max_unacked":"int"}
+    def _parse_frame_parameters(self, args, defaults):
+        """Parse and check frames transfer parameters (reduction, compression, batching) in the request arguments"""
+        params={}
+        for k,v in defaults.items():
+            params[k]=v if args.get(k) is None else self.get_message_key(args,k,branch="parameters/args",dtype=self._param_types[k])
+        for k in ["decimation","binning","batch_size","queue_size"]:
+            if k in params and params[k]<1:
+                raise IncomingMessageError("wrong_argument","Value '{}' should be positive".format(k),{"key":k,"value":params[k]})
+        if params["binning_mode"] not in {"mean","sum","min","max","skip"}:
+            raise IncomingMessageError("wrong_argument","Unrecognized binning mode '{}'".format(params["binning_mode"]),{"key":"binning_mode","value":params["binning_mode"]})
+        if params["dtype"] is not None:
+            try:
+                params["dtype"]=np.dtype(params["dtype"])
+            except TypeError:
+                raise IncomingMessageError("wrong_argument","Unrecognized dtype '{}'".format(params["dtype"]),{"key":"dtype","value":params["dtype"]})
+        if params["compression"] not in {None,"zlib"}:
+            raise IncomingMessageError("wrong_argument","Unrecognized compression '{}'".format(params["compression"]),{"key":"compression","value":params["compression"]})
+        if not 0<=params["compression_level"]<=9:
+            raise IncomingMessageError("wrong_argument","Compression level should be between 0 and 9",{"key":"compression_level","value":params["compression_level"]})
+        return params
+    def _reduce_chunks(self, chunks, chunk_indices, params):
+        """Apply temporal decimation and spatial reduction to the lists of frame chunks and the corresponding indices"""
+        rchunks,rindices=[],[]
+        for frames,indices in zip(chunks,chunk_indices):
+            if params["decimation"]>1:
+                sel=indices%params["decimation"]==0
+                if not np.any(sel):
+                    continue
+                frames,indices=frames[sel],indices[sel]
+            rchunks.append(reduce_frames(frames,roi=params["roi"],binning=params["binning"],binning_mode=params["binning_mode"],dtype=params["dtype"]))
+            rindices.append(indices)
+        return rchunks,rindices
+    def process_push_start_request(self, args):
+        """Process the push streaming start request"""
+        params=self._parse_frame_parameters(args,self._push_defaults)
+        self._reset_push_counters()
+        self.frame_ring.add_reader(self.push_reader,size=params["queue_size"])
+        self.push_params=params
+        return self.get_push_status()
             
 
 
 
 
+class ServerWorkerThread(controller.QTaskThread):
+    """
+    Server worker thread controller.
+
+    Executes request processing functions scheduled by :class:`AsyncServerCore`,
+    so that the calls to the GUI and other controller threads are performed from a controller thread.
+    """
+
+
+class AsyncServerCore:
+    """
+    Asyncio-based server core.
+
+    Runs an event loop in a separate thread, which accepts the connections and multiplexes all of them.
+    Messages are received and sent using non-blocking sockets directly from and into numpy arrays without intermediate copies.
+    Requests from each connection are processed in the order of arrival in one of the worker threads (assigned to the connection on creation),
+    and the reading continues while they are processed, so the clients can pipeline requests (send several requests without waiting for replies)
+    and match the replies using the message ``"id"``.
+    Frames in the push streaming mode are sent from the same event loop.
+
+    Args:
+        plugin: :class:`ServerPlugin` instance used to fulfil requests
+        workers: list of :class:`ServerWorkerThread` controllers used to process requests
+    """
+    def __init__(self, plugin, workers):
+        self.plugin=plugin
+        self.workers=workers
+        self.loop=None
+        self.thread=None
+        self.lsock=None
+        self.send_timeout=10.
+        self.push_poll_period=0.01
+        self.max_header_size=2**20
+        self._conn_idx=0
+        self._tasks=set()
+        self._stop_event=None
+        self._stop_requested=False
+
+    def start(self, ip, port, max_port=None):
+        """
+        Start the server on the first available port between `port` and `max_port` (by default, only try `port`).
+
+        Return the port number.
+        """
+        max_port=port+1 if max_port is None else max_port
+        while True:
+            try:
+                lsock=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+                lsock.bind((ip,port))
+                lsock.listen()
+                break
+            except OSError:
+                lsock.close()
+                port+=1
+                if port>=max_port:
+                    raise
+        lsock.setblocking(False)
+        self.lsock=lsock
+        self._stop_requested=False
+        self.loop=asyncio.new_event_loop()
+        self.thread=threading.Thread(target=self.loop.run_until_complete,args=(self._serve(),),daemon=True)
+        self.thread.start()
+        return port
+    def stop(self):
+        """Stop the server and close all connections"""
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self._request_stop)
+            self.thread.join()
+            self.loop.close()
+            self.thread=None
+
+    def _request_stop(self):
+        self._stop_requested=True
+        if self._stop_event is not None:  # otherwise, stop was requested before the serving has started
+            self._stop_event.set()
+    async def _serve(self):
+        self._stop_event=asyncio.Event()  # created inside the loop, since before Python 3.10 the event is bound to the loop on creation
+        if self._stop_requested:
+            self._stop_event.set()
+        accept_task=asyncio.ensure_future(self._accept())
+        await self._stop_event.wait()
+        accept_task.cancel()
+        for t in list(self._tasks):
+            t.cancel()
+        await asyncio.gather(accept_task,*self._tasks,return_exceptions=True)
+        self.lsock.close()
+    async def _accept(self):
+        while True:
+            sock,addr=await self.loop.sock_accept(self.lsock)
+            sock.setblocking(False)
+            task=asyncio.ensure_future(self._handle_connection(sock,addr))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _call_in_worker(self, worker, func, *args):
+        """Call the function in the worker thread and return a future with the result"""
+        future=self.loop.create_future()
+        def set_result(result):
+            if not future.done():
+                future.set_result(result)
+        def call():
+            try:
+                return (func(*args),None)
+            except Exception as err:  # pylint: disable=broad-except
+                return (None,err)
+        def callback(result):
+            self.loop.call_soon_threadsafe(set_result,result)
+        worker.call_in_thread_callback(call,callback=callback)  # keep the default interrupt=True: task threads only execute calls within their wait loops, so non-interrupt ("top loop") calls would never run
+        return future
+    async def _run_in_worker(self, worker, func, *args):
+        result,err=await self._call_in_worker(worker,func,*args)
+        if err is not None:
+            raise err
+        return result
+    async def _send(self, sock, lock, buffers):
+        async with lock:
+            for b in buffers:
+                b=memoryview(b).cast("B")
+                if len(b):
+                    await asyncio.wait_for(self.loop.sock_sendall(sock,b),self.send_timeout)
+    async def _recv_into(self, sock, buffer, view):
+        """Receive data into the `view` memoryview, first taking the data already received into the `buffer` bytearray"""
+        n=min(len(buffer),len(view))
+        view[:n]=buffer[:n]
+        del buffer[:n]
+        while n<len(view):
+            nrecv=await self.loop.sock_recv_into(sock,view[n:])
+            if nrecv==0:
+                raise ConnectionError("connection closed while receiving")
+            n+=nrecv
+    async def _recv_header(self, sock, buffer, conn):
+        """
+        Receive the message header into the `buffer` bytearray and return the decoded message.
+
+        Depending on the connection encoding, the header is either a JSON object, or a 4-byte little-endian length followed by the msgpack object.
+        """
+        start=0
+        while True:
+            if conn.encoding=="msgpack":
+                if len(buffer)>=4:
+                    size=int.from_bytes(buffer[:4],"little")
+                    if size>self.max_header_size:
+                        raise ConnectionError("incoming message is too large")
+                    if len(buffer)>=size+4:
+                        data=bytes(buffer[4:size+4])
+                        del buffer[:size+4]
+                        return conn.decode_header(data)
+            else:
+                end=buffer.find(b"}",start)
+                while end>=0:
+                    try:
+                        msg=conn.decode_header(buffer[:end+1])
+                        del buffer[:end+1]
+                        return msg
+                    except ValueError:
+                        end=buffer.find(b"}",end+1)
+                start=len(buffer)
+                if len(buffer)>self.max_header_size:
+                    raise ConnectionError("incoming message is too large")
+            data=await self.loop.sock_recv(sock,2**16)
+            if not data:
+                raise ConnectionError("connection closed while receiving")
+            buffer+=data
+    async def _push_frames(self, conn, worker, sock, lock):
+        while True:
+            if conn.push_params is not None:
+                for msg in await self._run_in_worker(worker,conn.get_push_messages):
+                    await self._send(sock,lock,msg)
+            await asyncio.sleep(self.push_poll_period)
+    async def _process_requests(self, conn, worker, sock, lock, queue):
+        while True:
+            msg,encoding=await queue.get()
+            try:
+                reply=await self._run_in_worker(worker,conn.handle_message,msg,encoding)
+            except Exception as error:  # pylint: disable=broad-except
+                reply=conn.build_internal_error_message(error)
+                if isinstance(msg,dict) and msg.get("id") is not None:
+                    reply["id"]=msg["id"]
+                reply=conn.encode_message(reply,encoding=encoding)
+            if reply is not None:
+                await self._send(sock,lock,reply)
+    async def _recv_message(self, conn, sock, buffer):
+        """
+        Receive the next message (or an :exc:`IncomingMessageError` instance if it is malformed) along with its payload.
+
+        Return tuple ``(msg, encoding)`` with the message and the encoding of its reply.
+        If the message is a handshake, switch the connection encoding right away, so that the following pipelined messages are decoded correctly.
+        """
+        encoding=conn.encoding
+        try:
+            msg,payload=conn.decode_message(await self._recv_header(sock,buffer,conn))
+            if payload is not None:
+                await self._recv_into(sock,buffer,memoryview(payload).cast("B"))
+            if conn.is_handshake(msg):
+                conn.encoding=conn.negotiate_encoding(msg) or encoding
+        except IncomingMessageError as error:
+            msg=error
+        return msg,encoding
+    async def _handle_connection(self, sock, addr):
+        worker=self.workers[self._conn_idx%len(self.workers)]
+        self._conn_idx+=1
+        conn=ServerConnection(self.plugin,"{}.conn{}".format(self.plugin.ctl.name,self._conn_idx),addr)
+        await self._run_in_worker(worker,self.plugin.connect)
+        lock=asyncio.Lock()
+        queue=asyncio.Queue()
+        tasks=[asyncio.ensure_future(self._process_requests(conn,worker,sock,lock,queue)),asyncio.ensure_future(self._push_frames(conn,worker,sock,lock))]
+        buffer=bytearray()
+        recv=None
+        try:
+            while True:
+                recv=asyncio.ensure_future(self._recv_message(conn,sock,buffer))
+                await asyncio.wait(tasks+[recv],return_when=asyncio.FIRST_COMPLETED)
+                if any(t.done() for t in tasks):  # sending failed (e.g., the peer is not reading), so the connection is closed
+                    break
+                await queue.put(recv.result())
+        except (OSError,asyncio.TimeoutError):
+            pass
+        finally:
+            if recv is not None:
+                tasks.append(recv)
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks,return_exceptions=True)
+            sock.close()
+            await self._run_in_worker(worker,conn.close)
+            await self._run_in_worker(worker,self.plugin.disconnect)
+
+
+
+
 class ServerPlugin(base.IPlugin):
     _class_name="server"
     _default_start_order=100
+    _headless_support=True
+    _default_port=18923
     def setup(self):
         self.setup_gui_sync()
-        self.thread_name_gen=general.NamedUIDGenerator()
-        self.ctl.add_job("listen",self.listen,0.1,initial_call=False)
-        self.port=self.parameters.get("port",18923)
+        self.port=self.parameters.get("port",self._default_port)
         self.ip=self.parameters.get("ip",net.get_local_addr())
+        self.shm_size=self.parameters.get("shm_size",2**28)
         self.nconn=0
+        self.frame_ring=FrameRing()
+        self.ctl.subscribe_direct(lambda src,tag,msg: self.frame_ring.add_message(msg),**self.get_frame_stream_parameters())
+        self.workers=[]
+        for i in range(self.parameters.get("workers",2)):
+            worker=ServerWorkerThread("{}.worker{}".format(self.ctl.name,i))
+            worker.start()
+            self.workers.append(worker)
+        self.core=AsyncServerCore(self,self.workers)
+        try:
+            self.port=self.core.start(self.ip,self.port,max_port=self.port+100)
+            self.update_gui(ip=(self.ip,self.port))
+        except OSError:
+            self.core=None
+    def cleanup(self):
+        if self.core is not None:
+            self.core.stop()
+        for worker in self.workers:
+            worker.stop()
     def setup_gui(self):
         self.table=self.gui.add_plugin_box("server","Server",index=100)
         self.table.add_text_label("ip",label="IP address")
@@ -306,28 +1028,16 @@ class ServerPlugin(base.IPlugin):
     
     @controller.call_in_gui_thread
     def update_gui(self, ip=None, nconn=0):
+        self.nconn+=nconn
+        if self.gui is None:
+            return
         if ip is not None:
             self.table.v["ip"]="{}:{}".format(*ip)
-        self.nconn+=nconn
         self.table.v["nconn"]=self.nconn
-    def listen(self):
-        """
-        Listen on the port for new connections.
-
-        Block the execution, so no other jobs/commands can be executed.
-        """
-        max_port=self.port+100
-        while self.port<max_port:
-            try:
-                self.update_gui(ip=(self.ip,self.port))
-                net.listen(self.ip,self.port,self.connect,wait_callback=self.ctl.check_messages)
-                break
-            except OSError:
-                self.port+=1
-    def connect(self, socket):
+    def connect(self):
         """Mark incoming connection"""
-        self.update_gui(nconn=1)
-        ServerCommThread(self.thread_name_gen(self.ctl.name+".comm_thread"),kwargs={"socket":socket,"plugin":self}).start()
+        if self._running:
+            self.update_gui(nconn=1)
     def disconnect(self):
         """Mark disconnection"""
         if self._running:
@@ -339,12 +1049,12 @@ class ServerPlugin(base.IPlugin):
         op,kind=action.split("/")
         if op=="set":
             if kind=="value":
-                self.gui.main_frame.set_value(name,value)
+                self.ctl.main_frame.set_value(name,value)
             else:
-                self.gui.main_frame.set_indicator(name,value)
+                self.ctl.main_frame.set_indicator(name,value)
         if kind=="value":
-            return self.gui.main_frame.get_value(name)
-        return self.gui.main_frame.get_indicator(name)
+            return self.ctl.main_frame.get_value(name)
+        return self.ctl.main_frame.get_indicator(name)
     def save_control(self, mode="full", start=True, source=None, params=None):
         """Perform save control operation"""
         self.guictl.call_thread_method("toggle_saving",mode,start=start,source=source,change_params=params,no_popup=True)
@@ -359,6 +1069,12 @@ class ServerPlugin(base.IPlugin):
             return self.extctls["camera"].v["parameters",name]
         if action=="param/set":
             self.extctls["camera"].cs.apply_parameters(value)
+    def get_instrumentation(self):
+        """Get the dictionary with the current statistics of all instrumented frame processing stages"""
+        return self.extctls["resource_manager"].cs.list_resources("instrumentation")
+    def get_frame_pool_stats(self):
+        """Get the dictionary with the frame buffer pool statistics"""
+        return frame_pool.get_stats()
     def get_frame_stream_parameters(self):
         """Get parameters required for the subscription to the camera source"""
         return {"srcs":self.extctls["preprocessor"].name,"tags":"frames/new"}
\ No newline at end of file
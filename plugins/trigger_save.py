@@ -1,14 +1,206 @@
 from . import base
 from pylablib.core.thread import controller
+from pylablib.devices.interface.camera import remove_status_line
 # from pylablib.devices import NI, Conrad
 
 import numpy as np
+import numba as nb
 import time
 
 
+@nb.njit(nogil=True)
+def _roi_max(frames, r0, r1, c0, c1, out):
+    for i in range(frames.shape[0]):
+        v=-np.inf
+        for r in range(r0,r1):
+            for c in range(c0,c1):
+                if frames[i,r,c]>v:
+                    v=frames[i,r,c]
+        out[i]=v
+@nb.njit(nogil=True)
+def _roi_mean(frames, r0, r1, c0, c1, out):
+    npx=max((r1-r0)*(c1-c0),1)
+    for i in range(frames.shape[0]):
+        v=0.
+        for r in range(r0,r1):
+            for c in range(c0,c1):
+                v+=frames[i,r,c]
+        out[i]=v/npx
+@nb.njit(nogil=True)
+def _roi_count(frames, pixel_threshold, r0, r1, c0, c1, out):
+    for i in range(frames.shape[0]):
+        v=0
+        for r in range(r0,r1):
+            for c in range(c0,c1):
+                if frames[i,r,c]>pixel_threshold:
+                    v+=1
+        out[i]=v
+@nb.njit(nogil=True)
+def _roi_diff(frames, prev, r0, r1, c0, c1, out):
+    npx=max((r1-r0)*(c1-c0),1)
+    for i in range(frames.shape[0]):
+        v=0.
+        for r in range(r0,r1):
+            for c in range(c0,c1):
+                d=float(frames[i,r,c])-float(prev[r,c] if i==0 else frames[i-1,r,c])
+                v+=d*d
+        out[i]=v/npx
+@nb.njit(nogil=True)
+def _rolling_zscore(values, length, state):
+    alpha=1./max(length,1)
+    for i in range(len(values)):
+        v=values[i]
+        mean,var,n=state[0],state[1],state[2]
+        values[i]=(v-mean)/np.sqrt(var) if (n>=length and var>0) else 0.
+        if n==0:
+            mean=v
+        else:
+            a=max(alpha,1./(n+1))
+            d=v-mean
+            mean+=a*d
+            var=(1-a)*(var+a*d*d)
+        state[0],state[1],state[2]=mean,var,n+1
+@nb.njit(nogil=True)
+def _hysteresis_trigger(values, threshold, release, min_duration, state):
+    pos=-1
+    for i in range(len(values)): # scan the whole chunk to keep track of the release events after triggering
+        v=values[i]
+        if state[0]==0: # armed
+            if v>threshold:
+                state[1]+=1
+                if state[1]>=min_duration:
+                    state[0]=1
+                    if pos<0:
+                        pos=i
+            else:
+                state[1]=0
+        elif v<=release: # triggered, waiting for release
+            state[0]=0
+            state[1]=0
+    return pos
+
+
+class ITriggerDetector:
+    """
+    Generic incremental frame trigger detector.
+
+    Calculates a single value for each frame within the ROI, and triggers when it crosses the threshold
+    and stays beyond it for at least `min_duration` consecutive frames.
+    After triggering, the detector is re-armed only when the value goes back beyond the threshold by at least `hysteresis`.
+
+    Args:
+        threshold: trigger threshold
+        direction: trigger direction; can be ``"above"`` (trigger when the value goes above the threshold) or ``"below"``
+        hysteresis: threshold hysteresis
+        min_duration: minimal number of consecutive frames beyond the threshold required for triggering
+    """
+    _kind=None
+    _caption=None
+    def __init__(self, threshold, direction="above", hysteresis=0, min_duration=1, **kwargs):
+        self.threshold=threshold
+        self.direction=direction
+        self.hysteresis=max(hysteresis,0)
+        self.min_duration=max(int(min_duration),1)
+        self.reset()
+    def reset(self):
+        """Reset detector state"""
+        self._state=np.zeros(2,dtype="i8")
+    def rearm(self):
+        """
+        Re-arm the detector after the trigger has been ignored (e.g., during the dead time or while saving is in progress).
+
+        The consecutive frames counter is kept, so the detector triggers again on the next frame beyond the threshold.
+        """
+        self._state[0]=0
+    def get_values(self, frames, roi):
+        """Get trigger values for a 3D frames array within the given ROI ``(r0,r1,c0,c1)``"""
+        raise NotImplementedError("ITriggerDetector.get_values")
+    def process(self, frames, roi):
+        """
+        Process 3D frames array within the given ROI ``(r0,r1,c0,c1)``.
+
+        Return the position of the frame at which the trigger condition got fulfilled, or -1 if there is no trigger.
+        Note that in the case of ``min_duration>1`` the triggering event starts ``min_duration-1`` frames earlier.
+        """
+        values=np.asarray(self.get_values(frames,roi),dtype="f8")
+        if self.direction=="above":
+            return _hysteresis_trigger(values,self.threshold,self.threshold-self.hysteresis,self.min_duration,self._state)
+        return _hysteresis_trigger(-values,-self.threshold,-self.threshold-self.hysteresis,self.min_duration,self._state)
+
+class MaxTriggerDetector(ITriggerDetector):
+    """Trigger detector based on the maximal pixel value within the ROI"""
+    _kind="max"
+    _caption="Maximal pixel"
+    def get_values(self, frames, roi):
+        values=np.zeros(len(frames))
+        _roi_max(frames,*roi,values)
+        return values
+class MeanTriggerDetector(ITriggerDetector):
+    """Trigger detector based on the mean pixel value within the ROI"""
+    _kind="mean"
+    _caption="ROI mean"
+    def get_values(self, frames, roi):
+        values=np.zeros(len(frames))
+        _roi_mean(frames,*roi,values)
+        return values
+class CountTriggerDetector(ITriggerDetector):
+    """Trigger detector based on the number of ROI pixels above `pixel_threshold`"""
+    _kind="count"
+    _caption="Pixel count"
+    def __init__(self, threshold, direction="above", hysteresis=0, min_duration=1, pixel_threshold=0, **kwargs):
+        super().__init__(threshold,direction=direction,hysteresis=hysteresis,min_duration=min_duration)
+        self.pixel_threshold=pixel_threshold
+    def get_values(self, frames, roi):
+        values=np.zeros(len(frames))
+        _roi_count(frames,self.pixel_threshold,*roi,values)
+        return values
+class DiffTriggerDetector(ITriggerDetector):
+    """Trigger detector based on the mean squared frame-to-frame difference within the ROI"""
+    _kind="diff"
+    _caption="Frame difference"
+    def reset(self):
+        super().reset()
+        self._prev_frame=None
+    def get_values(self, frames, roi):
+        values=np.zeros(len(frames))
+        if len(frames):
+            prev=self._prev_frame
+            if prev is None or prev.shape!=frames.shape[1:]:
+                prev=frames[0]
+            _roi_diff(frames,prev,*roi,values)
+            self._prev_frame=frames[-1].copy()
+        return values
+class ZScoreTriggerDetector(ITriggerDetector):
+    """
+    Trigger detector based on the rolling z-score of the ROI mean.
+
+    The baseline mean and standard deviation are calculated using exponential averaging over `baseline_length` frames.
+    """
+    _kind="zscore"
+    _caption="Rolling z-score"
+    def __init__(self, threshold, direction="above", hysteresis=0, min_duration=1, baseline_length=100, **kwargs):
+        self.baseline_length=max(int(baseline_length),1)
+        super().__init__(threshold,direction=direction,hysteresis=hysteresis,min_duration=min_duration)
+    def reset(self):
+        super().reset()
+        self._baseline_state=np.zeros(3)
+    def get_values(self, frames, roi):
+        values=np.zeros(len(frames))
+        _roi_mean(frames,*roi,values)
+        _rolling_zscore(values,self.baseline_length,self._baseline_state)
+        return values
+
+trigger_detectors={d._kind:d for d in [MaxTriggerDetector,MeanTriggerDetector,CountTriggerDetector,DiffTriggerDetector,ZScoreTriggerDetector]}
+
+
+
 class TriggerSavePlugin(base.IPlugin):
     """
-    Plugin for automatic starting of saving either on timer, or on maximal value of a plotted frame.
+    Plugin for automatic starting of saving either on timer, or on a frame-based condition.
+
+    The frame condition is evaluated by one of the detectors in :data:`trigger_detectors`.
+    Besides the display frame sources, the image trigger can use the raw frames stream (``"raw"`` source),
+    in which case all frames are checked, and the index of the triggering frame is passed to the saver.
     """
     _class_name="trigger_save"
     _default_start_order=10
@@ -19,6 +211,11 @@ class TriggerSavePlugin(base.IPlugin):
         self._trigger_display_time=0.5
         self.trig_modes=["timer","image"]
         self._frame_sources={}
+        self._raw_source_caption="Raw frames (all)"
+        self._detector=None
+        self._raw_subscription=None
+        self._raw_next_index=None
+        self._raw_skipped=0
         self.extctls["resource_manager"].cs.add_resource("process_activity","saving/"+self.full_name,ctl=self.ctl,
             caption="Trigger save",short_cap="Trg",order=10)
         self.setup_gui_sync()
@@ -38,9 +235,22 @@ class TriggerSavePlugin(base.IPlugin):
         self.table.add_combo_box("trigger_mode",options={m:trig_mode_names[m] for m in self.trig_modes},label="Trigger mode")
         self.table.add_num_edit("period",10,limiter=(.1,None,"coerce"),formatter=("float","auto",1),label="Timer period (s)")
         self.table.add_combo_box("frame_source",options=[],label="Trigger frame source")
+        self.table.add_combo_box("trigger_detector",options={k:d._caption for k,d in trigger_detectors.items()},label="Trigger detector")
+        self.table.add_combo_box("trigger_direction",options={"above":"Above","below":"Below"},label="Trigger direction")
         self.table.add_num_edit("image_trigger_threshold",0,formatter=("float","auto",4),label="Trigger threshold")
+        self.table.add_num_edit("pixel_threshold",0,formatter=("float","auto",4),label="Pixel threshold")
+        self.table.add_num_edit("baseline_length",100,limiter=(1,None,"coerce","int"),formatter="int",label="Baseline length (frames)")
+        self.table.add_num_edit("hysteresis",0,limiter=(0,None,"coerce"),formatter=("float","auto",4),label="Hysteresis")
+        self.table.add_num_edit("min_duration",1,limiter=(1,None,"coerce","int"),formatter="int",label="Min duration (frames)")
+        self.table.add_check_box("use_roi",caption="Restrict to ROI",value=False)
+        self.table.add_num_edit("roi_xmin",0,limiter=(0,None,"coerce","int"),formatter="int",label="ROI X min")
+        self.table.add_num_edit("roi_xmax",0,limiter=(0,None,"coerce","int"),formatter="int",label="ROI X max")
+        self.table.add_num_edit("roi_ymin",0,limiter=(0,None,"coerce","int"),formatter="int",label="ROI Y min")
+        self.table.add_num_edit("roi_ymax",0,limiter=(0,None,"coerce","int"),formatter="int",label="ROI Y max")
         self.table.add_num_edit("dead_time",10,limiter=(0,None,"coerce"),formatter=("float","auto",1),label="Dead time (s)")
         self.table.add_text_label("event_trigger_status","armed",label="Event trigger status: ")
+        self.table.add_text_label("trigger_frame_index","",label="Trigger frame index: ")
+        self.table.add_text_label("raw_frames_skipped","0",label="Skipped raw frames: ")
         self.table.add_toggle_button("enabled","Enabled",value=False)
         self.table.vs["limit_videos"].connect(lambda v: self.table.set_enabled("max_videos",v))
         self.table.set_enabled("max_videos",False)
@@ -56,11 +266,19 @@ class TriggerSavePlugin(base.IPlugin):
             self.table.set_enabled("period",trigger_mode=="timer")
             self.table.set_enabled("dead_time",trigger_mode!="timer")
             self.table.set_enabled("frame_source",trigger_mode=="image")
-            self.table.set_enabled("image_trigger_threshold",trigger_mode=="image")
+            for n in ["trigger_detector","trigger_direction","image_trigger_threshold","hysteresis","min_duration"]:
+                self.table.set_enabled(n,trigger_mode=="image")
+            self.table.set_enabled("pixel_threshold",trigger_mode=="image" and self.table.v["trigger_detector"]=="count")
+            self.table.set_enabled("baseline_length",trigger_mode=="image" and self.table.v["trigger_detector"]=="zscore")
+            self.table.set_enabled("use_roi",trigger_mode=="image")
+            for n in ["roi_xmin","roi_xmax","roi_ymin","roi_ymax"]:
+                self.table.set_enabled(n,trigger_mode=="image" and self.table.v["use_roi"])
             self.table.set_enabled("enabled",not (trigger_mode=="image" and self.table.v["frame_source"]==-1))
             self._update_trigger_status("armed")
         self.table.vs["trigger_mode"].connect(setup_gui_state)
         self.table.vs["frame_source"].connect(setup_gui_state)
+        self.table.vs["use_roi"].connect(setup_gui_state)
+        self.table.vs["trigger_detector"].connect(setup_gui_state)
         setup_gui_state()
 
     def _update_frame_sources(self, update_subscriptions=True, reset_value=None):
@@ -79,11 +297,13 @@ class TriggerSavePlugin(base.IPlugin):
         self._update_frame_sources_indicator(sources,reset_value=reset_value)
     @controller.call_in_gui_thread
     def _update_frame_sources_indicator(self, sources, reset_value=False):
-        index_values,options=zip(*[(n,v.get("caption",n)) for n,v in sources.items()])
+        index_values,options=zip(*([(n,v.get("caption",n)) for n,v in sources.items()]+[("raw",self._raw_source_caption)]))
         self.table.w["frame_source"].set_options(options=options,index_values=index_values,index=0 if reset_value else None)
     @controller.call_in_gui_thread
-    def _start_save(self, mode):
-        self.guictl.call_thread_method("toggle_saving",mode=mode,start=True,no_popup=True)
+    def _start_save(self, mode, trigger_frame_index=None):
+        self.guictl.call_thread_method("toggle_saving",mode=mode,start=True,no_popup=True,trigger_frame_index=trigger_frame_index)
+        if trigger_frame_index is not None:
+            self.table.v["trigger_frame_index"]=str(trigger_frame_index)
         self._acquired_videos+=1
         self.table.i["max_videos"]=self._acquired_videos
         if self._acquired_videos>=self.table.v["max_videos"] and self.table.v["limit_videos"]:
@@ -91,8 +311,24 @@ class TriggerSavePlugin(base.IPlugin):
     def _saving_in_progress(self):
         saving_status=self.extctls["resource_manager"].cs.get_resource("process_activity","saving/streaming").get("status","off")
         return saving_status!="off"
+    def _update_raw_subscription(self):
+        """Subscribe to the raw frames stream if it is used as the trigger frame source, and unsubscribe otherwise"""
+        use_raw=self.table.v["trigger_mode"]=="image" and self.table.v["frame_source"]=="raw"
+        if use_raw and self._raw_subscription is None:
+            self._raw_next_index=None
+            self._update_raw_skipped(0)
+            self._raw_subscription=self.ctl.subscribe_commsync(self.check_message_trigger,
+                srcs=self.extctls["preprocessor"].name,tags="frames/new",limit_queue=20)
+        elif not use_raw and self._raw_subscription is not None:
+            self.ctl.unsubscribe(self._raw_subscription)
+            self._raw_subscription=None
+    def _update_raw_skipped(self, skipped):
+        self._raw_skipped=skipped
+        if self.table.v["raw_frames_skipped"]!=str(skipped): # check (cached) value first to avoid unnecessary calls to GUI thread
+            self.table.v["raw_frames_skipped"]=str(skipped)
     def check_timer_trigger(self):
         """Check saving timer and start saving if it's passed"""
+        self._update_raw_subscription()
         enabled=self.table.v["enabled"]
         self.ctl.v["enabled"]=enabled
         if enabled and self.table.v["trigger_mode"]=="timer":
@@ -108,25 +344,94 @@ class TriggerSavePlugin(base.IPlugin):
     def _update_trigger_status(self, status):
         if self.table.v["event_trigger_status"]!=status: # check (cached) value first to avoid unnecessary calls to GUI thread
             self.table.v["event_trigger_status"]=status
-    def check_frame_trigger(self, src, frame):
-        """Check incoming image and start saving if it's passed"""
+    def _get_roi(self, shape):
+        """Get ROI boundaries ``(r0,r1,c0,c1)`` for the given frame shape (if `shape` is ``None``, return unbounded ROI)"""
+        if shape is None:
+            shape=(np.inf,np.inf)
+        if not self.table.v["use_roi"]:
+            return 0,shape[0],0,shape[1]
+        r0,r1=sorted([min(self.table.v[n],shape[0]) for n in ["roi_ymin","roi_ymax"]])
+        c0,c1=sorted([min(self.table.v[n],shape[1]) for n in ["roi_xmin","roi_xmax"]])
+        return r0,r1,c0,c1
+    def _get_detector(self, src):
+        """Get the trigger detector for the given source, creating a new one if the source or the detector parameters have changed"""
+        params={n:self.table.v[n] for n in ["trigger_direction","hysteresis","min_duration","pixel_threshold","baseline_length"]}
+        params["threshold"]=self.table.v["image_trigger_threshold"]
+        key=(src,self.table.v["trigger_detector"],tuple(sorted(params.items())),self._get_roi(None))
+        if self._detector is None or self._detector[0]!=key:
+            params["direction"]=params.pop("trigger_direction")
+            self._detector=(key,trigger_detectors[self.table.v["trigger_detector"]](**params))
+        return self._detector[1]
+    def _process_frames(self, src, frames, indices, step=1, chandim=0):
+        """
+        Process a 3D frames chunk with the given `indices` (array, first frame index, or ``None`` if unknown) using the source trigger detector.
+
+        Return the index of the frame starting the triggering event, -1 if the index is unknown, or ``None`` if no frame triggered.
+        """
+        r0,r1,c0,c1=self._get_roi(frames.shape[1:3])
+        if chandim:
+            chansize=int(np.prod(frames.shape[3:]))
+            frames=frames.reshape(frames.shape[:2]+(-1,))
+            c0,c1=c0*chansize,c1*chansize
+        detector=self._get_detector(src)
+        pos=detector.process(frames,(r0,r1,c0,c1))
+        if pos<0:
+            return None
+        if indices is None:
+            return -1
+        idx=int(indices[pos]) if np.ndim(indices) else int(indices)+pos*step
+        return idx-(detector.min_duration-1)*step
+    def _check_trigger(self, src, trigger_frame_index):
+        """
+        Check trigger for the frame source `src`.
+
+        `trigger_frame_index` is the triggering frame index, ``None`` if there is no trigger, or ``-1`` if the index is unknown.
+        """
         dead_time=self.table.v["dead_time"] if self.table.v["enabled"] else 0
         t=time.time()
+        started=False
+        if self._last_save_image is None or t>self._last_save_image+dead_time:
+            if trigger_frame_index is not None:
+                if not (self._saving_in_progress() or self._last_video) and self.table.v["enabled"]:
+                    self._start_save(self.table.v["save_mode"],trigger_frame_index=trigger_frame_index if trigger_frame_index>=0 else None)
+                    started=True
+                self._last_save_image=t
+        if trigger_frame_index is not None and not started and self._detector is not None:
+            self._detector[1].rearm() # the trigger is only consumed when the saving actually starts
+        if self._last_save_image is not None and t<self._last_save_image+self._trigger_display_time:
+            self._update_trigger_status("triggered")
+        elif self._last_save_image is not None and t<self._last_save_image+dead_time:
+            self._update_trigger_status("dead time")
+        else:
+            self._update_trigger_status("armed")
+    def check_frame_trigger(self, src, frame):
+        """Check incoming image and start saving if it's passed"""
         if self.table.v["trigger_mode"]=="image":
             if self.table.v["frame_source"]==src:
-                if self._last_save_image is None or t>self._last_save_image+dead_time:
-                    if np.any(frame>self.table.v["image_trigger_threshold"]):
-                        if not (self._saving_in_progress() or self._last_video) and self.table.v["enabled"]:
-                            self._start_save(self.table.v["save_mode"])
-                        self._last_save_image=t
-                if self._last_save_image is not None and t<self._last_save_image+self._trigger_display_time:
-                    self._update_trigger_status("triggered")
-                elif self._last_save_image is not None and t<self._last_save_image+dead_time:
-                    self._update_trigger_status("dead time")
-                else:
-                    self._update_trigger_status("armed")
+                trigger_frame_index=self._process_frames(src,frame[None],None,chandim=frame.ndim-2)
+                self._check_trigger(src,trigger_frame_index)
         else:
             self._last_save_image=None
+    def check_message_trigger(self, src, tag, msg):
+        """Check all frames in the incoming raw frames message and start saving if any of them passes"""
+        if self.table.v["trigger_mode"]!="image" or self.table.v["frame_source"]!="raw": # subscription has not been updated yet
+            return
+        first_index,step=msg.first_frame_index(),msg.mi.step or 1
+        if first_index is None:
+            return
+        if self._raw_next_index is not None and first_index>self._raw_next_index: # some messages were dropped from the full call queue
+            self._update_raw_skipped(self._raw_skipped+(first_index-self._raw_next_index)//step)
+        self._raw_next_index=msg.last_frame_index()+step
+        chandim=msg.mi.chandim
+        trigger_frame_index=None
+        for frames,indices in zip(msg.frames,msg.indices):
+            if frames.ndim==2+chandim:
+                frames=frames[None]
+            frames=remove_status_line(frames,msg.metainfo.get("status_line"),policy="cut",copy=False)
+            chunk_trigger_index=self._process_frames("raw",frames,indices,step=step,chandim=chandim)
+            if trigger_frame_index is None:
+                trigger_frame_index=chunk_trigger_index
+        self._check_trigger("raw",trigger_frame_index)
     
     @controller.call_in_gui_thread
     def toggle(self, enable=True):
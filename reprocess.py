@@ -0,0 +1,235 @@
+# Copyright (C) 2021  Alexey Shkarin
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import argparse
+if __name__=="__main__":
+    startdir=os.path.abspath(os.getcwd())
+    os.chdir(os.path.abspath(os.path.dirname(sys.argv[0])))
+    sys.path.append(os.path.abspath("."))  # set current folder to the file location and add it to the search path
+    parser=argparse.ArgumentParser(description="Offline reprocessing of the saved frames with the frame filters")
+    parser.add_argument("path",help="saved frames path (same as used for saving; a folder for the folder saving mode)")
+    parser.add_argument("--filter","-f",help="filter name, or a comma-separated list of names for a chain of filters",required=True)
+    parser.add_argument("--parameters","-p",help="filter parameters as a JSON dictionary {filter_name: {parameter: value}}",default="{}")
+    parser.add_argument("--output","-o",help="output path (by default, add '_processed' to the saved frames file name)",metavar="FILE")
+    parser.add_argument("--format",help="output format",choices=["raw","cam","tiff","bigtiff"],default="raw")
+    parser.add_argument("--step",help="generate an output frame every STEP input frames",type=int,default=1)
+    parser.add_argument("--start",help="first processed frame index",type=int,default=0)
+    parser.add_argument("--stop",help="last processed frame index (exclusive; by default, process all frames)",type=int,default=None)
+    parser.add_argument("--processes","-j",help="number of worker processes (by default, number of CPUs)",type=int,default=None)
+    parser.add_argument("--chunk-size",help="number of frames processed by a worker at once",type=int,default=1000)
+    args=parser.parse_args()
+
+from pylablib.core.fileio import savefile, table_stream
+from pylablib.core.utils import dictionary
+from pylablib.misc.file_formats import cam
+
+import json
+import math
+import multiprocessing
+import numpy as np
+import imageio
+
+from utils.services import saving, reader
+from plugins.filter import find_filter_class, setup_filter
+
+
+
+def load_filter_chain(names, parameters=None):
+    """
+    Create the chain of filters with the given names and set them up.
+
+    `parameters` is a dictionary ``{filter_name: {parameter: value}}`` with the filter parameters.
+    """
+    chain=[]
+    for n in names:
+        fctl=find_filter_class(n)()
+        setup_filter(fctl,(parameters or {}).get(n))
+        chain.append(fctl)
+    return chain
+
+def get_chain_history(chain, step=1):
+    """
+    Get the number of the preceding input frames which affect the output of the filter chain.
+
+    Return tuple ``(length, period)`` (see :meth:`.IFrameFilter.get_required_history`), or ``None`` if the frames have to be processed in a single sequence.
+    The filters after the first one receive a frame every `step` input frames, so their history is scaled accordingly;
+    since their phase also depends on the output of the preceding filters, they must not depend on the frame index (i.e., have the period of 1).
+    """
+    length,period=0,step
+    for i,fctl in enumerate(chain):
+        history=fctl.get_required_history()
+        if history is None or (i>0 and history[1]>1):
+            return None
+        scale=1 if i==0 else step
+        length+=history[0]*scale
+        period=period*history[1]*scale//math.gcd(period,history[1]*scale)
+    return length+step,period
+
+def get_filter_parameters(fctl):
+    """Get the current values of the filter parameters (excluding indicators)"""
+    return {p["name"]:fctl.p.get(p["name"]) for p in fctl.description.get("gui/parameters",[]) if not p.get("indicator",False) and p["kind"]!="button"}
+
+
+
+_open_frames={}  # opened frames in the worker process
+def process_range(path, path_kind, filters, parameters, step, origin, first, start, stop):
+    """
+    Process a range of frames with a newly created filter chain.
+
+    The frames from `first` to `start` are only used to fill the filters history; the output frames are generated for all frames from `start` to `stop`
+    whose index relative to the `origin` is one less than a multiple of `step`.
+    Return a list of tuples ``(index, frame)`` with the input frame index and the output frame.
+    """
+    if (path,path_kind) not in _open_frames:
+        _open_frames[path,path_kind]=reader.SavedDataset(path,path_kind=path_kind)
+    frames=_open_frames[path,path_kind]
+    chain=load_filter_chain(filters,parameters)
+    results=[]
+    pos=first
+    while pos<stop:
+        end=min(origin+((pos-origin)//step+1)*step,stop)
+        chain[0].receive_frames(frames[pos:end])
+        pos=end
+        if (end-origin)%step==0:
+            frame=chain[0].generate_frame()
+            for fctl in chain[1:]:
+                if frame is None:
+                    break
+                fctl.receive_frames(np.asarray(frame)[None])
+                frame=fctl.generate_frame()
+            if frame is not None and end>start:
+                results.append((end-1,np.asarray(frame)))
+    for fctl in chain:
+        fctl.cleanup()
+    return results
+def _process_task(task):
+    return process_range(*task)
+
+
+
+class FramesWriter:
+    """
+    Writer of the processed frames.
+
+    Uses the same formats and the same data types as the frame saver, so that the result can be opened in the same way as the original data.
+    """
+    def __init__(self, path, fmt="raw"):
+        self.path=path
+        self.format=fmt
+        self.saved=0
+        self.last_frame=None
+        self.save_dtype=None
+        self._tiff_writer=None
+        if os.path.exists(path):
+            os.remove(path)
+    def write(self, frames):
+        """Write a list of 2D frames"""
+        if not frames:
+            return
+        if self.format=="cam":
+            cam.save_cam(frames,self.path,append=True)
+            self.save_dtype="<u2"
+        elif self.format=="raw":
+            if self.save_dtype is None:
+                dtype=frames[0].dtype
+                self.save_dtype="<f8" if dtype.kind=="f" else (dtype.newbyteorder("<") if dtype.kind in "ui" else dtype)
+            with open(self.path,"ab") as f:
+                for frm in frames:
+                    np.asarray(frm,self.save_dtype).tofile(f)
+        else:
+            frames=[f.astype("float32") if f.dtype=="float64" else f for f in frames]
+            if self._tiff_writer is None:
+                self._tiff_writer=imageio.get_writer(self.path,format="tiff",bigtiff=self.format=="bigtiff",mode="V")
+            for frm in frames:
+                self._tiff_writer.append_data(frm)
+            self.save_dtype=frames[-1].dtype
+        self.saved+=len(frames)
+        self.last_frame=frames[-1]
+    def close(self):
+        """Finish writing"""
+        if self._tiff_writer is not None:
+            self._tiff_writer.close()
+            self._tiff_writer=None
+
+
+
+def get_output_path(path, path_kind="pfx", fmt="raw"):
+    """Get the default output path for the given saved frames path"""
+    main_path=saving.build_path(path,path_kind=path_kind)
+    return os.path.splitext(main_path)[0]+"_processed"+saving.default_ext[fmt]
+
+def reprocess(path, filters, parameters=None, output=None, fmt="raw", step=1, start=0, stop=None, processes=None, chunk_size=1000, path_kind=None):
+    """
+    Process the saved frames with the chain of filters and save the result.
+
+    The frames are split into chunks of `chunk_size` frames (rounded up to the filters period) and processed in `processes` worker processes;
+    each chunk is preceded by the frames required to fill the filters history (see :func:`get_chain_history`), so the result is the same as for the sequential processing.
+    An output frame is generated every `step` input frames, starting from `start`.
+    Along with the frames, the output includes the settings file (with the processing parameters and the original settings in the ``source`` branch)
+    and the frame info file containing the indices of the input frames corresponding to the output frames.
+    Return the output path.
+    """
+    frames=reader.SavedDataset(path,path_kind=path_kind)
+    path_kind=frames.path_kind
+    stop=len(frames) if stop is None else min(stop,len(frames))
+    start=max(start,0)
+    chain=load_filter_chain(filters,parameters)
+    history=get_chain_history(chain,step)
+    if history is None or stop<=start:
+        tasks=[(start,start,stop)]
+    else:
+        length,period=history
+        chunk_size=max(-(-chunk_size//period)*period,period)
+        tasks=[(start+max((s-start-length)//period,0)*period,s,min(s+chunk_size,stop)) for s in range(start,stop,chunk_size)]
+    tasks=[(path,path_kind,filters,parameters,step,start)+t for t in tasks]
+    output=output or get_output_path(path,path_kind=path_kind,fmt=fmt)
+    writer=FramesWriter(output,fmt=fmt)
+    info_path=saving.build_path(output,subpath="frameinfo",ext="dat")
+    if os.path.exists(info_path):
+        os.remove(info_path)
+    info=table_stream.TableStreamFile(info_path,columns=["save_index","source_index"],header_prepend="")
+    processes=min(processes or os.cpu_count() or 1,len(tasks))
+    pool=multiprocessing.Pool(processes) if processes>1 else None
+    try:
+        results=pool.imap(_process_task,tasks) if pool is not None else map(_process_task,tasks)
+        for res in results:
+            if res:
+                info.write_multiple_rows([[writer.saved+i,idx] for i,(idx,_) in enumerate(res)])
+                writer.write([frm for _,frm in res])
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    settings=dictionary.Dictionary()
+    settings["save"]={"path":output,"path_kind":"pfx","format":fmt,"saved":writer.saved}
+    if writer.last_frame is not None:
+        settings["save/frame/shape"]=writer.last_frame.shape
+        settings["save/frame/dtype"]=np.dtype(writer.save_dtype).str
+    settings["reprocess"]={"source":path,"source_path_kind":path_kind,"filters":list(filters),"step":step,"start":start,"stop":stop,
+        "parameters":{n:get_filter_parameters(fctl) for n,fctl in zip(filters,chain)}}
+    settings["source"]=frames.settings
+    savefile.save_dict(settings,saving.build_path(output,subpath="settings",ext="dat"))
+    return output
+
+
+
+if __name__=="__main__":
+    path=reprocess(os.path.join(startdir,args.path),[f.strip() for f in args.filter.split(",")],parameters=json.loads(args.parameters),
+        output=os.path.join(startdir,args.output) if args.output else None,fmt=args.format,step=args.step,start=args.start,stop=args.stop,
+        processes=args.processes,chunk_size=args.chunk_size)
+    print("Saved processed frames to {}".format(path))
@@ -1,3 +1,9 @@
-from .loader import find_camera_descriptors
+from .loader import find_camera_descriptors, find_camera_descriptor, find_camera_kinds
 
-camera_descriptors=find_camera_descriptors()
\ No newline at end of file
+def __getattr__(name):
+    # discover all camera descriptors only on the first access, since this imports all the camera device backends
+    if name=="camera_descriptors":
+        global camera_descriptors  # pylint: disable=global-variable-undefined
+        camera_descriptors=find_camera_descriptors()
+        return camera_descriptors
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__,name))
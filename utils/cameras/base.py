@@ -10,7 +10,7 @@ class ICameraDescriptor:
 
     Includes method to detect cameras of the given type, start threads, and create GUI (settings control and status display).
     """
-    _cam_kind=None
+    _cam_kind=None  # should be assigned as a string literal in the class body, so that the module can be found without importing it
     _expands=None
     def __init__(self, name, settings=None):
         self.name=name
@@ -89,8 +89,13 @@ class ICameraDescriptor:
         return self.get_kind_name(),self.settings.get("display_name",self.name)
     @classmethod
     def get_class_settings(cls):
-        """Get dictionary with generic class settings"""
-        return {"allow_garbage_collection":True}
+        """
+        Get dictionary with generic class settings.
+
+        Includes ``"allow_garbage_collection"`` (if ``False``, the periodic garbage collection is disabled)
+        and ``"garbage_collection_policy"`` (dictionary with the collection policy parameters, see :class:`.services.GarbageCollector`).
+        """
+        return {"allow_garbage_collection":True,"garbage_collection_policy":{}}
 
     def make_thread(self, name):
         """Create camera thread with the given name"""
@@ -3,25 +3,71 @@ from .base import ICameraDescriptor
 from pylablib.core.utils import files as file_utils, string as string_utils
 
 import os
+import re
 import sys
 import importlib
 
 folder=os.path.dirname(__file__)
 root_module_name=__name__.rsplit(".",maxsplit=1)[0]
-def find_camera_descriptors():
-    """Find all camera descriptor classes"""
+def _list_camera_files():
     files=file_utils.list_dir_recursive(folder,file_filter=r".*\.py$",visit_folder_filter=string_utils.get_string_filter(exclude="__pycache__")).files
+    return [f for f in files if f not in ["__init__.py","base.py","loader.py"]]
+def _load_camera_module(f):
+    module_name="{}.{}".format(root_module_name,os.path.splitext(f)[0].replace("\\",".").replace("/","."))
+    if module_name not in sys.modules:
+        spec=importlib.util.spec_from_file_location(module_name,os.path.join(folder,f))
+        mod=importlib.util.module_from_spec(spec)
+        sys.modules[module_name]=mod
+        try:
+            spec.loader.exec_module(mod)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+    return sys.modules[module_name]
+def _get_module_descriptors(mod):
+    return {v._cam_kind:v for v in mod.__dict__.values()
+        if isinstance(v,type) and issubclass(v,ICameraDescriptor) and v is not ICameraDescriptor and v._cam_kind is not None}
+
+def find_camera_descriptors():
+    """Find all camera descriptor classes (imports all camera modules)"""
     cam_classes={}
-    for f in files:
-        if f not in ["__init__.py","base.py"]:
-            module_name="{}.{}".format(root_module_name,os.path.splitext(f)[0].replace("\\",".").replace("/","."))
-            if module_name not in sys.modules:
-                spec=importlib.util.spec_from_file_location(module_name,os.path.join(folder,f))
-                mod=importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(mod)
-                sys.modules[module_name]=mod
-            mod=sys.modules[module_name]
-            for v in mod.__dict__.values():
-                if isinstance(v,type) and issubclass(v,ICameraDescriptor) and v is not ICameraDescriptor and v._cam_kind is not None:
-                    cam_classes[v._cam_kind]=v
-    return cam_classes
\ No newline at end of file
+    for f in _list_camera_files():
+        cam_classes.update(_get_module_descriptors(_load_camera_module(f)))
+    return cam_classes
+
+
+_cam_kind_pattern=re.compile(r"^[ \t]+_cam_kind\s*=\s*[\"'](\w+)[\"']",re.MULTILINE)
+_cam_kind_manifest={}
+def find_camera_kinds():
+    """
+    Find camera kinds defined in the camera modules without importing them.
+
+    Return dictionary ``{kind: file}`` with the module file paths relative to the cameras folder.
+    The result is obtained by scanning the module sources for ``_cam_kind`` definitions, and is cached based on the file modification times.
+    """
+    kinds={}
+    for f in _list_camera_files():
+        path=os.path.join(folder,f)
+        mtime=os.path.getmtime(path)
+        if f not in _cam_kind_manifest or _cam_kind_manifest[f][0]!=mtime:
+            with open(path,encoding="utf-8") as src:
+                _cam_kind_manifest[f]=(mtime,_cam_kind_pattern.findall(src.read()))
+        for k in _cam_kind_manifest[f][1]:
+            kinds.setdefault(k,f)
+    return kinds
+def find_camera_descriptor(kind):
+    """
+    Find the camera descriptor class for the given camera kind.
+
+    Only import the module which defines this kind (along with its device backend); if it is not found there, fall back to the full discovery.
+    Raise :exc:`KeyError` if the kind is not found.
+    """
+    f=find_camera_kinds().get(kind)
+    if f is not None:
+        desc=_get_module_descriptors(_load_camera_module(f)).get(kind)
+        if desc is not None:
+            return desc
+    cam_classes=find_camera_descriptors()
+    if kind not in cam_classes:
+        raise KeyError("unknown camera kind: {}".format(kind))
+    return cam_classes[kind]
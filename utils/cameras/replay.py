@@ -0,0 +1,126 @@
+from pylablib.thread.devices.generic.camera import GenericCameraThread
+
+from .sim import SimulatedCamera, SimulatedCameraThread, SimulatedCameraDescriptor, TDeviceInfo
+from ..services.framepool import frame_pool
+from ..services import reader
+from ..services.reader import get_saved_frames_files, load_saved_settings, get_saved_format
+
+import mmap
+import numpy as np
+
+
+
+def get_saved_frame_rate(settings):
+    """Get the original frame rate from the saved settings, or ``None`` if it can not be determined"""
+    try:
+        nframes=settings["save/last_frame_index"]-settings["save/first_frame_index"]
+        dt=settings["save/last_frame_timestamp"]-settings["save/first_frame_timestamp"]
+        if nframes>0 and dt>0:
+            return nframes/dt
+    except (KeyError,TypeError):
+        pass
+    for k in ["cam/settings/frame_period","cam/settings_start/frame_period"]:
+        if settings.get(k):
+            return 1./settings[k]
+    return None
+
+
+
+
+class ReplayCamera(SimulatedCamera):
+    """
+    Camera replaying previously saved frames.
+
+    The frames are memory-mapped (see :mod:`.services.reader`), read on request, and the following frames are prefetched by the OS.
+
+    Args:
+        path: saving path of the frames (same as the one used for saving, not including the file index for the split files)
+        path_kind: saving path kind (``"pfx"`` or ``"folder"``)
+        speed: replay speed relative to the original frame rate
+        fps: replay frame rate; if ``None``, use the original frame rate determined from the saved settings
+        loop: if ``True``, restart from the beginning after the last frame; otherwise, stop producing frames
+        readahead: number of frames to prefetch after the last read frame
+    """
+    def __init__(self, path, path_kind="pfx", speed=1., fps=None, loop=True, readahead=100):
+        self._path=path
+        self._path_kind=path_kind
+        settings=load_saved_settings(path,path_kind=path_kind)
+        files=get_saved_frames_files(path,path_kind=path_kind)
+        fmt=get_saved_format(files[0],settings) if files else None
+        shape=settings.get("save/frame/shape")
+        dtype=settings.get("save/frame/dtype","<u2")
+        self._sources=[reader.map_file(f,fmt,shape=shape,dtype=dtype) for f in files]
+        self._sources=[s for s in self._sources if len(s[0])]
+        if not self._sources:
+            raise IOError("could not find saved frames at {}".format(path))
+        self._chunk_starts=np.cumsum([0]+[len(s[0]) for s in self._sources])
+        self._nframes_total=int(self._chunk_starts[-1])
+        frame_shape=self._sources[0][0].shape[1:]
+        self._default_image_dtype=self._sources[0][0].dtype.str
+        self._loop=loop
+        self._readahead=readahead
+        super().__init__(size=(frame_shape[1],frame_shape[0]))
+        fps=fps or get_saved_frame_rate(settings) or 100.
+        self._exposure=max(1./(fps*speed),self._min_exposure)
+    def _get_connection_parameters(self):
+        return (self._path,self._path_kind)
+
+    def get_device_info(self):
+        return TDeviceInfo("replay",)
+
+    _min_exposure=1E-6
+    def _get_acquired_frames(self):
+        acquired=super()._get_acquired_frames()
+        if acquired is not None and not self._loop:
+            acquired=min(acquired,self._nframes_total)
+        return acquired
+
+    def _prefetch(self, cidx, start):
+        """Advise the OS to prefetch `readahead` frames in the chunk `cidx` starting from the frame `start`"""
+        frames,mm,offset=self._sources[cidx]
+        if mm is None or not hasattr(mm,"madvise") or start>=len(frames):
+            return
+        stride=frames.strides[0]
+        pstart=offset+start*stride
+        pend=offset+min(start+self._readahead,len(frames))*stride
+        pstart-=pstart%mmap.PAGESIZE
+        mm.madvise(mmap.MADV_WILLNEED,pstart,pend-pstart)
+    def _read_frames(self, rng, return_info=False):
+        c0,c1,r0,r1=self._roi
+        frames=[]
+        i=rng[0]
+        while i<rng[1]:
+            fidx=i%self._nframes_total
+            cidx=int(np.searchsorted(self._chunk_starts,fidx,side="right"))-1
+            start=fidx-self._chunk_starts[cidx]
+            n=min(rng[1]-i,self._chunk_starts[cidx+1]-fidx)
+            chunk=self._sources[cidx][0][start:start+n,r0:r1,c0:c1]
+            frames.append(frame_pool.get(chunk.shape,chunk.dtype))
+            np.copyto(frames[-1],chunk)
+            i+=n
+        if self._readahead>0:
+            self._prefetch(cidx,start+n)
+        return frames,None
+
+
+
+class ReplayCameraThread(GenericCameraThread):
+    """Device thread for a replay camera"""
+    parameter_variables=SimulatedCameraThread.parameter_variables
+    def connect_device(self):
+        self.device=ReplayCamera(**self.replay_options)
+    def setup_task(self, path, path_kind="pfx", speed=1., fps=None, loop=True, readahead=100, remote=None, misc=None):  # pylint: disable=arguments-differ
+        self.replay_options={"path":path,"path_kind":path_kind,"speed":speed,"fps":fps,"loop":loop,"readahead":readahead}
+        super().setup_task(remote=remote,misc=misc)
+
+
+
+
+class ReplayCameraDescriptor(SimulatedCameraDescriptor):
+    _cam_kind="replay"
+
+    def get_kind_name(self):
+        return "Replay camera"
+
+    def make_thread(self, name):
+        return ReplayCameraThread(name=name,kwargs=self.settings["params"].as_dict())
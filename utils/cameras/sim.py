@@ -1,7 +1,9 @@
 from pylablib.devices.interface import camera
+from pylablib.devices.interface.camera import TStatusLineDescription
 from pylablib.thread.devices.generic.camera import GenericCameraThread
 
 from .base import ICameraDescriptor
+from ..services.framepool import frame_pool
 from ..gui.base_cam_ctl_gui import GenericCameraSettings_GUI, GenericCameraStatus_GUI
 
 import time
@@ -26,6 +28,7 @@ class SimulatedCamera(camera.IROICamera, camera.IExposureCamera):
         self._exposure=.1
         self._opened=False
         self._acquistion_started=None
+        self._base_frame=None
         self.open()
         self._add_info_variable("device_info",self.get_device_info)
         
@@ -100,13 +103,15 @@ class SimulatedCamera(camera.IROICamera, camera.IExposureCamera):
         roi=self.get_roi()
         return (roi[3]-roi[2]),(roi[1]-roi[0])
     _support_chunks=True
+    _base_frame_mag=1024
     def _get_base_frame(self):
-        """Generate the base static noise-free frame"""
-        xs,ys=np.meshgrid(np.arange(self._size[0]),np.arange(self._size[1]),indexing="ij")
-        ip,jp=self._size[0]/2,self._size[1]/2
-        iw,jw=self._size[0]/10,self._size[0]/20
-        mag=1024
-        return np.exp(-(xs-ip)**2/(2*iw**2)-(ys-jp)**2/(2*jw**2))*mag
+        """Generate the base static noise-free frame (cached after the first call)"""
+        if self._base_frame is None or self._base_frame.shape!=(self._size[1],self._size[0]):
+            xs,ys=np.meshgrid(np.arange(self._size[1]),np.arange(self._size[0]),indexing="ij")
+            ip,jp=self._size[1]/2,self._size[0]/2
+            iw,jw=self._size[0]/10,self._size[0]/20
+            self._base_frame=np.exp(-(xs-ip)**2/(2*iw**2)-(ys-jp)**2/(2*jw**2))*self._base_frame_mag
+        return self._base_frame
     def _read_frames(self, rng, return_info=False):
         c0,c1,r0,r1=self._roi
         base=self._get_base_frame()[r0:r1,c0:c1].astype(self._default_image_dtype)
@@ -114,6 +119,122 @@ class SimulatedCamera(camera.IROICamera, camera.IExposureCamera):
 
 
 
+
+def get_status_lines(frames):
+    """
+    Get frame stamps from the status lines of the benchmark simulated camera frames.
+
+    The stamp is stored in the first 8 pixels of the first row as little-endian base-256 digits.
+    """
+    if isinstance(frames,list):
+        return [get_status_lines(f) for f in frames]
+    sline=frames[...,0,:8].astype("i8")&0xFF
+    return (sline<<(8*np.arange(8))).sum(axis=-1)
+class StatusLineChecker(camera.StatusLineChecker):
+    def get_framestamp(self, frames):
+        return get_status_lines(frames)
+
+TBenchmarkFrameInfo=collections.namedtuple("TBenchmarkFrameInfo",["frame_index","timestamp_us"])
+class BenchmarkSimulatedCamera(SimulatedCamera):
+    """
+    High-rate simulated camera for benchmarking.
+
+    The frames are taken from a pool of precomputed noisy frames, which is built once for the given ROI and data type.
+    By default, the returned frames are read-only views into this pool, so reading does not depend on the frame size.
+
+    Args:
+        size: full "sensor" size
+        fps: initial frame rate
+        dtype: frames data type
+        pool_size: number of different precomputed frames in the pool
+        events: if not ``None``, a dictionary describing periodically injected events (bright spot in the frame center);
+            contains values ``"period"`` (event period in frames), ``"length"`` (event duration in frames; default is 1), and ``"amplitude"`` (spot amplitude; default is 1024)
+        drop_period: if not zero, simulate a dropped frame after every `drop_period` frames (the frame is skipped in the status line and frame info indices)
+        status_line: if ``True``, write the frame stamp into the first 8 pixels of the first row (requires copying the frames)
+        copy_frames: if ``True``, return copies of the pool frames instead of views
+    """
+    def __init__(self, size=(1024,1024), fps=100, dtype="<u2", pool_size=32, events=None, drop_period=0, status_line=False, copy_frames=False):
+        self._default_image_dtype=np.dtype(dtype).str
+        self._pool_size=max(int(pool_size),1)
+        events=events or {}
+        self._event_period=int(events.get("period",0))
+        self._event_length=min(int(events.get("length",1)),self._event_period)
+        self._event_amplitude=events.get("amplitude",1024)
+        self._drop_period=int(drop_period)
+        self._status_line=status_line
+        self._copy_frames=copy_frames or status_line
+        self._pools=None
+        self._pools_key=None
+        super().__init__(size=size)
+        self._exposure=max(1./fps,self._min_exposure)
+
+    def get_device_info(self):
+        return TDeviceInfo("simulated_benchmark",)
+    
+    _min_exposure=1E-6
+    _TFrameInfo=TBenchmarkFrameInfo
+    def start_acquisition(self, *args, **kwargs):
+        self._update_pools()
+        super().start_acquisition(*args,**kwargs)
+
+    def _make_pool(self, n, base):
+        dtype=np.dtype(self._default_image_dtype)
+        maxval=np.iinfo(dtype).max if dtype.kind in "ui" else 2**16
+        noise=np.random.randint(0,min(256,maxval//4+1),size=(n,)+base.shape)
+        pool=np.clip(base+noise,0,maxval).astype(dtype)
+        pool.flags.writeable=False
+        return pool
+    def _update_pools(self):
+        """Rebuild the frames pools if the ROI or the data type changed"""
+        key=(self._roi,self._default_image_dtype)
+        if self._pools_key==key:
+            return
+        c0,c1,r0,r1=self._roi
+        dtype=np.dtype(self._default_image_dtype)
+        mag=min(self._base_frame_mag,np.iinfo(dtype).max//4) if dtype.kind in "ui" else self._base_frame_mag
+        base=self._get_base_frame()[r0:r1,c0:c1]*(mag/self._base_frame_mag)
+        pools=[self._make_pool(self._pool_size,base)]
+        if self._event_period>0:
+            xs,ys=np.meshgrid(np.arange(r0,r1),np.arange(c0,c1),indexing="ij")
+            ip,jp=self._size[1]/2,self._size[0]/2
+            spot=np.exp(-((xs-ip)**2+(ys-jp)**2)/(2*(self._size[0]/50)**2))*self._event_amplitude
+            pools.append(self._make_pool(min(self._pool_size,self._event_length),base+spot))
+        self._pools=pools
+        self._pools_key=key
+    def _get_framestamps(self, rng):
+        idx=np.arange(rng[0],rng[1],dtype="i8")
+        return idx+idx//self._drop_period if self._drop_period>0 else idx
+    def _read_frames(self, rng, return_info=False):
+        self._update_pools()
+        frames=[]
+        i=rng[0]
+        ep,el=self._event_period,self._event_length
+        while i<rng[1]:
+            if ep>0 and i%ep<el:
+                pool,end=self._pools[1],i-i%ep+el
+            else:
+                pool,end=self._pools[0],(i-i%ep+ep if ep>0 else rng[1])
+            p=i%len(pool)
+            n=min(end,rng[1])-i
+            n=min(n,len(pool)-p)
+            frames.append(pool[p:p+n])
+            i+=n
+        if self._copy_frames:
+            copied=frame_pool.get((rng[1]-rng[0],)+frames[0].shape[1:],frames[0].dtype)
+            np.concatenate(frames,out=copied)
+            frames=[copied]
+            if self._status_line:
+                stamps=self._get_framestamps(rng)
+                frames[0][:,0,:8]=(stamps[:,None]>>(8*np.arange(8)))&0xFF
+        infos=None
+        if return_info:
+            stamps=self._get_framestamps(rng)
+            infos=np.column_stack([stamps,(stamps*(self._exposure*1E6)).astype("i8")])
+            infos=np.split(infos,np.cumsum([len(f) for f in frames[:-1]]))
+        return frames,infos
+
+
+
 class SimulatedCameraThread(GenericCameraThread):
     """Device thread for a simulated camera"""
     parameter_variables=GenericCameraThread.parameter_variables|{"exposure","frame_period","detector_size","buffer_size","acq_status","roi_limits","roi"}
@@ -123,6 +244,20 @@ class SimulatedCameraThread(GenericCameraThread):
         self.cam_size=size
         super().setup_task(remote=remote,misc=misc)
 
+class BenchmarkSimulatedCameraThread(SimulatedCameraThread):
+    """Device thread for a high-rate benchmark simulated camera"""
+    def connect_device(self):
+        self.device=BenchmarkSimulatedCamera(size=self.cam_size,**self.cam_options)
+    def setup_task(self, size=(1024,1024), fps=100, dtype="<u2", pool_size=32, events=None, drop_period=0,   # pylint: disable=arguments-differ
+            status_line=False, copy_frames=False, remote=None, misc=None):
+        self.cam_options={"fps":fps,"dtype":dtype,"pool_size":pool_size,"events":events,"drop_period":drop_period,"status_line":status_line,"copy_frames":copy_frames}
+        super().setup_task(size=size,remote=remote,misc=misc)
+    def _get_metainfo(self, frames, indices, infos):
+        metainfo=super()._get_metainfo(frames,indices,infos)
+        if self.cam_options["status_line"]:
+            metainfo["status_line"]=TStatusLineDescription("simulated_benchmark",(0,0,0,7),StatusLineChecker())
+        return metainfo
+
 
 
 
@@ -142,4 +277,16 @@ class SimulatedCameraDescriptor(ICameraDescriptor):
     def make_gui_control(self, parent):
         return GenericCameraSettings_GUI(parent,cam_desc=self)
     def make_gui_status(self, parent):
-        return GenericCameraStatus_GUI(parent,cam_desc=self)
\ No newline at end of file
+        return GenericCameraStatus_GUI(parent,cam_desc=self)
+
+
+
+
+class BenchmarkSimulatedCameraDescriptor(SimulatedCameraDescriptor):
+    _cam_kind="simulated_benchmark"
+
+    def get_kind_name(self):
+        return "Benchmark simulated camera"
+    
+    def make_thread(self, name):
+        return BenchmarkSimulatedCameraThread(name=name,kwargs=self.settings["params"].as_dict())
\ No newline at end of file
@@ -0,0 +1,71 @@
+from pylablib.core.gui import QtCore
+from pylablib.core.gui.widgets import container, param_table
+from pylablib.core.thread import controller
+
+
+class Instrumentation_GUI(container.QGroupBoxContainer):
+    """
+    Frame processing stages instrumentation panel.
+
+    Displays the statistics of the frame processing stages (frame and data rates, processing time, load, input queue fill and number of dropped messages)
+    based on the ``"instrumentation"`` resources in the resource manager, and highlights the stages which are falling behind.
+    """
+    _columns=[("caption","Stage"),("fps","FPS"),("rate","MB/s"),("time","ms/msg"),("load","Load"),("queue","Queue"),("dropped","Dropped")]
+    _warning_style="background:gold; color: black"
+    def setup(self, resource_manager_thread):
+        super().setup(caption="Instrumentation",no_margins=True)
+        self.setMinimumWidth(350)
+        self.resource_manager=controller.sync_controller(resource_manager_thread)
+        self.stages=[]
+        self._last_dropped={}
+        # Setup GUI
+        self.params=self.add_child("params",param_table.ParamTable(self))
+        self.params.setup(add_indicator=False)
+        self.add_padding(stretch=1)
+        self._build_table()
+        # Timer
+        self.add_timer_event("update_stages",self.update_stages,period=1.)
+    def start(self):
+        self.update_stages()
+        super().start()
+
+    def _build_table(self):
+        self.params.clear()
+        for c,(name,caption) in enumerate(self._columns):
+            self.params.add_text_label("header/"+name,value=caption,location=(0,c))
+            self.params.w["header/"+name].setStyleSheet("font-weight: bold")
+        for r,stage in enumerate(self.stages):
+            for c,(name,_) in enumerate(self._columns):
+                self.params.add_text_label("stages/{}/{}".format(r,name),location=(r+1,c))
+                if c:
+                    self.params.w["stages/{}/{}".format(r,name)].setAlignment(QtCore.Qt.AlignRight)
+            self.params.w["stages/{}/caption".format(r)].setToolTip(stage)
+    def _format_stage(self, value):
+        limit=value.get("queue_limit",0)
+        return {"caption":value.get("caption",""),
+                "fps":"{:.0f}".format(value.get("frame_rate",0)),
+                "rate":"{:.1f}".format(value.get("bytes_rate",0)/2**20),
+                "time":"{:.2f}".format(value.get("proc_time_mean",0)*1E3),
+                "load":"{:.0f}%".format(value.get("load",0)*100),
+                "queue":"{}/{}".format(value.get("queue_peak",0),limit if limit>0 else "-"),
+                "dropped":"{}".format(value.get("dropped",0))}
+    def _is_behind(self, name, value):
+        limit=value.get("queue_limit",0)
+        dropped=value.get("dropped",0)
+        behind=dropped>self._last_dropped.get(name,dropped) or value.get("load",0)>0.9 or (limit>0 and value.get("queue_peak",0)>=limit)
+        self._last_dropped[name]=dropped
+        return behind
+
+    def update_stages(self):
+        """Update the table based on the stage resources"""
+        if not self.isVisible():
+            return
+        values=self.resource_manager.cs.list_resources("instrumentation")
+        stages=sorted(values,key=lambda n: (values[n].get("order",0),n))
+        if stages!=self.stages:
+            self.stages=stages
+            self._build_table()
+        for r,stage in enumerate(self.stages):
+            for name,text in self._format_stage(values[stage]).items():
+                self.params.v["stages/{}/{}".format(r,name)]=text
+            self.params.w["stages/{}/caption".format(r)].setStyleSheet(self._warning_style if self._is_behind(stage,values[stage]) else "")
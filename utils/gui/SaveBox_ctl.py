@@ -4,9 +4,10 @@ from pylablib.core.utils import files as file_utils, general
 
 from pylablib.core.gui import QtWidgets, QtCore, QtGui, qtkwargs, utils as gui_utils
 
+from ..services import saving
+
 import os
 import datetime
-import re
 
 
 
@@ -173,10 +174,7 @@ class SaveBox_GUI(container.QGroupBoxContainer):
         def update_snap_path():
             default_path=self.v["default_snap_path"]
             if default_path:
-                path,ext=os.path.splitext(self.v["path"])
-                if ext not in self._allowed_ext[self.v["format"]]:
-                    path=path+ext
-                self.v["snap_path"]=path+"_snapshot"
+                self.v["snap_path"]=saving.get_snap_path(self.v)
                 self.v["snap_make_folder"]=self.v["make_folder"]
                 self.v["snap_add_datetime"]=self.v["add_datetime"]
             self.params.set_enabled(["snap_path","snap_browse","snap_make_folder","snap_add_datetime"],not default_path)
@@ -200,34 +198,6 @@ class SaveBox_GUI(container.QGroupBoxContainer):
         self.setEnabled(False)
 
     # Build a dictionary of camera parameters from the controls
-    _default_ext={"raw":".bin","cam":".cam","tiff":".tiff","bigtiff":".btf"}
-    _allowed_ext={k:[e] for k,e in _default_ext.items()}
-    _allowed_ext["tiff"].append(".tif")
-    _path_gens={"pfx":"{date}_{name}","sfx":"{name}_{date}","folder":"{date}/{name}"}
-    def _expand_name(self, name, idx=None, add_datetime=False, as_folder=False):
-        if add_datetime:
-            pathgen_kind="folder" if as_folder else "file"
-            pathgen=self.cam_ctl.settings.get(("interface/datetime_path",pathgen_kind),"sfx")
-            pathgen=self._path_gens.get(pathgen,pathgen)
-            date=datetime.datetime.now()
-            name=pathgen.format(name=name,date=date.strftime(r"%Y%m%d_%H%M%S"),datetime=date)
-            if idx is not None:
-                name="{}_{:03d}".format(name,idx)
-        elif idx is not None:
-            name="{}{:03d}".format(name,idx)
-        return name
-    def _is_name_taken(self, path, ext, split=False, as_folder=False):
-        if as_folder:
-            return os.path.exists(os.path.join(path))
-        folder,name=os.path.split(path)
-        for sfx in ["settings.dat","frameinfo.dat","background.bin","eventlog.dat"]:
-            if os.path.exists(os.path.join(folder,"{}_{}".format(name,sfx))):
-                return True
-        if split:
-            file_filter=re.escape(name)+r"_\d+"+re.escape(ext)
-            return bool(file_utils.list_dir(folder,file_filter=file_filter).files)
-        else:
-            return os.path.exists(os.path.join(folder,name+ext))
     def collect_parameters(self, mode="full", resolve_path=True):
         """
         Get saving parameters from the widget as a dictionary.
@@ -235,46 +205,12 @@ class SaveBox_GUI(container.QGroupBoxContainer):
         Also formats the saving file name (extension, perfixes, additional index).
         `mode` can be either ``"full"`` (collect parameters for full saving), or ``"snap"`` (collect parameteres for snap saving)
         """
-        params={}
-        params["batch_size"]=self.v["batch_size"] if self.v["limit_frames"] else None
-        params["format"]=self.v["snap_format" if mode=="snap" else "format"]
-        if resolve_path:
-            use_snap_parameters=(mode=="snap" and not self.v["default_snap_path"])
-            add_datetime=self.v["snap_add_datetime" if use_snap_parameters else "add_datetime"]
-            make_folder=self.v["snap_make_folder" if use_snap_parameters else "make_folder"]
-            fext=self._default_ext[params["format"]]
-            aext=self._allowed_ext[params["format"]]
-            path_kind="snap_path" if mode=="snap" else "path"
-            if make_folder:
-                path=self.v[path_kind]
-                ext=fext
-            else:
-                path,ext=os.path.splitext(self.v[path_kind])
-                if ext not in aext:
-                    path+=ext
-                    ext=fext
-            folder,name=os.path.split(path)
-            if mode=="snap" or self.v["on_name_conflict"]=="rename":
-                idx=None
-                iname=self._expand_name(name,idx,add_datetime=add_datetime,as_folder=make_folder)
-                split=self.v["do_filesplit"]
-                while self._is_name_taken(os.path.join(folder,iname),ext,split=split,as_folder=make_folder):
-                    idx=0 if idx is None else idx+1
-                    iname=self._expand_name(name,idx,add_datetime=add_datetime,as_folder=make_folder)
-                name=iname
-            else:
-                name=self._expand_name(name)
-            params["path"]=os.path.join(folder,name+ext)
-            if not file_utils.is_path_valid(params["path"]):
-                if not self.cam_ctl.no_popup:
-                    QtWidgets.QMessageBox.warning(self,"Invalid path","Invalid path: {}".format(params["path"]),QtWidgets.QMessageBox.Ok)
-                self.v["saving"]=False
-                params["path"]=None
-            params["path_kind"]="folder" if make_folder else "pfx"
-        params["filesplit"]=self.v["filesplit"] if self.v["do_filesplit"] else None
-        for p in ["pretrigger_size","pretrigger_enabled","stream_mode","save_settings","snap_display_source"]:
-            params[p]=self.v[p]
-        params["append"]=self.v["on_name_conflict"]=="append" and mode=="full"
+        params=saving.build_saving_parameters(self.v,mode=mode,resolve_path=resolve_path,settings=self.cam_ctl.settings)
+        if resolve_path and not file_utils.is_path_valid(params["path"]):
+            if not self.cam_ctl.no_popup:
+                QtWidgets.QMessageBox.warning(self,"Invalid path","Invalid path: {}".format(params["path"]),QtWidgets.QMessageBox.Ok)
+            self.v["saving"]=False
+            params["path"]=None
         return params
     # Update the interface indicators according to camera parameters
     def show_parameters(self, params):
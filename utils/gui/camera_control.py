@@ -109,12 +109,13 @@ class GenericCameraCtl(container.QContainer):
         if self.dev is not None:
             self.dev.ca.acq_stop()
     @controller.exsafe
-    def toggle_saving(self, mode, start=True, source=None, change_params=None, no_popup=False):
+    def toggle_saving(self, mode, start=True, source=None, change_params=None, no_popup=False, trigger_frame_index=None):
         """
         Turn saving on/off (connected to a button in saving control)
         
         `mode` is the saving mode: either ``"full"`` (full stream saving), or ``"snap"`` (snapshot saving).
         If `change_params` is defined, it is a dictionary which overrides some of the saving parameters from the GUI.
+        If `trigger_frame_index` is defined, it is the index of the frame which triggered the full saving.
         """
         if (self.saver and mode=="full") or (self.snap_saver and mode=="snap"):
             self.no_popup=no_popup
@@ -131,7 +132,7 @@ class GenericCameraCtl(container.QContainer):
                         perform_status_check=self.c["settings"].collect_parameters().get("perform_status_check",False)
                     self.saver.csi.save_start(params["path"],path_kind=params["path_kind"],batch_size=params["batch_size"],
                         append=params["append"],format=params["format"],filesplit=params["filesplit"],
-                        save_settings=params["save_settings"],perform_status_check=perform_status_check)
+                        save_settings=params["save_settings"],perform_status_check=perform_status_check,trigger_frame_index=trigger_frame_index)
                 else:
                     self.saver.ca.save_stop()
             else:
@@ -1,2 +1,6 @@
 from .framestream import FrameProcessorThread, FrameBinningThread, FrameSlowdownThread, ChannelAccumulator, FrameSaveThread
-from .misc import SettingsManager, ResourceManager, GarbageCollector
\ No newline at end of file
+from .misc import SettingsManager, ResourceManager, GarbageCollector
+from .instrumentation import InstrumentedStageMixin, add_stage_resource
+from .framepool import FramePool, frame_pool
+from .jit import JITWarmupThread
+from .pipeline import default_thread_names, shared_threads, get_thread_names, start_shared_threads, start_camera_threads, start_threads, start_camera
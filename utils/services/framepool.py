@@ -0,0 +1,104 @@
+import numpy as np
+
+import sys
+import threading
+import collections
+
+
+
+class FramePool:
+    """
+    Pool of reusable frame buffers.
+
+    Buffers are grouped into size classes by their shape and dtype.
+    A buffer is returned to the pool automatically when the last consumer releases it, i.e., when there are no more references to it or its views
+    (the pool only hands out views of the stored buffers, so it can check that by counting the references to the buffer).
+
+    Args:
+        max_size: maximal total size of the pooled buffers in bytes; if it is exceeded, the free buffers from the least recently used classes are dropped,
+            and if this is not enough, a new buffer is allocated outside of the pool
+        max_class_buffers: maximal number of buffers in a single size class
+    """
+    def __init__(self, max_size=2**29, max_class_buffers=64):
+        self.max_size=max_size
+        self.max_class_buffers=max_class_buffers
+        self._lock=threading.Lock()
+        self._classes=collections.OrderedDict()
+        self._size=0
+        self._free_refcount=self._get_refcount([np.zeros(0)],0)
+        self.hits=0
+        self.misses=0
+        self.unpooled=0
+    def setup(self, max_size=None, max_class_buffers=None):
+        """Change the pool size limits"""
+        with self._lock:
+            if max_size is not None:
+                self.max_size=max_size
+            if max_class_buffers is not None:
+                self.max_class_buffers=max_class_buffers
+            self._trim(0)
+
+    @staticmethod
+    def _get_refcount(buffers, i):
+        return sys.getrefcount(buffers[i])
+    def _is_free(self, buffers, i):
+        return self._get_refcount(buffers,i)<=self._free_refcount
+    def _trim(self, nbytes):
+        """Drop free buffers from the least recently used classes until `nbytes` more can fit into the pool"""
+        for key,buffers in list(self._classes.items()):
+            if self._size+nbytes<=self.max_size:
+                return True
+            for i in range(len(buffers)-1,-1,-1):
+                if self._is_free(buffers,i):
+                    self._size-=buffers[i].nbytes
+                    del buffers[i]
+            if not buffers:
+                del self._classes[key]
+        return self._size+nbytes<=self.max_size
+    def get(self, shape, dtype):
+        """
+        Get an uninitialized frame buffer with the given shape and dtype.
+
+        The buffer is returned to the pool once there are no more references to it.
+        """
+        dtype=np.dtype(dtype)
+        shape=tuple(shape)
+        key=(shape,dtype.str)
+        with self._lock:
+            buffers=self._classes.get(key)
+            if buffers is not None:
+                self._classes.move_to_end(key)
+                for i in range(len(buffers)):
+                    if self._is_free(buffers,i):
+                        self.hits+=1
+                        buffers.append(buffers.pop(i))
+                        return buffers[-1][...]
+            self.misses+=1
+            buffer=np.empty(shape,dtype=dtype)
+            if (buffers is not None and len(buffers)>=self.max_class_buffers) or not self._trim(buffer.nbytes):
+                self.unpooled+=1
+                return buffer
+            self._classes.setdefault(key,[]).append(buffer)
+            self._size+=buffer.nbytes
+            return buffer[...]
+    def clear(self):
+        """Remove all the buffers from the pool (the buffers which are still in use stay valid, but are not returned to the pool)"""
+        with self._lock:
+            self._classes.clear()
+            self._size=0
+    def get_stats(self):
+        """
+        Get the pool statistics.
+
+        Return dictionary with the number of ``"hits"`` (buffer reused from the pool), ``"misses"`` (new buffer allocated),
+        ``"unpooled"`` (buffers allocated outside of the pool because of the size limits), total number of ``"buffers"``,
+        number of ``"free"`` buffers, total pool ``"size"`` in bytes, its ``"max_size"``, and the number of size ``"classes"``.
+        """
+        with self._lock:
+            nfree=sum(self._is_free(b,i) for b in self._classes.values() for i in range(len(b)))
+            return {"hits":self.hits,"misses":self.misses,"unpooled":self.unpooled,
+                "buffers":sum(len(b) for b in self._classes.values()),"free":nfree,"size":self._size,"max_size":self.max_size,"classes":len(self._classes)}
+
+
+frame_pool=FramePool()
+"""Default frame buffer pool shared by the frame sources and processing threads"""
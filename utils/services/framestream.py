@@ -3,10 +3,14 @@ from pylablib.devices.interface import camera as camera_utils
 
 from pylablib.core.thread import controller
 from pylablib.core.utils import dictionary, files as file_utils, funcargparse, string as string_utils
-from pylablib.core.fileio import savefile, loadfile, table_stream, location
+from pylablib.core.fileio import savefile, loadfile, table_stream
 from pylablib.core.dataproc import image
 from pylablib.thread.stream import frameproc, table_accum, stream_manager
 
+from .instrumentation import InstrumentedStageMixin
+from .framepool import frame_pool
+from . import saving
+
 import time
 import collections
 import numpy as np
@@ -18,7 +22,8 @@ import os
 
 ########## Frame processing ##########
 
-class FrameProcessorThread(frameproc.BackgroundSubtractionThread):
+class FrameProcessorThread(InstrumentedStageMixin, frameproc.BackgroundSubtractionThread):
+    _instrumented_callbacks=["process_input_frames"]
     def setup_task(self, src, tag_in, tag_out=None):
         super().setup_task(src,tag_in,tag_out=tag_out)
         self.subscribe_commsync(self.on_control_signal,tags="processing/control",limit_queue=100)
@@ -47,13 +52,83 @@ class FrameProcessorThread(frameproc.BackgroundSubtractionThread):
             self.status_line_policy="duplicate"
 
 
-FrameBinningThread=frameproc.FrameBinningThread
-FrameSlowdownThread=frameproc.FrameSlowdownThread
+class FrameBinningThread(InstrumentedStageMixin, frameproc.FrameBinningThread):
+    """
+    Frame binning thread.
+
+    Same as :class:`pylablib.thread.stream.frameproc.FrameBinningThread`, but the most common case
+    (only spatial binning of monochrome frames without a status line) is done in a single pass directly into a buffer taken from the :data:`.frame_pool`,
+    which avoids allocation of the intermediate and the resulting arrays.
+    """
+    _instrumented_callbacks=["process_input_frames"]
+    _pooled_modes={"skip","sum","mean","min","max"}
+    def _can_bin_pooled(self, msg):
+        par=self.v["params"]
+        return (par["time/bin"]==1 and tuple(par["spat/bin"])!=(1,1) and par["spat/mode"] in self._pooled_modes and
+            msg.mi.chandim==0 and msg.metainfo.get("status_line") is None and len(msg.frames)>0)
+    def _bin_chunk(self, chunk, n, mode, out):
+        """Spatially bin 3D array `chunk` by factors `n` using the given `mode` and store the result in `out`"""
+        h,w=out.shape[1:]
+        chunk=chunk[:,:h*n[0],:w*n[1]]
+        if mode=="skip":
+            np.copyto(out,chunk[:,::n[0],::n[1]],casting="unsafe")
+            return
+        if mode in ["mean","sum"]:
+            acc=frame_pool.get(out.shape,"float64")
+            op=np.add
+        else:
+            acc=out if out.dtype==chunk.dtype else frame_pool.get(out.shape,chunk.dtype)
+            op=np.maximum if mode=="max" else np.minimum
+        # accumulate strided sub-grids in place; much faster than reducing a reshaped array along the non-contiguous axes
+        np.copyto(acc,chunk[:,::n[0],::n[1]],casting="unsafe")
+        for i in range(n[0]):
+            for j in range(n[1]):
+                if i or j:
+                    op(acc,chunk[:,i::n[0],j::n[1]],out=acc)
+        if mode=="mean":
+            acc/=n[0]*n[1]
+        if acc is not out:
+            np.copyto(out,acc,casting="unsafe")
+    def process_input_frames(self, src, tag, msg):
+        """Process multicast message with input frames"""
+        if not (self.v["enabled"] and self._can_bin_pooled(msg)):
+            return super().process_input_frames(src,tag,msg)
+        par=self.v["params"]
+        n=tuple(par["spat/bin"])
+        chunks=msg.frames if msg.chunks else [f[None] for f in msg.frames]
+        shape=chunks[0].shape[1:]
+        binned_shape=(shape[0]//n[0],shape[1]//n[1])
+        if any(c.shape[1:]!=shape for c in chunks) or not (binned_shape[0] and binned_shape[1]):
+            return super().process_input_frames(src,tag,msg)
+        if self.cnt.receive_message(msg):
+            self._clear_buffer()
+        dtype=chunks[0].dtype if par["dtype"] is None else par["dtype"]
+        frames=frame_pool.get((sum(len(c) for c in chunks),)+binned_shape,dtype)
+        start=0
+        for c in chunks:
+            self._bin_chunk(c,n,par["spat/mode"],frames[start:start+len(c)])
+            start+=len(c)
+        if msg.chunks:
+            indices=np.concatenate(msg.indices)
+            frame_info=np.concatenate(msg.frame_info) if msg.frame_info is not None else None
+        else:
+            frames=list(frames)
+            indices=list(msg.indices)
+            frame_info=list(msg.frame_info) if msg.frame_info is not None else None
+        if "roi" in msg.metainfo:
+            roi=msg.mi.roi+(1,1)
+            mi={"roi":roi[:4]+(roi[4]*n[1],roi[5]*n[0])}
+        else:
+            mi={}
+        msg=msg.copy(frames=frames,indices=indices,frame_info=frame_info,source=self.name,step=msg.mi.step,metainfo=mi)
+        self.send_multicast(dst="any",tag=self.tag_out,value=msg)
+class FrameSlowdownThread(InstrumentedStageMixin, frameproc.FrameSlowdownThread):
+    _instrumented_callbacks=["process_input_frames"]
 
 
 ##### Camera channel calculation #####
 
-class ChannelAccumulator(controller.QTaskThread):
+class ChannelAccumulator(InstrumentedStageMixin, controller.QTaskThread):
     """
     Channel accumulator.
 
@@ -127,9 +202,9 @@ class ChannelAccumulator(controller.QTaskThread):
         self.sources[name]=self.TSource(src,tag,kind,sync)
         callback=lambda s,t,v: self.process_source(s,t,v,source=name)
         if sync:
-            self.subscribe_commsync(callback,srcs=src,tags=tag,dsts="any",limit_queue=2,on_full_queue="wait")
+            self.subscribe_commsync(callback,srcs=src,tags=tag,dsts="any",limit_queue=2,on_full_queue="wait",instrument=True)
         else:
-            self.subscribe_commsync(callback,srcs=src,tags=tag,dsts="any",limit_queue=10)
+            self.subscribe_commsync(callback,srcs=src,tags=tag,dsts="any",limit_queue=10,instrument=True)
     def select_source(self, name):
         """Select a source with a given name"""
         if self.current_source!=name and name in self.sources:
@@ -328,7 +403,7 @@ class FrameWriteError(IOError):
         self.kind=kind
         super().__init__("saving frames raised {} error; only {} frames saved".format(kind,saved))
 
-class FrameSaveThread(controller.QTaskThread):
+class FrameSaveThread(InstrumentedStageMixin, controller.QTaskThread):
     """
     Frame saving thread
 
@@ -338,6 +413,7 @@ class FrameSaveThread(controller.QTaskThread):
         src: frames source
         tag: frames signal tag
         settings_mgr: settings manager thread name (used to save settings file on saving start)
+        settings_scope: settings manager scope of the saved camera (``None`` if there is only one camera)
         frame_processor: frame processor thread name (used to get snapshot background to save to the file, if appropriate)
 
     Attributes:
@@ -357,6 +433,7 @@ class FrameSaveThread(controller.QTaskThread):
         max_queue_ram: maximal queue RAM size
         status_line_check: status line check status; can be ``"off"`` (check is off), ``"none"`` (frames don't have status line), ``"na"`` (no frames have been received yet),
             ``"ok"`` (status line check is ok), ``"missing"`` (missing frames), ``"still"`` (repeating frames), or ``"out_of_order"`` (later frames have lower index).
+        instrumentation: frames receiving statistics (see :class:`.InstrumentedStageMixin`)
 
     Commands:
         save_start: start streaming
@@ -365,9 +442,11 @@ class FrameSaveThread(controller.QTaskThread):
         clear_pretrigger: clear pretrigger buffer
         setup_queue_ram: setup maximal saving queue RAM
     """
-    def setup_task(self, src, tag, settings_mgr=None, frame_processor=None, garbage_collector=None):
-        self.subscribe_commsync(self.receive_frames,srcs=src,tags=tag,limit_queue=100)
+    _instrumented_callbacks=["receive_frames"]
+    def setup_task(self, src, tag, dst="any", settings_mgr=None, settings_scope=None, frame_processor=None, garbage_collector=None):
+        self.subscribe_commsync(self.receive_frames,srcs=src,tags=tag,dsts=dst,limit_queue=100)
         self.settings_mgr=settings_mgr
+        self.settings_scope=settings_scope
         self._cam_settings_time="before" # ``"before"`` - get full camera settings in the beginning of saving; ``"after"`` - get them in the end of saving
         self.frame_processor=frame_processor
         self._save_queue=None
@@ -386,6 +465,7 @@ class FrameSaveThread(controller.QTaskThread):
         self.v["missed"]=0
         self.v["pretrigger_status"]=None
         self.append=False
+        self.sync_info=False
         self.filesplit=None
         self.format="raw"
         self.background_desc={}
@@ -402,6 +482,7 @@ class FrameSaveThread(controller.QTaskThread):
         self._last_frame_recvd=None
         self._last_frame_idx=None
         self._last_frame_sid=None
+        self._trigger_frame_idx=None
         self._last_frame=None
         self._last_chunk_start=0
         self._tiff_writer=None
@@ -458,7 +539,7 @@ class FrameSaveThread(controller.QTaskThread):
         if self.garbage_collector:
             try:
                 garbage_collector=controller.get_controller(self.garbage_collector,sync=False)
-                garbage_collector.setup(enabled=enabled)
+                garbage_collector.setup(enabled=enabled,source=self.name)
             except controller.threadprop.NoControllerThreadError:
                 pass
     def setup_streaming(self, single_shot=None):
@@ -534,28 +615,7 @@ class FrameSaveThread(controller.QTaskThread):
             self.update_status("result","error",text="Error")
             self.update_status("error",(kind,desc))
 
-    @staticmethod
-    def build_path(base, path_kind="pfx", default_name="frames", subpath=None, idx=None, ext=None):
-        """
-        Make a data path from the base path depending on its kind.
-
-        Args:
-            base: base storage path
-            path_kind: base path kind; either ``"pfx"``(add subpath as suffix to the base name),
-                or ``"folder"`` (treat it as a folder, generate subpaths inside it)
-            default_name: default file name if ``path_kind=="folder"``
-            subpath: added as suffix if ``path_kind=="pfx"`` or defines a storage path if ``path_kind=="folder"``
-            idx: if defined, adds an index suffix to the file name
-            ext: path extension
-        """
-        funcargparse.check_parameter_range(path_kind,"path_kind",["pfx","folder"])
-        bname,bext=os.path.splitext(base)
-        idx_sfx="" if idx is None else "_{:04d}".format(idx)
-        if path_kind=="pfx":
-            loc=location.PrefixedFileSystemDataLocation(bname+idx_sfx+bext)
-        else:
-            loc=location.FolderFileSystemDataLocation(bname,default_name=default_name+idx_sfx,default_ext=bext[1:])
-        return loc.get_filesystem_path((subpath,ext))
+    build_path=staticmethod(saving.build_path)
     def _make_path(self, subpath=None, idx=None, ext=None):
         return self.build_path(self.v["path"],path_kind=self.v["path_kind"],subpath=subpath,idx=idx,ext=ext)
     def _clean_path(self, subpath=None, idx=None, ext=None):
@@ -579,7 +639,9 @@ class FrameSaveThread(controller.QTaskThread):
                 "format":self.format,
                 "background":self.background_desc,
                 "start_timestamp":time.time(),
-                "pretrigger_status/start":self.v["pretrigger_status"]}
+                "pretrigger_status/start":self.v["pretrigger_status"],
+                "trigger_frame_index":self._trigger_frame_idx,
+                "sync_info":self.sync_info}
     def _get_finalized_settings(self):
         """Get finalized settings (additional info at the end of saving process)"""
         settings={}
@@ -591,6 +653,8 @@ class FrameSaveThread(controller.QTaskThread):
         settings["last_frame_timestamp"]=self._last_frame_recvd
         settings["last_frame_index"]=self._last_frame_idx
         settings["last_frame_session"]=self._last_frame_sid
+        if self._trigger_frame_idx is not None and self._first_frame_idx is not None:
+            settings["trigger_frame_offset"]=self._trigger_frame_idx-self._first_frame_idx
         settings["stop_timestamp"]=time.time()
         settings["pretrigger_status/stop"]=self.v["pretrigger_status"]
         if self._last_frame is not None:
@@ -601,7 +665,7 @@ class FrameSaveThread(controller.QTaskThread):
         if self.settings_mgr:
             try:
                 settings_mgr=controller.get_controller(self.settings_mgr,sync=False)
-                return settings_mgr.cs.get_all_settings(include=include,exclude=exclude,alias=alias)
+                return settings_mgr.cs.get_all_settings(include=include,exclude=exclude,alias=alias,scope=self.settings_scope)
             except controller.threadprop.NoControllerThreadError:
                 pass
         return {}
@@ -799,39 +863,56 @@ class FrameSaveThread(controller.QTaskThread):
                 pass
             self._tiff_writer=None
 
+    _sync_info_fields=["acq_index","acq_timestamp"]
     def _write_frame_info(self, messages, path, append=True):
-        """Write frame info in a table to the given path"""
+        """
+        Write frame info in a table to the given path.
+
+        If :attr:`sync_info` is set, the camera frame index and the frame message timestamp (the time when the frames were read from the camera)
+        are added after the saving index, which allows correlating the frames between several cameras; in this case the table is written even if the camera provides no frame info.
+        """
         if not append and os.path.exists(path):
             file_utils.retry_remove(path)
-        if all(msg.frame_info is None for msg in messages):
+        if not self.sync_info and all(msg.frame_info is None for msg in messages):
             return
         nsaved=self.v["saved"]
-        header=None
+        prefix=["save_index"]+(self._sync_info_fields if self.sync_info else [])
+        header=prefix if self.sync_info else None
         for msg in messages:
-            header=msg.metainfo.get("frame_info_fields")
-            if header is not None:
-                header=["save_index"]+header
+            fields=msg.metainfo.get("frame_info_fields")
+            if fields is not None:
+                header=prefix+fields
                 break
         streamer=table_stream.TableStreamFile(path,columns=header,header_prepend="")
         for msg in messages:
-            if msg.frame_info is not None:
+            if msg.frame_info is not None or self.sync_info:
                 rows=[]
-                for f,r in zip(msg.frames,msg.frame_info):
+                frame_info=msg.frame_info if msg.frame_info is not None else [None]*len(msg.frames)
+                indices=msg.indices if msg.indices is not None else [None]*len(msg.frames)
+                for f,idx,r in zip(msg.frames,indices,frame_info):
+                    nframes=(1 if f.ndim==2 else len(f))
+                    if self.sync_info:
+                        step=msg.mi.step
+                        idx=[-1]*nframes if idx is None else (list(np.arange(nframes)*step+idx) if np.ndim(idx)==0 else list(idx))
+                        idx_cols=[[nsaved+i,idx[i],msg.mi.creation_time] for i in range(nframes)]
+                    else:
+                        idx_cols=[[nsaved+i] for i in range(nframes)]
                     if r is not None:
                         if isinstance(r,np.ndarray) and r.ndim==2:
-                            idx_col=np.arange(len(r))+nsaved
-                            r=np.concatenate([idx_col[:,None],r],axis=1)
+                            r=np.concatenate([np.array(idx_cols[:len(r)]),r],axis=1)
                             r=r[r[:,0]>=0]
                             rows+=list(r)
                         else:
-                            rows.append([nsaved]+list(r))
-                    nsaved+=(1 if f.ndim==2 else len(f))
+                            rows.append(idx_cols[0]+list(r))
+                    elif self.sync_info:
+                        rows+=idx_cols
+                    nsaved+=nframes
                 if rows:
                     streamer.write_multiple_rows(rows)
 
 
 
-    def save_start(self, path, path_kind="pfx", batch_size=None, append=True, format="cam", filesplit=None, save_settings=False, perform_status_check=False, extra_settings=None):
+    def save_start(self, path, path_kind="pfx", batch_size=None, append=True, format="cam", filesplit=None, save_settings=False, perform_status_check=False, extra_settings=None, trigger_frame_index=None, sync_info=False):
         """
         Start saving routine.
 
@@ -846,6 +927,8 @@ class FrameSaveThread(controller.QTaskThread):
             save_settings (bool): if ``True``, save all application setting to the file
             perform_status_check (bool): if ``True`` and frames have status line (applies only to Photon Focus cameras), check status line to ensure no missing frames
             extra_settings: can be a dictionary with additional settings to save to the settings file (saved in branch ``"extra"``)
+            trigger_frame_index: index of the frame which triggered the saving (if any); its position within the saved data is stored in the finalized settings
+            sync_info (bool): if ``True``, add the camera frame index and the frame timestamp to the frame info file (used to correlate frames of several synchronized cameras)
         """
         if self._saving:
             self._finalize_saving()
@@ -859,6 +942,7 @@ class FrameSaveThread(controller.QTaskThread):
             raise ValueError("unrecognized format: {}".format(format))
         self.format=format
         self.filesplit=filesplit
+        self.sync_info=sync_info
         self.v["saved"]=0
         self.v["scheduled"]=0
         self.v["received"]=0
@@ -872,6 +956,7 @@ class FrameSaveThread(controller.QTaskThread):
         self._last_frame_recvd=None
         self._last_frame_idx=None
         self._last_frame_sid=None
+        self._trigger_frame_idx=trigger_frame_index
         self._last_chunk_start=0
         self._update_queue_ram(0)
         self._stopping=False
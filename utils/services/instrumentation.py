@@ -0,0 +1,142 @@
+from pylablib.core.thread import callsync
+from pylablib.thread.stream.stream_message import FramesMessage
+
+import time
+
+
+
+class StageCounters:
+    """
+    Instrumentation counters of a single frame processing stage.
+
+    The counters are simple attributes incremented in the receiving and processing threads without locking,
+    so they are cheap to update, but the values obtained from a different thread are only approximate.
+    """
+    def __init__(self):
+        self.received=0
+        self.dropped=0
+        self.processed=0
+        self.frames=0
+        self.nbytes=0
+        self.proc_time=0.
+        self.proc_time_max=0.
+        self.queue_peak=0
+    def snapshot(self):
+        """Get a tuple with the current values of the cumulative counters"""
+        return (self.received,self.dropped,self.processed,self.frames,self.nbytes,self.proc_time)
+    def reset_peaks(self):
+        """Reset the peak values (maximal processing time and queue length)"""
+        self.proc_time_max=0.
+        self.queue_peak=0
+
+
+class CountingScheduler(callsync.QQueueLengthLimitScheduler):
+    """
+    Queue length limited scheduler which records the number of received and dropped calls and the peak queue length into `counters`.
+
+    The rest of the arguments are the same as in :class:`pylablib.core.thread.callsync.QQueueLengthLimitScheduler`.
+    """
+    def __init__(self, counters, max_len=1, on_full_queue="skip_current", call_info_argname=None):
+        super().__init__(max_len=max_len,on_full_queue=on_full_queue,call_info_argname=call_info_argname)
+        self.counters=counters
+    def schedule(self, call):
+        nqueued=len(self.call_queue)
+        scheduled=super().schedule(call)
+        counters=self.counters
+        counters.received+=1
+        if scheduled is False or (self.on_full_queue in ["skip_oldest","skip_newest"] and nqueued>=self.max_len>0):
+            counters.dropped+=1
+        counters.queue_peak=max(counters.queue_peak,len(self.call_queue))
+        return scheduled
+
+
+
+class InstrumentedStageMixin:
+    """
+    Mixin for :class:`pylablib.core.thread.controller.QTaskThread` frame processing stages which collects processing statistics.
+
+    Instruments all commsync subscriptions whose callback name is listed in ``_instrumented_callbacks``
+    (or which are subscribed with ``instrument=True``): records number of received, processed and dropped messages,
+    processed frames and bytes, processing time, and the queue length compared to its limit.
+    The statistics are summarized every ``_instrumentation_period`` seconds;
+    the result is stored in the ``"instrumentation"`` variable and sent as an ``"instrumentation/update"`` multicast.
+
+    Variables:
+        - ``instrumentation``: dictionary with the latest stage statistics:
+          ``received``, ``processed``, and ``dropped`` message counts, ``frames`` (number of processed frames; all these counters are cumulative),
+          ``recv_rate``, ``msg_rate``, ``frame_rate``, ``bytes_rate``, and ``drop_rate`` (rates over the last period),
+          ``proc_time_mean`` and ``proc_time_max`` (message processing time over the last period), ``load`` (fraction of time spent processing),
+          ``queue_depth`` (current number of queued messages), ``queue_peak`` (maximal number over the last period), and ``queue_limit`` (queue size limit; 0 means no limit)
+    """
+    _instrumented_callbacks=[]
+    _instrumentation_period=1.
+    def _get_stage_counters(self):
+        if getattr(self,"_stage_counters",None) is None:
+            self._stage_counters=StageCounters()
+            self._stage_schedulers=[]
+            self._stage_last=(time.perf_counter(),self._stage_counters.snapshot())
+            self.v["instrumentation"]=None
+            self.add_job("update_instrumentation",self._check_instrumentation_update,self._instrumentation_period)
+        return self._stage_counters
+    def subscribe_commsync(self, callback, srcs="any", tags=None, dsts="any", scheduler=None, limit_queue=None, on_full_queue="skip_current", add_call_info=False, instrument=None, **kwargs):  # pylint: disable=arguments-differ
+        """
+        Subscribe a callback to a multicast which is synchronized with commands and jobs execution.
+
+        Same as :meth:`pylablib.core.thread.controller.QTaskThread.subscribe_commsync`, but with an additional `instrument` argument.
+        If it is ``True``, instrument the subscription; if it is ``None``, only instrument it if the callback name is in ``_instrumented_callbacks``.
+        """
+        if instrument is None:
+            instrument=getattr(callback,"__name__",None) in self._instrumented_callbacks
+        if instrument and scheduler is None:
+            counters=self._get_stage_counters()
+            scheduler=CountingScheduler(counters,max_len=limit_queue or 0,on_full_queue=on_full_queue,call_info_argname="call_info" if add_call_info else None)
+            self._stage_schedulers.append(scheduler)
+            callback=self._instrument_callback(callback,counters)
+        return super().subscribe_commsync(callback,srcs=srcs,tags=tags,dsts=dsts,scheduler=scheduler,limit_queue=limit_queue,on_full_queue=on_full_queue,add_call_info=add_call_info,**kwargs)
+    def _instrument_callback(self, callback, counters):
+        def instrumented_callback(src, tag, value, **kwargs):
+            t=time.perf_counter()
+            try:
+                return callback(src,tag,value,**kwargs)
+            finally:
+                dt=time.perf_counter()-t
+                counters.processed+=1
+                counters.proc_time+=dt
+                if dt>counters.proc_time_max:
+                    counters.proc_time_max=dt
+                if isinstance(value,FramesMessage):
+                    counters.frames+=value.nframes()
+                    counters.nbytes+=value.nbytes()
+                self._check_instrumentation_update(t+dt)
+        return instrumented_callback
+    def _check_instrumentation_update(self, t=None):
+        """Update the statistics if the update period has passed (the update job alone can be starved if the stage is overloaded)"""
+        t=time.perf_counter() if t is None else t
+        if t-self._stage_last[0]>=self._instrumentation_period:
+            self._update_instrumentation(t)
+    def _update_instrumentation(self, t):
+        counters=self._stage_counters
+        values=counters.snapshot()
+        last_t,last_values=self._stage_last
+        self._stage_last=(t,values)
+        dt=max(t-last_t,1E-6)
+        received,dropped,processed,frames,nbytes,proc_time=[v-lv for v,lv in zip(values,last_values)]
+        stats={"received":values[0],"processed":values[2],"dropped":values[1],"frames":values[3],
+            "recv_rate":received/dt,"msg_rate":processed/dt,"frame_rate":frames/dt,"bytes_rate":nbytes/dt,"drop_rate":dropped/dt,
+            "proc_time_mean":proc_time/processed if processed else 0.,"proc_time_max":counters.proc_time_max,"load":proc_time/dt,
+            "queue_depth":sum(len(s) for s in self._stage_schedulers),"queue_peak":counters.queue_peak,"queue_limit":sum(s.max_len for s in self._stage_schedulers)}
+        counters.reset_peaks()
+        self.v["instrumentation"]=stats
+        self.send_multicast(tag="instrumentation/update",value=stats)
+
+
+
+def add_stage_resource(resource_manager, name, caption=None, order=0, ctl=None):
+    """
+    Add an instrumented stage thread with the given `name` to the resource manager (given by its controller).
+
+    The stage is added as a ``"instrumentation"`` resource with the given `caption` and `order`, and its value is automatically updated with the stage statistics.
+    If `ctl` is not ``None``, it specifies the resource owner controller, which removes the resource on stopping.
+    """
+    resource_manager.cs.add_resource("instrumentation",name,ctl=ctl,caption=caption or name,order=order)
+    resource_manager.cs.add_multicast_updater("instrumentation",name,lambda src,tag,value: value,srcs=name,tags="instrumentation/update")
@@ -0,0 +1,107 @@
+from pylablib.core.thread import controller
+
+import numpy as np
+try:
+    import numba as nb
+except ImportError:
+    nb=None
+
+
+
+_pending={}
+def is_ready(kernel, *args):
+    """
+    Check if the numba `kernel` can be called with the given arguments without waiting for the compilation.
+
+    Return ``False`` only if the kernel has not been compiled for these argument types yet, but its compilation is scheduled in the warmup thread
+    (in this case the caller should use a slower fallback); otherwise, the kernel is either compiled, or is compiled on the first call as usual.
+    """
+    pending=_pending.get(kernel)
+    if not pending:
+        return True
+    sig=tuple(nb.typeof(a) for a in args)
+    return sig in kernel.overloads or sig not in pending
+
+
+def get_buffer_types(dtypes, ndim=3):
+    """Get numba array types for frame buffers with the given dtypes and number of dimensions (both for contiguous and non-contiguous layout)"""
+    return [nb.types.Array(nb.from_dtype(np.dtype(d)),ndim,layout) for d in dtypes for layout in ["C","A"]]
+
+
+
+class JITWarmupThread(controller.QTaskThread):
+    """
+    Numba kernels compilation thread.
+
+    Compiles the declared kernels signatures in the background, one signature per job call, so that the frame processing threads do not stall on the first kernel call.
+    Kernels are declared as a list of tuples ``(kernel, make_signature)``, where ``make_signature`` is a function which takes numba frame buffer array type
+    and returns the tuple of the kernel argument types (e.g., ``lambda buffer: (buffer, numba.int64)``).
+    The compiled code is stored on disk if the kernel is defined with ``cache=True``.
+    While a signature is pending, :func:`is_ready` returns ``False`` for the corresponding arguments.
+
+    Setup args:
+        dtypes: list of frame dtypes to compile the kernels for
+        disabled: if ``True``, do not compile anything (kernels are compiled on the first call)
+
+    Variables:
+        - ``status``: dictionary ``{name: status}`` with the status of each group of kernels: ``"pending"``, ``"compiling"``, ``"ready"``, ``"failed"``, or ``"unavailable"`` (numba is not installed)
+        - ``progress``: dictionary ``{name: (compiled, total)}`` with the number of compiled signatures
+
+    Commands:
+        - ``add_kernels``: add a group of kernels for compilation
+    """
+    def setup_task(self, dtypes=("u2","u1","f4","f8"), disabled=False):
+        self.dtypes=list(dtypes)
+        self.disabled=disabled or nb is None
+        self.queue=[]
+        self.v["status"]={}
+        self.v["progress"]={}
+        self.add_command("add_kernels")
+        self.add_job("compile_next",self.compile_next,0.05)
+    def finalize_task(self):
+        for _,kernel,sig in self.queue:
+            _pending.get(kernel,set()).discard(sig)
+
+    def _set_status(self, name, status):
+        self.v["status",name]=status
+        self.send_multicast(tag="jit/status",value=(name,status))
+    def add_kernels(self, name, kernels):
+        """
+        Add a named group of kernels for compilation.
+
+        `kernels` is either a list of tuples ``(kernel, make_signature)``, or a function returning such list
+        (it is called in this thread, so it can import the module containing the kernels).
+        """
+        if self.disabled:
+            self._set_status(name,"unavailable")
+            return
+        try:
+            if callable(kernels):
+                kernels=kernels()
+            signatures=[(kernel,make_signature(buffer)) for kernel,make_signature in kernels for buffer in get_buffer_types(self.dtypes)]
+        except Exception:  # pylint: disable=broad-except
+            self._set_status(name,"failed")
+            raise
+        signatures=[(kernel,sig) for kernel,sig in signatures if sig not in kernel.overloads]
+        for kernel,sig in signatures:
+            _pending.setdefault(kernel,set()).add(sig)
+            self.queue.append((name,kernel,sig))
+        self.v["progress",name]=(0,len(signatures))
+        self._set_status(name,"pending" if signatures else "ready")
+    def compile_next(self):
+        """Compile the next signature in the queue"""
+        if not self.queue:
+            return
+        name,kernel,sig=self.queue.pop(0)
+        if self.v["status",name]=="pending":
+            self._set_status(name,"compiling")
+        try:
+            kernel.compile(sig)
+        except Exception:  # pylint: disable=broad-except
+            self._set_status(name,"failed")
+        finally:
+            _pending[kernel].discard(sig)
+        compiled,total=self.v["progress",name]
+        self.v["progress",name]=(compiled+1,total)
+        if compiled+1==total and self.v["status",name]=="compiling":
+            self._set_status(name,"ready")
@@ -2,7 +2,9 @@ from pylablib.core.thread import controller
 from pylablib.core.utils import dictionary
 
 import threading
+import time
 import gc
+import collections
 
 
 class SettingsManager(controller.QTaskThread):
@@ -11,56 +13,175 @@ class SettingsManager(controller.QTaskThread):
     
     Keeps track of all the settings sources (each settings source can add more of them),
     usually in order to save them when the data is being saved.
+    Sources and settings can be added to a scope (e.g., the name of the camera, if several cameras run in the same process);
+    scoped entries are only included in the settings requested with the same scope, in addition to the global (unscoped) entries.
     """
     def setup_task(self):
         self.sources={}
         self.settings={}
+        self.scopes={}
         self.add_command("add_source")
         self.add_command("update_settings")
         self.add_command("get_all_settings")
 
-    def add_source(self, name, func):
+    def _get_scope(self, scope):
+        if scope is None:
+            return self.sources,self.settings
+        return self.scopes.setdefault(scope,({},{}))
+    def add_source(self, name, func, scope=None):
         """Add settings source as a function (called when settings values are requested)"""
-        self.sources[name]=func
-    def update_settings(self, name, settings):
+        self._get_scope(scope)[0][name]=func
+    def update_settings(self, name, settings, scope=None):
         """Add settings values directly"""
-        self.settings[name]=settings
+        self._get_scope(scope)[1][name]=settings
     
-    def get_all_settings(self, include=None, exclude=None, alias=None):
+    def get_all_settings(self, include=None, exclude=None, alias=None, scope=None):
         """
         Get all settings values
         
         If `include` is not ``None``, it specifies a list of setting sources to include (by default, all sources).
         If `exclude` is not ``None``, it specifies a list of setting sources to exclude (by default, none are excluded).
         If `alias` is not ``None``, specifies aliases (i.e., different names in the resulting dictionary) for settings nodes.
+        If `scope` is not ``None``, the sources and settings of this scope are included along with the global ones (and take priority over them).
         """
         settings=dictionary.Dictionary()
         alias=alias or {}
-        for s in self.sources:
+        sources,values=dict(self.sources),dict(self.settings)
+        if scope is not None:
+            scope_sources,scope_values=self._get_scope(scope)
+            sources.update(scope_sources)
+            values.update(scope_values)
+        for s in sources:
             if ((include is None) or (s in include)) and ((exclude is None) or (s not in exclude)):
-                sett=self.sources[s]()
+                sett=sources[s]()
                 settings.update({alias.get(s,s):sett})
-        for s in self.settings:
+        for s in values:
             if ((include is None) or (s in include)) and ((exclude is None) or (s not in exclude)) and (s not in settings):
-                sett=self.settings[s]
+                sett=values[s]
                 settings.update({alias.get(s,s):sett})
         return settings
 
 
 
 class GarbageCollector(controller.QTaskThread):
-    def setup_task(self, disabled=False):
+    """
+    Garbage collector thread.
+
+    Periodically runs the garbage collection with a policy which depends on the acquisition state.
+    With the ``"full"`` policy mode, the full collection is always performed.
+    With the ``"adaptive"`` mode (default), the full collection is only performed when the camera is not acquiring;
+    during the acquisition only the younger generations are collected (which is much faster, since they do not include the long-lived frame messages),
+    while the full collections are deferred to the idle windows, when the saving queue is empty.
+    If no such window appears, the full collection is still performed after ``max_full_delay`` seconds.
+
+    Setup args:
+        disabled: if ``True``, the collection is disabled and can not be enabled later
+        camera: name of the camera thread, whose acquisition status is checked (if ``None``, assume that the acquisition is always running);
+            can also be a list of names, in which case the acquisition is running if any of the cameras is acquiring
+        saver: name of the saver thread, whose queue is checked for idle windows (if ``None``, never consider the acquisition idle);
+            can also be a list of names, in which case all of the queues must be empty
+        policy: dictionary with the collection policy parameters:
+            ``mode`` (``"adaptive"`` or ``"full"``), ``period`` (collection period in seconds),
+            ``acquisition_generation`` (oldest generation collected during the acquisition),
+            ``full_period`` (minimal time between full collections in idle windows during acquisition),
+            ``max_full_delay`` (maximal time between full collections during acquisition; ``None`` means no limit),
+            and ``freeze`` (if ``True``, move all objects surviving the first full collection to the permanent generation, so that they are not checked later)
+
+    Variables:
+        - ``enabled``: whether the collection is enabled
+        - ``pause``: collection pause statistics: ``"last"`` and ``"max"`` (longest pause since the last reset) pause duration in seconds,
+          total ``"time"`` spent in the collections, ``"count"`` of collections for each generation (includes the automatic collections in all threads),
+          and the list of ``"recent"`` pause durations (up to :attr:`pause_history_size` last collections), which lets the readers find the longest pause since their last check
+
+    Commands:
+        - ``setup``: change the collection period or enable/disable the collection (possibly on behalf of a given source, e.g., a saver thread)
+        - ``reset_pause_max``: reset the maximal pause duration
+    """
+    default_policy={"mode":"adaptive","period":2.,"acquisition_generation":1,"full_period":10.,"max_full_delay":60.,"freeze":True}
+    pause_history_size=256
+    def setup_task(self, disabled=False, camera=None, saver=None, policy=None):
         self.disabled=disabled
+        self.camera=[camera] if isinstance(camera,str) else camera
+        self.saver=[saver] if isinstance(saver,str) else saver
+        self.policy=dict(self.default_policy,**(policy or {}))
+        self._enabled=True
+        self._disabled_sources=set()
         self.v["enabled"]=not self.disabled
-        self.add_job("garbage_collect",self.garbage_collect,2)
+        self._frozen=False
+        self._last_full=time.time()
+        self._pause_start=None
+        self._pause=[0.,0.,0.]  # last, max, total
+        self._pause_count=[0,0,0]
+        self._pause_history=collections.deque(maxlen=self.pause_history_size)
+        self._update_pause()
+        gc.callbacks.append(self._on_gc_event)
+        self.add_command("setup")
+        self.add_command("reset_pause_max")
+        self.add_job("garbage_collect",self.garbage_collect,self.policy["period"])
+    def finalize_task(self):
+        if self._on_gc_event in gc.callbacks:
+            gc.callbacks.remove(self._on_gc_event)
+    def _on_gc_event(self, phase, info):
+        # called in whichever thread triggered the collection, possibly while it holds some locks, so only update plain attributes here
+        if phase=="start":
+            self._pause_start=time.perf_counter()
+        elif self._pause_start is not None:
+            dt=time.perf_counter()-self._pause_start
+            self._pause_start=None
+            self._pause=[dt,max(self._pause[1],dt),self._pause[2]+dt]
+            self._pause_count[info["generation"]]+=1
+            self._pause_history.append(dt)
+    def _update_pause(self):
+        self.v["pause"]={"last":self._pause[0],"max":self._pause[1],"time":self._pause[2],"count":list(self._pause_count),"recent":list(self._pause_history)}
+    def _get_thread_variable(self, name, path):
+        if name is None:
+            return None
+        try:
+            return controller.get_controller(name,sync=False).v[path]
+        except (controller.threadprop.NoControllerThreadError,KeyError):
+            return None
+    def _select_generation(self):
+        if self.policy["mode"]=="full" or (self.camera is not None and all(self._get_thread_variable(c,"status/acquisition")!="acquiring" for c in self.camera)):
+            return 2
+        since_full=time.time()-self._last_full
+        max_full_delay=self.policy["max_full_delay"]
+        if max_full_delay is not None and since_full>=max_full_delay:
+            return 2
+        if since_full>=self.policy["full_period"] and self.saver is not None and all(self._get_thread_variable(s,"queue_ram")==0 for s in self.saver):
+            return 2
+        return self.policy["acquisition_generation"]
     def garbage_collect(self):
+        """Perform the garbage collection according to the policy"""
         if self.v["enabled"]:
-            gc.collect()
-    def setup(self, period=None, enabled=None):
+            generation=2 if self.policy["freeze"] and not self._frozen else self._select_generation()
+            gc.collect(generation)
+            if generation==2:
+                self._last_full=time.time()
+                if self.policy["freeze"] and not self._frozen:
+                    gc.freeze()
+                    self._frozen=True
+        self._update_pause()
+    def setup(self, period=None, enabled=None, source=None):
+        """
+        Change the collection period and enable or disable the collection.
+
+        If `source` is not ``None``, the collection is enabled or disabled on behalf of this source,
+        and it stays disabled until all sources which disabled it enable it again.
+        """
         if period is not None:
             self.change_job_period("garbage_collect",period)
         if enabled is not None:
-            self.v["enabled"]=enabled and not self.disabled
+            if source is None:
+                self._enabled=enabled
+            elif enabled:
+                self._disabled_sources.discard(source)
+            else:
+                self._disabled_sources.add(source)
+            self.v["enabled"]=self._enabled and not self._disabled_sources and not self.disabled
+    def reset_pause_max(self):
+        """Reset the maximal collection pause duration"""
+        self._pause[1]=0.
+        self._update_pause()
 
 
 
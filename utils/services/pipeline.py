@@ -0,0 +1,112 @@
+from .framestream import FrameProcessorThread, FrameBinningThread, FrameSlowdownThread, ChannelAccumulator, FrameSaveThread
+from .misc import SettingsManager, ResourceManager, GarbageCollector
+from .instrumentation import add_stage_resource
+from .framepool import frame_pool
+from .jit import JITWarmupThread
+
+from pylablib.core.thread import controller
+from pylablib.core.utils import dictionary
+
+
+
+default_thread_names={"camera":"camera","processor":"frame_process","preprocessor":"frame_preprocess","slowdown":"frame_slowdown",
+    "channel_accumulator":"channel_accumulator","saver":"frame_save","snap_saver":"frame_save_snap",
+    "settings_manager":"settings_manager","resource_manager":"resource_manager","garbage_collector":"garbage_collector","jit_warmup":"jit_warmup"}
+shared_threads=["settings_manager","resource_manager","garbage_collector","jit_warmup"]
+"""Threads which are shared between all cameras in the same process"""
+
+def get_thread_names(prefix=None):
+    """
+    Get the thread names dictionary for a camera pipeline.
+
+    If `prefix` is not ``None``, the names of the per-camera threads (everything except for :data:`shared_threads`) are prefixed with ``prefix+"."``,
+    so that several camera pipelines can run in the same process.
+    """
+    if prefix is None:
+        return dict(default_thread_names)
+    return {k:(n if k in shared_threads else "{}.{}".format(prefix,n)) for k,n in default_thread_names.items()}
+
+def start_shared_threads(settings, cam_descs, names=None):
+    """
+    Start the threads shared between the camera pipelines (settings and resource managers, garbage collector, and JIT warmup).
+
+    `cam_descs` is a list of descriptors of all used cameras, and `names` is the list of the corresponding thread names dictionaries
+    (by default, use :data:`default_thread_names` for all of them).
+    The garbage collection is disabled if any of the cameras does not allow it, and the collection policy is combined from all cameras.
+    """
+    names=names or [default_thread_names]*len(cam_descs)
+    frame_pool.setup(max_size=settings.get("misc/frame_pool/max_size",2**29),max_class_buffers=settings.get("misc/frame_pool/max_class_buffers",64))
+    SettingsManager(names[0]["settings_manager"]).start()
+    ResourceManager(names[0]["resource_manager"]).start()
+    cam_class_settings=[d.get_class_settings() for d in cam_descs]
+    allow_garbage_collection=all(s.get("allow_garbage_collection",True) for s in cam_class_settings)
+    gc_policy={}
+    for s in cam_class_settings:
+        gc_policy.update(s.get("garbage_collection_policy",{}))
+    gc_policy.update(dictionary.as_dict(settings.get("misc/garbage_collection",{})))
+    cameras=[n["camera"] for n in names]
+    savers=[n["saver"] for n in names]
+    GarbageCollector(names[0]["garbage_collector"],kwargs={"disabled":not allow_garbage_collection,
+        "camera":cameras[0] if len(cameras)==1 else cameras,"saver":savers[0] if len(savers)==1 else savers,"policy":gc_policy}).start()
+    JITWarmupThread(names[0]["jit_warmup"],kwargs={"dtypes":settings.get("misc/jit_warmup/dtypes",("u2","u1","f4","f8")),
+        "disabled":not settings.get("misc/jit_warmup/enabled",True)}).start()
+
+def start_camera_threads(settings, names=None, scope=None):
+    """
+    Start and partially set up auxiliary threads of a single camera pipeline (everything except for the camera thread and the shared threads).
+
+    `names` is a dictionary with the thread names (by default, use :data:`default_thread_names`).
+    `scope` is the settings manager scope of the camera (``None`` for a single camera); it is also added to the stages captions.
+    """
+    names=names or default_thread_names
+    FrameBinningThread(names["preprocessor"],kwargs={"src":names["camera"],"tag_in":"frames/new"}).start()
+    FrameSlowdownThread(names["slowdown"],kwargs={"src":names["preprocessor"],"tag_in":"frames/new"}).start()
+    FrameProcessorThread(names["processor"],kwargs={"src":names["slowdown"],"tag_in":"frames/new"}).start()
+    ChannelAccumulator(names["channel_accumulator"],kwargs={"settings":settings.get("interface/trace_plotter")}).start()
+    FrameSaveThread(names["saver"],kwargs={"src":names["preprocessor"],"tag":"frames/new","settings_mgr":names["settings_manager"],"settings_scope":scope,
+        "frame_processor":names["processor"],"garbage_collector":names["garbage_collector"]}).start()
+    FrameSaveThread(names["snap_saver"],kwargs={"src":"any","tag":"frames/new/snap","dst":names["snap_saver"],"settings_mgr":names["settings_manager"],"settings_scope":scope}).start()
+    channel_accum=controller.sync_controller(names["channel_accumulator"])
+    channel_accum.cs.add_source("raw",src=names["preprocessor"],tag="frames/new",sync=True,kind="raw")
+    channel_accum.cs.add_source("show",src=names["processor"],tag="frames/new/show",sync=True,kind="show")
+    image_saver=controller.sync_controller(names["saver"])
+    image_saver.ca.setup_queue_ram(settings.get("saving/max_queue_ram",4*2**30))
+    resource_manager=controller.sync_controller(names["resource_manager"])
+    stages=[("preprocessor","Binning"),("slowdown","Slowdown"),("processor","Processing"),("channel_accumulator","Time plot"),("saver","Saving")]
+    for order,(stage,caption) in enumerate(stages):
+        add_stage_resource(resource_manager,names[stage],caption=caption if scope is None else "{}: {}".format(scope,caption),order=order)
+
+def start_threads(settings, cam_desc, names=None):
+    """
+    Start and partially set up auxiliary threads of the frame acquisition and processing pipeline (everything except for the camera thread).
+
+    `names` is a dictionary with the thread names (by default, use :data:`default_thread_names`).
+    """
+    names=names or default_thread_names
+    start_shared_threads(settings,[cam_desc],[names])
+    start_camera_threads(settings,names)
+
+def start_camera(cam_desc, names=None, version=None, scope=None):
+    """
+    Start the camera thread and add its info to the settings manager.
+
+    `names` is a dictionary with the thread names (by default, use :data:`default_thread_names`).
+    If `version` is specified, it is also added to the settings as the software version.
+    `scope` is the settings manager scope of the camera (``None`` for a single camera).
+    Return the camera thread controller.
+    """
+    names=names or default_thread_names
+    cam_ctl=cam_desc.make_thread(names["camera"])
+    cam_ctl.start()
+    settings_ctl=controller.sync_controller(names["settings_manager"])
+    if version is not None:
+        settings_ctl.ca.update_settings("software/version",version)
+    settings_ctl.ca.add_source("cam",cam_ctl.cs.get_full_info,scope=scope)
+    settings_ctl.ca.add_source("cam/settings",cam_ctl.cs.get_settings,scope=scope)
+    def get_cam_counters():
+        counters=cam_ctl.v["frames"]
+        if "last_frame" in counters:
+            del counters["last_frame"]
+        return counters
+    settings_ctl.ca.add_source("cam/cnt",get_cam_counters,scope=scope)
+    return cam_ctl
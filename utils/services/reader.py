@@ -0,0 +1,392 @@
+"""
+Reader for the datasets saved by the frame saver.
+
+Opens the saved frames (raw, split raw, cam, tiff, or bigtiff) as a lazily indexed sequence, where only the requested frames are read from the disk,
+and joins them with the saved settings, frame info, and event log.
+"""
+
+from pylablib.core.fileio import loadfile
+from pylablib.core.utils import dictionary, string as string_utils
+
+from . import saving
+
+import os
+import mmap
+import struct
+import imageio
+import numpy as np
+
+
+
+def get_saved_frames_files(path, path_kind="pfx"):
+    """Get the list of saved frames files (either a single file, or several split files) for the given saving path"""
+    main_path=saving.build_path(path,path_kind=path_kind)
+    if os.path.exists(main_path):
+        return [main_path]
+    files=[]
+    while os.path.exists(saving.build_path(path,path_kind=path_kind,idx=len(files))):
+        files.append(saving.build_path(path,path_kind=path_kind,idx=len(files)))
+    return files
+def load_saved_settings(path, path_kind="pfx"):
+    """Load settings saved along with the frames, or return an empty dictionary if there are none"""
+    settings_path=saving.build_path(path,path_kind=path_kind,subpath="settings",ext="dat")
+    if os.path.exists(settings_path):
+        return loadfile.load_dict(settings_path)
+    return dictionary.Dictionary()
+def get_saved_format(path, settings):
+    """Get the saved frames format based on the saved settings or on the path extension"""
+    if "save/format" in settings:
+        return settings["save/format"]
+    ext=os.path.splitext(path)[1].lower()
+    return {".cam":"cam",".tif":"tiff",".tiff":"tiff",".btf":"bigtiff"}.get(ext,"raw")
+
+
+
+_tiff_types={1:"u1",2:"u1",3:"u2",4:"u4",5:"u4",6:"i1",7:"u1",8:"i2",9:"i4",10:"i4",11:"f4",12:"f8",16:"u8",17:"i8",18:"u8"}
+_tiff_type_counts={5:2,10:2}  # rational types take 2 values per entry
+_tiff_sample_kinds={1:"u",2:"i",3:"f"}
+def _read_tiff_tag(mm, bo, entry, big):
+    code,kind=struct.unpack_from(bo+"HH",mm,entry)
+    count=struct.unpack_from(bo+("Q" if big else "I"),mm,entry+4)[0]
+    if kind not in _tiff_types:
+        return code,None
+    dtype=np.dtype(_tiff_types[kind]).newbyteorder(bo)
+    n=count*_tiff_type_counts.get(kind,1)
+    voff=entry+(12 if big else 8)
+    if n*dtype.itemsize>(8 if big else 4):
+        voff=struct.unpack_from(bo+("Q" if big else "I"),mm,voff)[0]
+    return code,np.frombuffer(mm,dtype=dtype,count=n,offset=voff)
+def _get_tiff_page_layout(tags, bo):
+    """Get tuple ``(offset, shape, dtype)`` for an uncompressed page stored in a single contiguous block, or ``None`` for any other page"""
+    def get(code, default=None):
+        return tags[code] if code in tags else default
+    if get(259,[1])[0]!=1 or 273 not in tags or 322 in tags or get(284,[1])[0]!=1:
+        return None
+    width,height=int(get(256)[0]),int(get(257)[0])
+    spp=int(get(277,[1])[0])
+    bits=set(get(258,[1]))
+    kinds=set(get(339,[1]))
+    if len(bits)!=1 or len(kinds)!=1 or list(bits)[0]%8 or list(kinds)[0] not in _tiff_sample_kinds:
+        return None
+    dtype=np.dtype("{}{}".format(_tiff_sample_kinds[list(kinds)[0]],list(bits)[0]//8)).newbyteorder(bo)
+    offsets,counts=np.asarray(get(273),dtype="i8"),np.asarray(get(279,[0]),dtype="i8")
+    shape=(height,width)+((spp,) if spp>1 else ())
+    if len(offsets)!=len(counts) or np.any(offsets[1:]!=offsets[:-1]+counts[:-1]) or counts.sum()<np.prod(shape)*dtype.itemsize:
+        return None
+    return int(offsets[0]),shape,dtype
+
+class TiffFrames:
+    """
+    Memory-mapped frames of a tiff or bigtiff file.
+
+    The page directory is scanned once on creation (only the page headers are read), after which any frame is accessed directly.
+    If all pages are uncompressed and stored with the same spacing (which is the case for the files written by the saver), the frames are available as a strided array view;
+    otherwise, only the requested pages are read, and the compressed pages are decoded using ``imageio``.
+    Supports ``len``, and indexing and slicing similar to a 3D numpy array.
+    """
+    def __init__(self, path):
+        self.path=path
+        self.mm=None
+        self._decoded=None
+        self.pages=[]
+        self.array=None
+        self.offset=0
+        with open(path,"rb") as f:
+            if os.fstat(f.fileno()).st_size>=8:
+                self.mm=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        if self.mm is not None:
+            self._scan()
+    def _scan(self):
+        mm=self.mm
+        order=bytes(mm[:2])
+        if order not in [b"II",b"MM"]:
+            raise IOError("{} is not a tiff file".format(self.path))
+        bo="<" if order==b"II" else ">"
+        magic=struct.unpack_from(bo+"H",mm,2)[0]
+        big=magic==43
+        ifd=struct.unpack_from(bo+("Q" if big else "I"),mm,8 if big else 4)[0]
+        while ifd:
+            nent=struct.unpack_from(bo+("Q" if big else "H"),mm,ifd)[0]
+            start=ifd+(8 if big else 2)
+            esize=20 if big else 12
+            tags=dict(_read_tiff_tag(mm,bo,start+i*esize,big) for i in range(nent))
+            self.pages.append(_get_tiff_page_layout(tags,bo))
+            ifd=struct.unpack_from(bo+("Q" if big else "I"),mm,start+nent*esize)[0]
+        layouts={(p[1],p[2]) for p in self.pages if p is not None}
+        if self.pages and None not in self.pages and len(layouts)==1:
+            offsets=np.array([p[0] for p in self.pages])
+            shape,dtype=self.pages[0][1:]
+            steps=np.diff(offsets)
+            if len(offsets)==1 or (np.all(steps==steps[0]) and steps[0]>0):
+                stride=int(steps[0]) if len(offsets)>1 else int(np.prod(shape))*dtype.itemsize
+                inner=np.empty(shape,dtype=dtype).strides
+                self.offset=int(offsets[0])
+                self.array=np.ndarray(shape=(len(offsets),)+shape,dtype=dtype,buffer=self.mm,offset=int(offsets[0]),strides=(stride,)+inner)
+    def __len__(self):
+        return len(self.pages)
+    def _get_page(self, idx):
+        page=self.pages[idx]
+        if page is None:
+            if self._decoded is None:
+                self._decoded=[np.asarray(v) for v in imageio.mimread(self.path,format="tiff",memtest=False)]
+            return self._decoded[idx]
+        offset,shape,dtype=page
+        return np.ndarray(shape=shape,dtype=dtype,buffer=self.mm,offset=offset)
+    def __getitem__(self, idx):
+        if self.array is not None:
+            return self.array[idx]
+        rest=()
+        if isinstance(idx,tuple):
+            idx,rest=idx[0],idx[1:]
+        if isinstance(idx,slice):
+            frames=[self._get_page(i) for i in range(*idx.indices(len(self)))]
+            frames=np.array(frames) if frames else np.zeros((0,0,0))
+            return frames[(slice(None),)+rest]
+        if np.ndim(idx)==0:
+            return self._get_page(int(idx))[rest]
+        frames=np.array([self._get_page(i) for i in np.arange(len(self))[idx]])
+        return frames[(slice(None),)+rest]
+    @property
+    def shape(self):
+        if self.array is not None:
+            return self.array.shape
+        return (len(self),)+(self._get_page(0).shape if len(self) else (0,0))
+    @property
+    def dtype(self):
+        return self.array.dtype if self.array is not None else (self._get_page(0).dtype if len(self) else np.dtype("<u2"))
+
+def map_file(path, fmt, shape=None, dtype="<u2"):
+    """
+    Map the saved frames file into memory.
+
+    Return tuple ``(frames, mm, offset)``, where ``frames`` is a 3D array of frames (or a :class:`TiffFrames` object for tiff files),
+    ``mm`` is the underlying ``mmap`` object (``None`` if there is no single mapped array), and ``offset`` is the offset of the first frame data within ``mm``.
+    """
+    if fmt in ["tiff","bigtiff"]:
+        frames=TiffFrames(path)
+        if frames.array is not None:
+            return frames.array,frames.mm,frames.offset
+        return frames,None,0
+    size=os.path.getsize(path)
+    if fmt=="cam":
+        with open(path,"rb") as f:
+            shape=tuple(np.fromfile(f,"<u4",count=2)) if size>=8 else (0,0)
+        dtype=np.dtype([("size","<u4",2),("data","<u2",shape)])
+        offset=8
+    else:
+        if shape is None:
+            raise ValueError("frame shape is required to map a raw file")
+        dtype=np.dtype((np.dtype(dtype),tuple(shape)))
+        offset=0
+    if not size or not dtype.itemsize:
+        return np.zeros((0,)+tuple(shape),dtype="<u2" if fmt=="cam" else dtype.base),None,offset
+    with open(path,"rb") as f:
+        mm=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    frames=np.frombuffer(mm,dtype=dtype,count=size//dtype.itemsize)
+    if fmt=="cam":
+        frames=frames["data"]
+    return frames,mm,offset
+
+
+
+class FrameSequence:
+    """
+    Sequence of frames stored in several parts (e.g., split files) accessed as a single 3D array.
+
+    Only the requested frames are read from the disk.
+    Indexing and slicing work similar to a 3D numpy array: an integer index returns a single frame, and a slice or an index array returns a 3D array;
+    the following indices are applied to the frames (e.g., ``seq[10:20,:100,:100]`` returns a region of 10 frames).
+    Slices within a single memory-mapped part return array views without reading the data.
+
+    Args:
+        parts: list of the parts; each is a 3D array or an object with the same indexing (e.g., :class:`TiffFrames`)
+    """
+    def __init__(self, parts):
+        self.parts=[p for p in parts if len(p)]
+        self.starts=np.cumsum([0]+[len(p) for p in self.parts])
+    def __len__(self):
+        return int(self.starts[-1])
+    @property
+    def shape(self):
+        return (len(self),)+(tuple(self.parts[0].shape[1:]) if self.parts else ())
+    @property
+    def dtype(self):
+        return self.parts[0].dtype if self.parts else None
+    def _locate(self, idx):
+        if idx<0:
+            idx+=len(self)
+        if not 0<=idx<len(self):
+            raise IndexError("frame index {} is out of range for {} frames".format(idx,len(self)))
+        pidx=int(np.searchsorted(self.starts,idx,side="right"))-1
+        return pidx,idx-int(self.starts[pidx])
+    def get_range(self, start, stop, rest=()):
+        """Get a 3D array of frames in the range from `start` to `stop` (the following indices are given by `rest`)"""
+        parts=[]
+        for p,s in zip(self.parts,self.starts):
+            if s<stop and s+len(p)>start:
+                parts.append(p[(slice(max(start-s,0),stop-s),)+rest])
+        if not parts:
+            return np.zeros((0,)+self.shape[1:],dtype=self.dtype)[(slice(None),)+rest]
+        return parts[0] if len(parts)==1 else np.concatenate(parts,axis=0)
+    def __getitem__(self, idx):
+        rest=()
+        if isinstance(idx,tuple):
+            idx,rest=idx[0],idx[1:]
+        if isinstance(idx,slice):
+            start,stop,step=idx.indices(len(self))
+            if step==1:
+                return self.get_range(start,max(start,stop),rest)
+            idx=np.arange(start,stop,step)
+        if np.ndim(idx)==0:
+            pidx,fidx=self._locate(int(idx))
+            return self.parts[pidx][(fidx,)+rest]
+        idx=np.asarray(idx)
+        if idx.dtype==bool:
+            idx=np.nonzero(idx)[0]
+        frames=[self[(int(i),)+rest] for i in idx]
+        return np.array(frames) if frames else self.get_range(0,0,rest)
+    def __iter__(self):
+        for p in self.parts:
+            for i in range(len(p)):
+                yield p[i]
+    def iter_chunks(self, size):
+        """Iterate over 3D arrays of consecutive frames with at most `size` frames each"""
+        for start in range(0,len(self),size):
+            yield self.get_range(start,min(start+size,len(self)))
+
+
+
+def _parse_number(v):
+    try:
+        return int(v)
+    except ValueError:
+        return float(v)
+def load_frame_info(path):
+    """
+    Load the frame info table.
+
+    Return a dictionary ``{name: column}`` with numpy arrays of the column values (columns without names in the file header are called ``"col{}"``).
+    """
+    header,rows=None,[]
+    with open(path) as f:
+        for line in f:
+            line=line.strip()
+            if not line:
+                continue
+            values=line.split("\t")
+            try:
+                rows.append([_parse_number(v) for v in values])
+            except ValueError:
+                header=header or values
+    ncols=max([len(r) for r in rows],default=len(header or []))
+    rows=[r+[np.nan]*(ncols-len(r)) for r in rows]
+    header=list(header or [])+["col{}".format(i) for i in range(len(header or []),ncols)]
+    table=np.array(rows,dtype="f8").reshape((-1,ncols))
+    columns={}
+    for i,name in enumerate(header[:ncols]):
+        col=table[:,i]
+        integral=np.all(np.isfinite(col)) and np.all(col==np.round(col))
+        columns[name]=col.astype("i8") if integral and all(isinstance(r[i],int) for r in rows) else col
+    return columns
+def load_event_log(path):
+    """
+    Load the event log.
+
+    Return a list of dictionaries with ``"timestamp"``, ``"elapsed"``, ``"index"`` (camera frame index), ``"saved"`` (index of the last saved frame), and ``"message"`` keys.
+    """
+    events=[]
+    with open(path) as f:
+        for line in f:
+            values=line.rstrip("\n").split("\t",4)
+            if len(values)<5:
+                continue
+            try:
+                timestamp,elapsed,index,saved=float(values[0]),float(values[1]),int(values[2]),int(values[3])
+            except ValueError:
+                continue
+            message=string_utils.from_string(values[4])
+            events.append({"timestamp":timestamp,"elapsed":elapsed,"index":index,"saved":saved,"message":message if isinstance(message,str) else values[4]})
+    return events
+
+
+
+class SavedDataset:
+    """
+    Dataset saved by the frame saver.
+
+    The frames are memory-mapped and read only on request (see :class:`FrameSequence`); the dataset itself supports ``len``, indexing, and slicing in the same way.
+    The frame info and the event log are loaded on the first access.
+
+    Args:
+        path: saving path (same as the one used for saving, not including the file index for the split files)
+        path_kind: saving path kind (``"pfx"`` or ``"folder"``); by default, ``"folder"`` if `path` is an existing folder, and ``"pfx"`` otherwise
+
+    Attributes:
+        settings: saved settings dictionary (empty if there is no settings file)
+        format: saved frames format (``"raw"``, ``"cam"``, ``"tiff"``, or ``"bigtiff"``)
+        files: list of the frame files
+        frames: :class:`FrameSequence` with the frames
+    """
+    def __init__(self, path, path_kind=None):
+        if path_kind is None:
+            path_kind="folder" if os.path.isdir(path) else "pfx"
+        self.path=path
+        self.path_kind=path_kind
+        self.settings=load_saved_settings(path,path_kind=path_kind)
+        self.files=get_saved_frames_files(path,path_kind=path_kind)
+        if not self.files:
+            raise IOError("could not find saved frames at {}".format(path))
+        self.format=get_saved_format(self.files[0],self.settings)
+        shape=self.settings.get("save/frame/shape")
+        dtype=self.settings.get("save/frame/dtype","<u2")
+        self.frames=FrameSequence([map_file(f,self.format,shape=shape,dtype=dtype)[0] for f in self.files])
+        self._frame_info=None
+        self._frame_info_index=None
+        self._events=None
+    def __len__(self):
+        return len(self.frames)
+    def __getitem__(self, idx):
+        return self.frames[idx]
+    @property
+    def shape(self):
+        return self.frames.shape
+    @property
+    def dtype(self):
+        return self.frames.dtype
+
+    def _get_aux_path(self, subpath):
+        return saving.build_path(self.path,path_kind=self.path_kind,subpath=subpath,ext="dat")
+    @property
+    def frame_info(self):
+        """Frame info table as a dictionary ``{name: column}`` (empty if there is no frame info file)"""
+        if self._frame_info is None:
+            path=self._get_aux_path("frameinfo")
+            self._frame_info=load_frame_info(path) if os.path.exists(path) else {}
+            self._frame_info_index=None
+            if "save_index" in self._frame_info:
+                self._frame_info_index={int(v):i for i,v in enumerate(self._frame_info["save_index"])}
+        return self._frame_info
+    @property
+    def events(self):
+        """List of the event log entries (see :func:`load_event_log`; empty if there is no event log)"""
+        if self._events is None:
+            path=self._get_aux_path("eventlog")
+            self._events=load_event_log(path) if os.path.exists(path) else []
+        return self._events
+    def get_events(self, start=None, stop=None):
+        """Get the event log entries for the saved frames with indices from `start` to `stop` (by default, all entries)"""
+        return [e for e in self.events if (start is None or e["saved"]>=start) and (stop is None or e["saved"]<stop)]
+    def get_frame_info(self, idx):
+        """
+        Get the info for the frame with the given saved index.
+
+        Return a dictionary with the frame info values (``None`` if there is no info for this frame),
+        and the list of messages of the events logged at this frame under the ``"events"`` key.
+        """
+        if idx<0:
+            idx+=len(self)
+        info=self.frame_info
+        row=self._frame_info_index.get(idx) if self._frame_info_index is not None else (idx if idx<len(next(iter(info.values()),[])) else None)
+        result={n:(c[row].item() if row is not None else None) for n,c in info.items()}
+        result["events"]=[e["message"] for e in self.get_events(idx,idx+1)]
+        return result
@@ -0,0 +1,130 @@
+from pylablib.core.utils import files as file_utils, funcargparse
+from pylablib.core.fileio import location
+
+import os
+import datetime
+import re
+
+
+
+default_saving_values={"path":os.path.expanduser(os.path.join("~","Documents","frames")),"make_folder":False,"add_datetime":False,"on_name_conflict":"rename",
+    "format":"raw","batch_size":1,"limit_frames":False,"filesplit":1,"do_filesplit":False,"pretrigger_size":1,"pretrigger_enabled":False,
+    "save_settings":True,"stream_mode":"cont","default_snap_path":True,"snap_path":os.path.expanduser(os.path.join("~","Documents","frames_snapshot")),
+    "snap_make_folder":False,"snap_add_datetime":False,"snap_format":"tiff","snap_display_source":"standard"}
+"""Default values of the saving controls (same as in the saving GUI box)"""
+
+default_ext={"raw":".bin","cam":".cam","tiff":".tiff","bigtiff":".btf"}
+allowed_ext={k:[e] for k,e in default_ext.items()}
+allowed_ext["tiff"].append(".tif")
+path_gens={"pfx":"{date}_{name}","sfx":"{name}_{date}","folder":"{date}/{name}"}
+
+
+
+def build_path(base, path_kind="pfx", default_name="frames", subpath=None, idx=None, ext=None):
+    """
+    Make a data path from the base path depending on its kind.
+
+    Args:
+        base: base storage path
+        path_kind: base path kind; either ``"pfx"``(add subpath as suffix to the base name),
+            or ``"folder"`` (treat it as a folder, generate subpaths inside it)
+        default_name: default file name if ``path_kind=="folder"``
+        subpath: added as suffix if ``path_kind=="pfx"`` or defines a storage path if ``path_kind=="folder"``
+        idx: if defined, adds an index suffix to the file name
+        ext: path extension
+    """
+    funcargparse.check_parameter_range(path_kind,"path_kind",["pfx","folder"])
+    bname,bext=os.path.splitext(base)
+    idx_sfx="" if idx is None else "_{:04d}".format(idx)
+    if path_kind=="pfx":
+        loc=location.PrefixedFileSystemDataLocation(bname+idx_sfx+bext)
+    else:
+        loc=location.FolderFileSystemDataLocation(bname,default_name=default_name+idx_sfx,default_ext=bext[1:])
+    return loc.get_filesystem_path((subpath,ext))
+
+def expand_name(name, idx=None, add_datetime=False, as_folder=False, settings=None):
+    """
+    Expand the saving file name by adding the date/time and the conflict resolution index.
+
+    `settings` is the application settings dictionary, which can define the date/time format in ``interface/datetime_path``.
+    """
+    if add_datetime:
+        pathgen_kind="folder" if as_folder else "file"
+        pathgen=settings.get(("interface/datetime_path",pathgen_kind),"sfx") if settings is not None else "sfx"
+        pathgen=path_gens.get(pathgen,pathgen)
+        date=datetime.datetime.now()
+        name=pathgen.format(name=name,date=date.strftime(r"%Y%m%d_%H%M%S"),datetime=date)
+        if idx is not None:
+            name="{}_{:03d}".format(name,idx)
+    elif idx is not None:
+        name="{}{:03d}".format(name,idx)
+    return name
+
+def is_name_taken(path, ext, split=False, as_folder=False):
+    """Check if the saving path (without extension) is already used by the saved data or its auxiliary files"""
+    if as_folder:
+        return os.path.exists(os.path.join(path))
+    folder,name=os.path.split(path)
+    for sfx in ["settings.dat","frameinfo.dat","background.bin","eventlog.dat"]:
+        if os.path.exists(os.path.join(folder,"{}_{}".format(name,sfx))):
+            return True
+    if split:
+        file_filter=re.escape(name)+r"_\d+"+re.escape(ext)
+        return bool(file_utils.list_dir(folder,file_filter=file_filter).files)
+    else:
+        return os.path.exists(os.path.join(folder,name+ext))
+
+def get_snap_path(values):
+    """Get the snapshot saving path which corresponds to the main saving path"""
+    path,ext=os.path.splitext(values["path"])
+    if ext not in allowed_ext[values["format"]]:
+        path=path+ext
+    return path+"_snapshot"
+
+def build_saving_parameters(values, mode="full", resolve_path=True, settings=None):
+    """
+    Build the saving parameters dictionary from the saving controls `values`.
+
+    Also formats the saving file name (extension, prefixes, additional index).
+    `mode` can be either ``"full"`` (collect parameters for full saving), or ``"snap"`` (collect parameters for snap saving).
+    `settings` is the application settings dictionary.
+    The resulting path is not checked for validity, which should be done by the caller.
+    """
+    params={}
+    params["batch_size"]=values["batch_size"] if values["limit_frames"] else None
+    params["format"]=values["snap_format" if mode=="snap" else "format"]
+    if resolve_path:
+        use_snap_parameters=(mode=="snap" and not values["default_snap_path"])
+        add_datetime=values["snap_add_datetime" if use_snap_parameters else "add_datetime"]
+        make_folder=values["snap_make_folder" if use_snap_parameters else "make_folder"]
+        fext=default_ext[params["format"]]
+        aext=allowed_ext[params["format"]]
+        if mode=="snap":
+            path=get_snap_path(values) if values["default_snap_path"] else values["snap_path"]
+        else:
+            path=values["path"]
+        if make_folder:
+            ext=fext
+        else:
+            path,ext=os.path.splitext(path)
+            if ext not in aext:
+                path+=ext
+                ext=fext
+        folder,name=os.path.split(path)
+        if mode=="snap" or values["on_name_conflict"]=="rename":
+            idx=None
+            iname=expand_name(name,idx,add_datetime=add_datetime,as_folder=make_folder,settings=settings)
+            split=values["do_filesplit"]
+            while is_name_taken(os.path.join(folder,iname),ext,split=split,as_folder=make_folder):
+                idx=0 if idx is None else idx+1
+                iname=expand_name(name,idx,add_datetime=add_datetime,as_folder=make_folder,settings=settings)
+            name=iname
+        else:
+            name=expand_name(name)
+        params["path"]=os.path.join(folder,name+ext)
+        params["path_kind"]="folder" if make_folder else "pfx"
+    params["filesplit"]=values["filesplit"] if values["do_filesplit"] else None
+    for p in ["pretrigger_size","pretrigger_enabled","stream_mode","save_settings","snap_display_source"]:
+        params[p]=values[p]
+    params["append"]=values["on_name_conflict"]=="append" and mode=="full"
+    return params